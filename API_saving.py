@@ -1,22 +1,23 @@
-import requests
 from datetime import datetime, timedelta
+from fdsn import fetch_catalog, USGS_URL
 
 # end_date = datetime.today().date()
 # start_date = end_date - timedelta(days=30)
-def api_saving():
-    url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
-    params = {
-        "format": "csv",
-        "starttime": "2025-9-15",
-        "endtime": "2025-10-19",
-        "minlatitude": 24,
-        "maxlatitude": 46,
-        "minlongitude": 123,
-        "maxlongitude": 146,
-        "minmagnitude": 0
-    }
-    response = requests.get(url, params=params)
-    with open("JAPAN_USGS.csv", "w", encoding="utf-8") as f:
-            f.write(response.text)
+START, END = "2025-9-15", "2025-10-19"
+PARAMS = {
+    "minlatitude": 24,
+    "maxlatitude": 46,
+    "minlongitude": 123,
+    "maxlongitude": 146,
+    "minmagnitude": 0,
+    "orderby": "time",
+}
 
-api_saving()
\ No newline at end of file
+
+def api_saving(out_path="JAPAN_USGS.csv", base_url=USGS_URL, cache=None):
+    # time-tiled, concurrent and deduplicated; same columns and order as a single query
+    return fetch_catalog(START, END, out_path, params=PARAMS, base_url=base_url, cache=cache)
+
+
+if __name__ == "__main__":
+    api_saving()
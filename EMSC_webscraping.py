@@ -1,11 +1,107 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 import pandas as pd
+import requests
 import time
+from http_cache import default_cache
+
+FDSN_URL = "https://www.seismicportal.eu/fdsnws/event/1/query"
+PAGE_SIZE = 500
+COLUMNS = ["date_time_UTC", "latitude_deg", "longitude_deg", "depth_km",
+           "magnitude_value", "magnitude_type", "region"]
+# the event service spells magnitude types in lower case; the website (and our CSV) does not
+MAG_TYPES = {"m": "M", "mw": "Mw", "ml": "ML", "ms": "Ms", "mb": "mb", "md": "Md"}
+
+
+def _fetch_page(cache, url, params, offset):
+    response = cache.get(url, params={**params, "offset": offset})
+    response.raise_for_status()
+    if response.status_code == 204 or not response.text.strip():
+        return pd.DataFrame()
+    page = pd.read_csv(StringIO(response.text), sep="|", dtype=str)
+    page.columns = [c.lstrip("#").strip() for c in page.columns]
+    return page
+
+
+def _to_emsc_columns(events):
+    """Event service rows (text format) -> the JAPAN_EMSC.csv columns, formatted like the website table."""
+    if events.empty:
+        return pd.DataFrame(columns=COLUMNS)
+    time_utc = pd.to_datetime(events["Time"], utc=True, format="ISO8601")
+    mag_type = events["MagType"].fillna("")
+    return pd.DataFrame({
+        "date_time_UTC": time_utc.dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "latitude_deg": events["Latitude"].astype(float).map("{:.3f}".format),
+        "longitude_deg": events["Longitude"].astype(float).map("{:.3f}".format),
+        "depth_km": events["Depth/km"].astype(float).map("{:.0f}".format),
+        "magnitude_value": events["Magnitude"].astype(float).map("{:.1f}".format),
+        "magnitude_type": mag_type.str.lower().map(MAG_TYPES).fillna(mag_type),
+        "region": events["EventLocationName"],
+    })
+
+
+def fetch_emsc_events(datemin="2025-09-15", datemax="2025-10-19", latmin=24, latmax=46,
+                      lonmin=123, lonmax=146, workers=4, page_size=PAGE_SIZE, url=FDSN_URL, cache=None):
+    """
+    Same query as the website form (datemax inclusive), straight from the EMSC FDSN event
+    service in text format. Pages of page_size events are requested `workers` at a time
+    until a page comes back short. Returns (rows fetched, DataFrame with COLUMNS), newest first.
+    """
+    cache = cache or default_cache()
+    params = {
+        "format": "text",
+        "starttime": pd.Timestamp(datemin).strftime("%Y-%m-%dT%H:%M:%S"),
+        "endtime": (pd.Timestamp(datemax) + pd.Timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "minlatitude": latmin,
+        "maxlatitude": latmax,
+        "minlongitude": lonmin,
+        "maxlongitude": lonmax,
+        "orderby": "time",
+        "limit": page_size,
+    }
+    pages = []
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        first = 0
+        while True:
+            offsets = [1 + (first + k) * page_size for k in range(workers)]  # FDSN offsets start at 1
+            batch = list(ex.map(lambda o: _fetch_page(cache, url, params, o), offsets))
+            pages += batch
+            if any(len(p) < page_size for p in batch):
+                break
+            first += workers
+
+    pages = [p for p in pages if not p.empty]
+    if not pages:
+        return 0, pd.DataFrame(columns=COLUMNS)
+    events = pd.concat(pages, ignore_index=True)
+    fetched = len(events)
+    events = events.drop_duplicates(subset="EventID")  # pages can shift if events arrive meanwhile
+    return fetched, _to_emsc_columns(events).reset_index(drop=True)
+
+
+def webscraping_http(datemin="2025-09-15", datemax="2025-10-19", workers=4):
+    """Browserless replacement for webscraping_selenium: same columns, same output file."""
+    total_events_count, earthquakes_table = fetch_emsc_events(datemin, datemax, workers=workers)
+    extracted_events_count = len(earthquakes_table)
+    print(
+        f"A total of {extracted_events_count} records have been extracted successfully.")
+    earthquakes_table.to_csv(
+        "earthquakeDataAnalysis/JAPAN_EMSC.csv", encoding='utf-8-sig', index=False)
+    return total_events_count, extracted_events_count
+
+
+def webscraping_emsc():
+    """HTTP client first; the Selenium page walker only if the event service cannot be reached."""
+    try:
+        return webscraping_http()
+    except requests.RequestException as e:
+        print(f"EMSC event service failed ({e}); falling back to Selenium")
+        return webscraping_selenium()
 
 
 def webscraping_selenium():
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
     while True:
         try:
             driver = webdriver.Chrome()
@@ -104,4 +200,4 @@ def webscraping_selenium():
 
 
 if __name__ == "__main__":
-    webscraping_selenium()
+    webscraping_emsc()
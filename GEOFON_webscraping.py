@@ -1,149 +1,313 @@
-import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+import re
+from http_cache import default_cache
 import pandas as pd
 from datetime import datetime
 
+BASE_URL = 'https://geofon.gfz.de/eqinfo/list.php'
+ROW_CLASSES = ('flex-row row eqinfo-all evnrow', 'flex-row row eqinfo-all oddrow')
+COLUMNS = ['Magnitude', 'Region', 'DateTime_UTC', 'Depth_km', 'Latitude', 'Longitude', 'Event_ID']
+WINDOW_DAYS = 31
+DEPTH_RE = re.compile(r'(\d+)\*?$')
+
+
+def _text(pieces):
+    # same as BeautifulSoup's get_text(strip=True): every string stripped, empty ones dropped
+    return ''.join(p for p in (s.strip() for s in pieces) if p)
+
+
+class _EventRow:
+    def __init__(self, kind, event_id):
+        self.kind = kind            # 0 = evnrow, 1 = oddrow
+        self.event_id = event_id
+        self.mag = None             # list of strings inside the first span.magbox (None = no such span)
+        self.region = None          # strings inside the first <strong>
+        self.title = None           # title of the first div that has one
+        self.row_divs = 0           # div.row elements seen so far; the second one holds time and depth
+        self.time = None            # strings of the time/depth div outside span.pull-right
+        self.depth = None           # strings inside its first span.pull-right
+        self.time_all = None        # all strings of the time/depth div
+
+
+class GeofonListParser(HTMLParser):
+    """
+    Single pass over the eqinfo/list.php page. Extracts the same fields the BeautifulSoup
+    version found with find / find_all, but only keeps state for the row being read.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.has_eqlist = False
+        self.rows = []              # _EventRow, in document order
+        self._stack = []            # open tags we track: (tag, role, capture list)
+        self._links = []            # hrefs of the open <a> elements
+        self._row = None
+        self._buf = []
+        self._capture = []          # lists the current text goes to
+
+    def _flush(self):
+        if self._buf:
+            data = ''.join(self._buf)
+            self._buf = []
+            for target in self._capture:
+                target.append(data)
+
+    def _drop(self, capture):
+        # by identity: several capture lists can be equal (e.g. all still empty)
+        self._capture = [c for c in self._capture if c is not capture]
+
+    def _open(self, tag, role, capture=None):
+        self._stack.append((tag, role, capture))
+        if capture is not None:
+            self._capture.append(capture)
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ('div', 'span', 'strong', 'a'):
+            return
+        self._flush()
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        row = self._row
+        role, capture = None, None
+
+        if tag == 'a':
+            self._links.append(attrs.get('href'))
+            role = 'a'
+        elif tag == 'div' and attrs.get('id') == 'eqlist':
+            self.has_eqlist = True
+        elif tag == 'div' and row is None and ' '.join(classes) in ROW_CLASSES:
+            href = self._links[-1] if self._links else None  # nearest enclosing <a>
+            event_id = href.split('id=')[1] if href and 'id=' in href else ''
+            self._row = _EventRow(ROW_CLASSES.index(' '.join(classes)), event_id)
+            role = 'event'
+        elif row is not None:
+            if tag == 'span' and 'magbox' in classes and row.mag is None:
+                row.mag = []
+                capture = row.mag
+            elif tag == 'strong' and row.region is None:
+                row.region = []
+                capture = row.region
+            elif tag == 'span' and 'pull-right' in classes and row.time_all is not None and row.depth is None \
+                    and self._in('timerow'):
+                row.depth = []
+                capture = row.depth
+                role = 'pull-right'
+                self._drop(row.time)  # the span's text is the depth, not the time
+            elif tag == 'div':
+                if row.title is None and 'title' in attrs:
+                    row.title = attrs['title'] or ''
+                if 'row' in classes:
+                    row.row_divs += 1
+                    if row.row_divs == 2:
+                        row.time, row.time_all = [], []
+                        self._capture.append(row.time_all)
+                        capture = row.time
+                        role = 'timerow'
+        self._open(tag, role, capture)
+
+    def _in(self, role):
+        return any(r == role for _, r, _ in self._stack)
+
+    def handle_endtag(self, tag):
+        if tag not in ('div', 'span', 'strong', 'a'):
+            return
+        if not any(t == tag for t, _, _ in self._stack):
+            return  # stray end tag: ignored, like BeautifulSoup
+        self._flush()
+        while self._stack:
+            t, role, capture = self._stack.pop()
+            if capture is not None:
+                self._drop(capture)
+            if role == 'timerow':
+                self._drop(self._row.time_all)
+            elif role == 'pull-right' and self._in('timerow'):
+                self._capture.append(self._row.time)  # text after the span is time again
+            elif role == 'a':
+                self._links.pop()
+            elif role == 'event':
+                self.rows.append(self._row)
+                self._row = None
+            if t == tag:
+                break
+
+    def handle_data(self, data):
+        if self._capture:
+            self._buf.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _record(row):
+    """The CSV row for one parsed event (None when the BeautifulSoup version skipped it)."""
+    if row.mag is None:
+        return None
+    magnitude = float(_text(row.mag))
+    if row.region is None:
+        return None
+    region = _text(row.region)
+
+    latitude = None
+    longitude = None
+    if row.title:
+        try:
+            # Split by comma
+            parts = row.title.split(', ')
+            if len(parts) == 2:
+                lon_part = parts[0].replace('°E', '').replace('°W', '')
+                lat_part = parts[1].replace('°N', '').replace('°S', '')
+                longitude = float(lon_part)
+                latitude = float(lat_part)
+        except (ValueError, IndexError):
+            pass
+
+    if row.time_all is None:
+        raise IndexError('list index out of range')
+    # checking the format: "2025-10-11 14:24:22.4 (≤2 h ago) 86*"
+    depth_text = ""
+    if row.depth is not None:
+        time_text = _text(row.time).split('(')[0].strip().split('.')[0].strip()
+        depth_text = _text(row.depth).replace('*', '').strip()
+    else:
+        time_depth_text = _text(row.time_all)
+        time_text = time_depth_text.split('(')[0].strip().split('.')[0].strip()
+        depth_match = DEPTH_RE.search(time_depth_text)
+        if depth_match:
+            depth_text = depth_match.group(1)
+
+    return {
+        'Magnitude': magnitude,
+        'Region': region,
+        'DateTime_UTC': time_text,
+        'Depth_km': depth_text if depth_text else None,
+        'Latitude': latitude,
+        'Longitude': longitude,
+        'Event_ID': row.event_id
+    }
+
+
+def parse_event_list(html):
+    """
+    Parse one list.php page. Returns (has_eqlist, total_rows, records, event_ids) where
+    event_ids has one entry per event row (records only for rows that parsed).
+    """
+    parser = GeofonListParser()
+    parser.feed(html)
+    parser.close()
+
+    # the page alternates even and odd rows; keep the old even, odd, even, ... order
+    evn = [r for r in parser.rows if r.kind == 0]
+    odd = [r for r in parser.rows if r.kind == 1]
+    rows = []
+    for i in range(max(len(evn), len(odd))):
+        if i < len(evn):
+            rows.append(evn[i])
+        if i < len(odd):
+            rows.append(odd[i])
+
+    records = []
+    for row in rows:
+        try:
+            rec = _record(row)
+        except (ValueError, AttributeError, IndexError) as e:
+            print(f"Error parsing earthquake data: {e}")
+            continue
+        if rec is not None:
+            records.append(rec)
+    return parser.has_eqlist, len(rows), records, [r.event_id for r in rows]
+
+
+def _windows(datemin, datemax, days):
+    """Consecutive inclusive [start, end] date windows of at most `days` days, newest first."""
+    start, end = pd.Timestamp(datemin), pd.Timestamp(datemax)
+    out = []
+    while start <= end:
+        stop = min(start + pd.Timedelta(days=days - 1), end)
+        out.append((start, stop))
+        start = stop + pd.Timedelta(days=1)
+    return out[::-1]
+
+
+def fetch_events(datemin='2025-09-15', datemax='2025-10-19', params=None, nmax=1000, workers=4,
+                 window_days=WINDOW_DAYS, base_url=BASE_URL, cache=None):
+    """
+    Fetch [datemin, datemax] in date windows, in parallel. A window that comes back with
+    nmax rows may have been truncated, so it is split in two and fetched again until every
+    window is under the cap (a single day that still hits it is reported).
+    Returns (has_eqlist, total_events_count, DataFrame with COLUMNS), newest window first.
+    """
+    cache = cache or default_cache()
+    base = dict(params or {})
+
+    def fetch(window):
+        start, end = window
+        q = {**base, 'datemin': start.strftime('%Y-%m-%d'), 'datemax': end.strftime('%Y-%m-%d'), 'nmax': nmax}
+        response = cache.get(base_url, params=q)
+        response.raise_for_status()  # Raise an error for bad status codes
+        try:
+            html = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            html = response.text
+        return parse_event_list(html)
+
+    pending = _windows(datemin, datemax, window_days)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while pending:
+            nxt = []
+            for window, res in zip(pending, ex.map(fetch, pending)):
+                start, end = window
+                if res[1] >= nmax and end > start:
+                    mid = start + pd.Timedelta(days=(end - start).days // 2)
+                    nxt += [(mid + pd.Timedelta(days=1), end), (start, mid)]
+                    continue
+                if res[1] >= nmax:
+                    print(f"Warning: {start.date()} alone has {nmax}+ events; raise nmax to get them all")
+                results[window] = res
+            pending = nxt
+
+    has_eqlist, total, records, seen = False, 0, [], set()
+    for window in sorted(results, reverse=True):
+        window_has_list, _, window_records, event_ids = results[window]
+        has_eqlist = has_eqlist or window_has_list
+        # windows do not overlap, but keep an event listed twice only once
+        total += sum(1 for e in event_ids if not e or e not in seen)
+        for rec in window_records:
+            if rec['Event_ID'] and rec['Event_ID'] in seen:
+                continue
+            records.append(rec)
+        seen.update(e for e in event_ids if e)
+    return has_eqlist, total, pd.DataFrame(records, columns=COLUMNS if records else None)
+
 
 def fetch_earthquake_data(datemin='2025-09-15', datemax='2025-10-19', latmax=46,
-                          lonmin=123, lonmax=146, latmin=24, magmin=0, fmt='html', nmax=1000):
+                          lonmin=123, lonmax=146, latmin=24, magmin=0, fmt='html', nmax=1000,
+                          workers=4, window_days=WINDOW_DAYS):
     """
     Fetch earthquake data from GEOFON for Japan region.
+    The date range is fetched in windows of at most window_days days (split further when a
+    window reaches nmax), `workers` at a time.
     """
-    base_url = 'https://geofon.gfz.de/eqinfo/list.php'
-
     params = {
-        'datemin': datemin,
-        'datemax': datemax,
         'latmax': latmax,
         'lonmin': lonmin,
         'lonmax': lonmax,
         'latmin': latmin,
         'magmin': magmin,
         'fmt': fmt,
-        'nmax': nmax
     }
 
-    print(f"Fetching data from {base_url}...")
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()  # Raise an error for bad status codes
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    # Find the earthquake list container
-    eqlist = soup.find('div', {'id': 'eqlist'})
-    if not eqlist:
+    print(f"Fetching data from {BASE_URL}...")
+    has_eqlist, total_events_count, df = fetch_events(datemin, datemax, params, nmax, workers, window_days)
+    if not has_eqlist:
         print("No earthquake data found in the response")
         return pd.DataFrame()
 
     # Get number of events based on our filters. We need this for unittest.
-    total_events_count = len(soup.find_all('div', class_=[
-        'flex-row row eqinfo-all evnrow', 'flex-row row eqinfo-all oddrow']))
     print(f"Total events based on our filters: {total_events_count}")
 
-    earthquakes = []
-
-    # Each earthquake is in a div with class "flex-row row eqinfo-all"
-    # Find even and odd rows separately
-    evn_event_rows = soup.find_all(
-        'div', class_='flex-row row eqinfo-all evnrow')
-    odd_event_rows = soup.find_all(
-        'div', class_='flex-row row eqinfo-all oddrow')
-
-    # Create alternating sequence: first from even, then odd, then even, etc.
-    event_rows = []
-    max_length = max(len(evn_event_rows), len(odd_event_rows))
-
-    for i in range(max_length):
-        if i < len(evn_event_rows):
-            event_rows.append(evn_event_rows[i])
-        if i < len(odd_event_rows):
-            event_rows.append(odd_event_rows[i])
-
-    for row in event_rows:
-        try:
-            # Extract magnitude from the magbox span
-            mag_span = row.find('span', class_='magbox')
-            if not mag_span:
-                continue
-            magnitude = float(mag_span.get_text(strip=True))
-
-            # Extract region from the strong tag
-            region_strong = row.find('strong')
-            if not region_strong:
-                continue
-            region = region_strong.get_text(strip=True)
-
-            # Extract coordinates from the title attribute
-            region_div = row.find('div', title=True)
-            coordinates = region_div.get('title', '') if region_div else ''
-
-            latitude = None
-            longitude = None
-            if coordinates:
-                try:
-                    # Split by comma
-                    parts = coordinates.split(', ')
-                    if len(parts) == 2:
-                        lon_part = parts[0].replace('°E', '').replace('°W', '')
-                        lat_part = parts[1].replace('°N', '').replace('°S', '')
-                        longitude = float(lon_part)
-                        latitude = float(lat_part)
-                except (ValueError, IndexError):
-                    pass
-
-            # Extract time and depth from the second row
-            time_depth_row = row.find_all('div', class_='row')[1]
-            time_depth_text = time_depth_row.get_text(strip=True)
-
-            # Parse time and depth
-            # checking the format: "2025-10-11 14:24:22.4 (≤2 h ago) 86*"
-            time_text = ""
-            depth_text = ""
-
-            # Split by the pull-right span to separate time and depth
-            time_span = time_depth_row.find('span', class_='pull-right')
-            if time_span:
-                # Remove the pull-right span to get time
-                time_span.extract()
-                time_text = time_depth_row.get_text(strip=True)
-                # Clean up time text (remove relative time info)
-                time_text = str(time_text.split(
-                    '(')[0].strip().split('.')[0].strip())
-                depth_text = str(time_span.get_text(
-                    strip=True).replace('*', '').strip())
-            else:
-                # Fallback: try to extract from the full text
-                time_text = str(time_depth_text.split(
-                    '(')[0].strip().split('.')[0].strip())
-
-                import re
-                depth_match = re.search(r'(\d+)\*?$', time_depth_text)
-                if depth_match:
-                    depth_text = str(depth_match.group(1))
-
-            # Extract event ID from the parent link
-            parent_link = row.find_parent('a')
-            event_id = ""
-            if parent_link and parent_link.get('href'):
-                href = parent_link.get('href')
-                # Extract ID from URL like "event.php?id=gfz2025tydw"
-                if 'id=' in href:
-                    event_id = href.split('id=')[1]
-
-            earthquakes.append({
-                'Magnitude': magnitude,
-                'Region': region,
-                'DateTime_UTC': time_text,
-                'Depth_km': depth_text if depth_text else None,
-                'Latitude': latitude,
-                'Longitude': longitude,
-                'Event_ID': event_id
-            })
-
-        except (ValueError, AttributeError, IndexError) as e:
-            print(f"Error parsing earthquake data: {e}")
-            continue
-
-    df = pd.DataFrame(earthquakes)
     extracted_events_count = len(df)
     print(f"Successfully fetched {extracted_events_count} earthquake records")
     df.to_csv('earthquakeDataAnalysis/JAPAN_GEOFON.csv',
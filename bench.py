@@ -0,0 +1,282 @@
+"""
+Benchmarks for the pipeline hot paths on synthetic catalogs (see synth.py).
+
+  build_df            src/main.build_df on every generated CSV
+  normalize_one_csv   src/loadBroken.normalize_one_csv on the same files
+  distance_to_tokyo   utils.calculate_distance_to_tokyo on the parsed events
+  db_load             main.load_files into a scratch SQLite database (or --db-url)
+  db_load_to_sql      the same files through plain DataFrame.to_sql appends (the pre-upsert loader);
+                      the report shows db_load's rows/s relative to it
+  named_queries       every query in src/queries.sql (no result cache)
+  export              main.export_all to CSV
+
+Each benchmark runs in a fresh process, so its peak RSS is its own. Setup (reading the
+inputs it needs) happens before the timer starts. Every run is appended as one JSON line
+to outputs/bench/results.jsonl (git commit, versions, parameters, rows/s and memory per
+benchmark), and --compare prints the change against the last run with the same parameters.
+
+Usage:
+  python bench.py                                   # 100k rows over the four layouts
+  python bench.py --rows 1000000 --messiness 0.05 --compare
+  python bench.py --only build_df db_load --db-url mysql+pymysql://user:pw@host/scratch
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+import synth
+
+RESULTS_PATH = Path("outputs/bench/results.jsonl")
+QUERIES = Path(__file__).resolve().parent / "src" / "queries.sql"
+
+
+def _rss_mb() -> float:
+    """Peak RSS of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def _measure(out: dict, rows: int):
+    rss0, cpu0, t0 = _rss_mb(), time.process_time(), time.perf_counter()
+    yield
+    seconds = time.perf_counter() - t0
+    out.update(rows=rows, seconds=round(seconds, 4), cpu_seconds=round(time.process_time() - cpu0, 4),
+               rows_per_s=round(rows / seconds, 1) if seconds > 0 else None,
+               peak_rss_mb=round(_rss_mb(), 1), rss_growth_mb=round(_rss_mb() - rss0, 1))
+
+
+def _engine(ctx):
+    from engine import get_engine
+    from main import ensure_table
+    engine = get_engine(ctx["db_url"])
+    ensure_table(engine)
+    return engine
+
+
+def _loaded_engine(ctx):
+    """Engine on a database that holds the benchmark files (loads them if the table is empty)."""
+    from main import load_files
+    from sqlalchemy import text
+    engine = _engine(ctx)
+    with engine.connect() as conn:
+        empty = conn.execute(text("SELECT 1 FROM earthquakes LIMIT 1")).first() is None
+    if empty:
+        load_files(engine, ctx["files"], "earthquakes")
+    return engine
+
+
+def bench_build_df(ctx, out):
+    from main import build_df
+    rows = sum(ctx["rows_per_file"])
+    with _measure(out, rows):
+        for f in ctx["files"]:
+            build_df(f)
+
+
+def bench_normalize_one_csv(ctx, out):
+    from loadBroken import normalize_one_csv
+    rows = sum(ctx["rows_per_file"])
+    with _measure(out, rows):
+        for f in ctx["files"]:
+            normalize_one_csv(f)
+
+
+def bench_distance_to_tokyo(ctx, out):
+    from main import build_df
+    from utils import calculate_distance_to_tokyo
+    df = pd.concat([build_df(f)[["latitude", "longitude"]] for f in ctx["files"]], ignore_index=True)
+    with _measure(out, len(df)):
+        calculate_distance_to_tokyo(df)
+
+
+def bench_db_load(ctx, out):
+    from main import load_files
+    engine = _engine(ctx)
+    rows = sum(ctx["rows_per_file"])
+    with _measure(out, rows):
+        totals = load_files(engine, ctx["files"], "earthquakes")
+    out["inserted"] = totals["inserted"]
+    engine.dispose()
+
+
+def bench_db_load_to_sql(ctx, out):
+    from main import build_df
+    from event_schema import widen
+    engine = _engine(ctx)
+    rows = sum(ctx["rows_per_file"])
+    with _measure(out, rows):
+        for f in ctx["files"]:
+            df = widen(build_df(f))
+            with engine.begin() as conn:
+                df.to_sql("earthquakes", conn, if_exists="append", index=False, chunksize=1000)
+    engine.dispose()
+
+
+def bench_named_queries(ctx, out):
+    from main import parse_named_queries
+    from query_runner import run_named_queries
+    engine = _loaded_engine(ctx)
+    queries = parse_named_queries(QUERIES.read_text(encoding="utf-8"))
+    report = {}
+    with _measure(out, 0):
+        report = run_named_queries(engine, queries, Path(ctx["workdir"]) / "queries", use_cache=False)
+    rows = sum(q.get("rows", 0) for q in report["queries"])
+    out.update(rows=rows, rows_per_s=round(rows / out["seconds"], 1) if out["seconds"] > 0 else None,
+               failed=[q["name"] for q in report["queries"] if q["status"] == "failed"])
+    engine.dispose()
+
+
+def bench_export(ctx, out):
+    from main import export_all
+    from sqlalchemy import text
+    engine = _loaded_engine(ctx)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT COUNT(*) FROM earthquakes")).scalar()
+    with _measure(out, rows):
+        export_all(engine, "earthquakes", Path(ctx["workdir"]) / "export.csv")
+    engine.dispose()
+
+
+BENCHMARKS = {
+    "build_df": bench_build_df,
+    "normalize_one_csv": bench_normalize_one_csv,
+    "distance_to_tokyo": bench_distance_to_tokyo,
+    "db_load": bench_db_load,
+    "db_load_to_sql": bench_db_load_to_sql,
+    "named_queries": bench_named_queries,
+    "export": bench_export,
+}
+
+
+def _run_one(name: str, ctx: dict) -> dict:
+    out = {"name": name}
+    try:
+        BENCHMARKS[name](ctx, out)
+    except Exception as e:
+        out["error"] = f"{type(e).__name__}: {e}"
+    return out
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(rows: int = 100_000, layouts=tuple(synth.LAYOUTS), seed: int = 0, messiness: float = 0.0,
+        only=None, db_url: str = None, isolate: bool = True, results_path=RESULTS_PATH) -> dict:
+    """Generate the catalogs, run the benchmarks and append the run to results_path (None: do not store)."""
+    names = list(only or BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"unknown benchmarks {sorted(unknown)}; expected some of {list(BENCHMARKS)}")
+
+    with tempfile.TemporaryDirectory(prefix="eq_bench_") as workdir:
+        per_file = [rows // len(layouts) + (1 if i < rows % len(layouts) else 0) for i in range(len(layouts))]
+        files = []
+        for layout, n in zip(layouts, per_file):
+            # named like the real files, so loadBroken.infer_source_from_name recognises them
+            files.append(synth.write_catalog(Path(workdir) / f"JAPAN_{layout}_synth.csv", n, layout, seed, messiness))
+        ctx = {"workdir": workdir, "files": files,
+               "rows_per_file": [sum(1 for _ in open(f, "rb")) - 1 for f in files],
+               "db_url": db_url or f"sqlite:///{workdir}/bench.db"}
+
+        results = []
+        for name in names:
+            if isolate:
+                spawn = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    res = pool.submit(_run_one, name, ctx).result()
+            else:
+                res = _run_one(name, ctx)
+            results.append(res)
+
+    record = {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_commit(),
+        "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()} x{os.cpu_count()}",
+        "params": {"rows": rows, "layouts": list(layouts), "seed": seed, "messiness": messiness,
+                   "backend": (db_url or "sqlite").split(":", 1)[0]},
+        "results": results,
+    }
+    if results_path:
+        results_path = Path(results_path)
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(results_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record) + "\n")
+    return record
+
+
+def previous_run(record: dict, results_path=RESULTS_PATH):
+    """The last stored run before `record` with the same parameters (None if there is none)."""
+    try:
+        lines = Path(results_path).read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return None
+    runs = [json.loads(line) for line in lines if line.strip()]
+    if record in runs:
+        runs = runs[:len(runs) - runs[::-1].index(record) - 1]
+    same = [r for r in runs if r["params"] == record["params"]]
+    return same[-1] if same else None
+
+
+def format_report(record: dict, baseline: dict = None) -> str:
+    before = {r["name"]: r for r in (baseline or {}).get("results", [])}
+    lines = [f"{'benchmark':<20}{'rows':>12}{'seconds':>10}{'rows/s':>14}{'peak MB':>10}{'vs prev':>10}"]
+    for r in record["results"]:
+        if "error" in r:
+            lines.append(f"{r['name']:<20}  FAILED {r['error']}")
+            continue
+        prev = before.get(r["name"], {}).get("rows_per_s")
+        change = f"{r['rows_per_s'] / prev:>9.2f}x" if prev and r["rows_per_s"] else f"{'-':>10}"
+        lines.append(f"{r['name']:<20}{r['rows']:>12,}{r['seconds']:>10.3f}{r['rows_per_s'] or 0:>14,.0f}"
+                     f"{r['peak_rss_mb']:>10.1f}{change}")
+    rate = {r["name"]: r.get("rows_per_s") for r in record["results"]}
+    if rate.get("db_load") and rate.get("db_load_to_sql"):
+        # the upsert also diffs against stored rows and maintains the rollups; it used to be ~20x slower
+        lines.append(f"db_load runs at {rate['db_load'] / rate['db_load_to_sql']:.2f}x the rows/s of plain to_sql")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the pipeline hot paths on synthetic catalogs.")
+    ap.add_argument("--rows", type=int, default=100_000, help="Events in total, split over the layouts")
+    ap.add_argument("--layouts", nargs="+", default=list(synth.LAYOUTS), choices=list(synth.LAYOUTS))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--messiness", type=float, default=0.0)
+    ap.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    ap.add_argument("--db-url", default=None,
+                    help="Database for db_load/named_queries/export (default: a scratch SQLite file). "
+                         "Use an empty scratch database: rows are upserted into its `earthquakes` table")
+    ap.add_argument("--results", default=str(RESULTS_PATH), help="JSON-lines file runs are appended to")
+    ap.add_argument("--compare", action="store_true", help="Show rows/s relative to the last run with the same parameters")
+    ap.add_argument("--in-process", action="store_true", help="Do not isolate benchmarks in their own processes")
+    args = ap.parse_args()
+
+    record = run(args.rows, args.layouts, args.seed, args.messiness, args.only, args.db_url,
+                 not args.in_process, args.results)
+    baseline = previous_run(record, args.results) if args.compare else None
+    print(format_report(record, baseline))
+    print(f"[bench] appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
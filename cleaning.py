@@ -0,0 +1,99 @@
+"""
+Vectorized versions of the row-wise cleaners from Japan_data.ipynb and EMSC.ipynb.
+
+Every function takes a pandas Series (or DataFrame for count_invalid) and returns a
+Series with the same index and the same values the notebook's `.apply` version gives:
+
+  Japan_data.ipynb            cleaning.py
+  floater                 ->  parse_magnitude
+  clean_depth             ->  clean_depth
+  invalid_count (axis=1)  ->  count_invalid
+  categorize_mag          ->  categorize_mag
+  clean_region            ->  clean_region
+
+  EMSC.ipynb
+  classify_mag            ->  classify_mag
+  spot_loation            ->  spot_location
+  f (region split)        ->  region_from_place
+"""
+import numpy as np
+import pandas as pd
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4,
+    "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9
+}
+INVALID_TOKENS = ["nan", "unknown", "", "none"]
+_WORD = "|".join(NUMBER_WORDS)
+_DIGITS = {w: str(n) for w, n in NUMBER_WORDS.items()}
+
+
+def parse_magnitude(s: pd.Series) -> pd.Series:
+    """'4.8' -> 4.8, 'four.nine' / 'four point nine' -> 4.9, 'five' -> 5.0, anything else -> NaN."""
+    v = (s.astype(str).str.lower().str.strip()
+         .str.replace("point", ".", regex=False).str.replace(" ", "", regex=False))
+    out = pd.to_numeric(v, errors="coerce")
+    words = v.str.extract(rf"^({_WORD})(?:\.({_WORD}))?$")
+    left = words[0].map(_DIGITS)
+    right = words[1].map(_DIGITS)
+    worded = pd.to_numeric((left + "." + right).fillna(left), errors="coerce")
+    return out.fillna(worded).astype(float)
+
+
+def clean_depth(s: pd.Series) -> pd.Series:
+    """
+    Keep the digits and dots of a depth string, blank out values outside 0-700,
+    and convert meters / miles to km (km is the default unit). Rounded to 2 decimals.
+    """
+    v = s.astype(str).str.strip().str.lower()
+    num = pd.to_numeric(v.str.replace(r"[^0-9.]", "", regex=True), errors="coerce")
+    num = num.where(s.notna() & (num >= 0) & (num <= 700))
+
+    is_km = v.str.contains("km", regex=False) | v.str.contains("kilometer", regex=False)
+    is_m = ~is_km & v.str.contains("meter", regex=False)
+    is_mile = ~is_km & ~is_m & v.str.contains("mile", regex=False)
+    km = num.mask(is_m, num / 1000).mask(is_mile, num * 1.60934)
+    return km.round(2).astype(float)
+
+
+def count_invalid(df: pd.DataFrame, cols=("latitude", "longitude", "mag", "depth")) -> pd.Series:
+    """Per row, how many of `cols` are missing, a placeholder ('unknown', ...), non-numeric or negative."""
+    count = pd.Series(0, index=df.index)
+    for col in cols:
+        s = df[col]
+        v = s.astype(str).str.strip().str.lower()
+        num = pd.to_numeric(v, errors="coerce")
+        bad = s.isna() | v.isin(INVALID_TOKENS) | num.isna() | (num < 0)
+        count += bad.astype(int)
+    return count
+
+
+def categorize_mag(s: pd.Series) -> pd.Series:
+    """< 4 Weak, <= 6 Moderate, otherwise (including NaN) Strong."""
+    return pd.Series(np.select([s < 4, s <= 6], ["Weak", "Moderate"], "Strong"), index=s.index)
+
+
+def classify_mag(s: pd.Series) -> pd.Series:
+    """EMSC labels: < 4 weak, 4-6 moderate, otherwise (including NaN) strong."""
+    return pd.Series(np.select([s < 4, (s >= 4) & (s <= 6)], ["weak", "moderate"], "strong"), index=s.index)
+
+
+def clean_region(s: pd.Series) -> pd.Series:
+    """'Tokyo Prefecture' -> 'Tokyo', 'near Aomori, Japan' -> 'Near Aomori', 'Sendai region' -> 'Sendai'."""
+    c = (s.str.replace("Prefecture", "", regex=False)
+          .str.replace("region", "", regex=False)
+          .str.replace("central", "", regex=False))
+    split = c.str.rsplit(",", n=1)
+    drop_country = c.str.contains(",", regex=False) & split.str[-1].str.strip().str.lower().str.contains("japan", regex=False)
+    c = c.where(~drop_country.fillna(False).astype(bool), split.str[0])
+    return c.str.strip().str.title()
+
+
+def spot_location(s: pd.Series) -> pd.Series:
+    """EMSC region names without 'JAPAN' become 'outside Japan'."""
+    return s.where(s.str.contains("JAPAN", regex=False).fillna(False).astype(bool), "outside Japan")
+
+
+def region_from_place(s: pd.Series) -> pd.Series:
+    """'RYUKYU ISLANDS, JAPAN' -> 'RYUKYU ISLANDS'."""
+    return s.str.split(",", n=1).str[0]
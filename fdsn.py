@@ -0,0 +1,202 @@
+"""
+Concurrent, time-tiled FDSN event fetcher (USGS by default).
+
+The time range is split into windows that each stay under the service's result cap
+(USGS answers at most 20000 events per query): windows are sized with the /count
+endpoint and halved until they fit. A window that still has too many events at
+MIN_WINDOW (a swarm or a big aftershock sequence) is fetched in pages with the FDSN
+offset/limit parameters instead. The windows are then downloaded in parallel over
+one pooled requests.Session with retry/backoff, through the shared on-disk HTTP cache
+(http_cache.py), each response is streamed straight to a part file, and the parts are
+merged into one CSV without duplicate event ids.
+
+Usage:
+  from fdsn import fetch_catalog, JAPAN_BBOX
+  fetch_catalog("2025-09-15", "2025-10-19", "JAPAN_USGS.csv", params={**JAPAN_BBOX, "minmagnitude": 0})
+
+  python fdsn.py --start 2000-01-01 --end 2025-10-19 --out JAPAN_USGS.csv --workers 6
+"""
+import argparse
+import csv
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http_cache import default_cache, NoCache
+
+USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/"
+JAPAN_BBOX = {"minlatitude": 24, "maxlatitude": 46, "minlongitude": 123, "maxlongitude": 146}
+MAX_EVENTS = 20000               # USGS search limit per query
+FILL = 0.75                      # aim windows at this share of the limit (counts move while we fetch)
+MIN_WINDOW = pd.Timedelta(minutes=10)
+TIMEOUT = (10, 120)              # connect, read seconds
+
+_session = None
+
+
+def make_session(pool: int = 8, retries: int = 5, backoff: float = 0.5) -> requests.Session:
+    """Session with a connection pool of `pool` and exponential backoff on 429/5xx and dropped connections."""
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def get_session() -> requests.Session:
+    """Process-wide shared session (created on first use)."""
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def _fmt(t: pd.Timestamp) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+
+def count_events(session, base_url: str, start, end, params: dict, cache=None) -> int:
+    http = cache or NoCache(session)
+    r = http.get(base_url + "count", params={**params, "starttime": _fmt(start), "endtime": _fmt(end)},
+                 timeout=TIMEOUT)
+    r.raise_for_status()
+    return int(r.text.strip())
+
+
+def plan_windows(session, base_url: str, start, end, params: dict, max_events: int = MAX_EVENTS,
+                 workers: int = 4, min_window=MIN_WINDOW, cache=None):
+    """
+    Split [start, end) into (start, end, count) windows with count <= FILL * max_events.
+    A window is not split below min_window: it keeps its higher count, and fetch_catalog
+    pages through it (see page_params). Windows are counted level by level, all windows
+    of a level in parallel.
+    """
+    limit = int(max_events * FILL)
+    pending = [(pd.Timestamp(start), pd.Timestamp(end))]
+    done = []
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while pending:
+            counts = list(ex.map(lambda w: count_events(session, base_url, w[0], w[1], params, cache), pending))
+            nxt = []
+            for (s, e), n in zip(pending, counts):
+                if n > limit and e - s > min_window:
+                    mid = s + (e - s) / 2
+                    nxt += [(s, mid), (mid, e)]
+                else:
+                    done.append((s, e, n))
+            pending = nxt
+    return sorted(done)
+
+
+def page_params(params: dict, count: int, limit: int) -> list:
+    """
+    The query params that fetch a window of `count` events: `params` itself when count <= limit,
+    else one set per page of `limit` events (FDSN offset is 1-based).
+    """
+    if count <= limit:
+        return [params]
+    return [{**params, "offset": 1 + k * limit, "limit": limit} for k in range(-(-count // limit))]
+
+
+def fetch_window(session, base_url: str, start, end, params: dict, out_path: Path, cache=None) -> Path:
+    """
+    Stream one window's CSV response to out_path (an empty file when the window has no events,
+    FDSN answers 204 No Content then).
+    """
+    http = cache or NoCache(session)
+    q = {**params, "format": "csv", "starttime": _fmt(start), "endtime": _fmt(end)}
+    tmp = out_path.with_suffix(".part")
+    r = http.fetch_to_file(base_url + "query", q, tmp, timeout=TIMEOUT)
+    r.raise_for_status()
+    if r.status_code == 204 or not tmp.exists():
+        tmp.write_bytes(b"")
+    tmp.replace(out_path)
+    return out_path
+
+
+def merge_parts(parts, out_path, key: str = "id") -> int:
+    """
+    Concatenate CSV parts (same header) into out_path, keeping the first row of every `key`.
+    Rows are streamed; only the set of seen keys is kept in memory. Returns rows written.
+    """
+    seen = set()
+    written = 0
+    header = None
+    with open(out_path, "w", encoding="utf-8", newline="") as out:
+        writer = csv.writer(out, lineterminator="\n")
+        for p in parts:
+            with open(p, encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                head = next(reader, None)
+                if head is None:
+                    continue
+                if header is None:
+                    header = head
+                    writer.writerow(header)
+                k = head.index(key)
+                for row in reader:
+                    if not row or row[k] in seen:
+                        continue
+                    seen.add(row[k])
+                    writer.writerow(row)
+                    written += 1
+    return written
+
+
+def fetch_catalog(start, end, out_path, params=None, base_url: str = USGS_URL, workers: int = 4,
+                  max_events: int = MAX_EVENTS, session=None, cache=None) -> int:
+    """
+    Fetch every event in [start, end) into one CSV at out_path, newest first like a single
+    USGS query. Returns the number of events written.
+    cache  an http_cache.HTTPCache; defaults to the shared on-disk cache unless a session is given
+    """
+    params = dict(JAPAN_BBOX if params is None else params)
+    params.setdefault("orderby", "time")
+    if cache is None:
+        cache = default_cache() if session is None else NoCache(session)
+    session = session or get_session()
+    windows = plan_windows(session, base_url, start, end, params, max_events, workers, cache=cache)
+    limit = int(max_events * FILL)
+    jobs = [(w, s, e, q) for w, (s, e, n) in enumerate(windows) for q in page_params(params, n, limit)]
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="fdsn-"))
+    try:
+        def job(ij):
+            i, (_, s, e, q) = ij
+            return fetch_window(session, base_url, s, e, q, tmp_dir / f"part-{i:05d}.csv", cache)
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(job, enumerate(jobs)))
+        if params["orderby"] == "time":
+            # newest window first; the pages of one window already come newest first
+            order = sorted(range(len(jobs)), key=lambda i: (-jobs[i][0], i))
+            parts = [parts[i] for i in order]
+        return merge_parts(parts, out_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fetch an FDSN event catalog in concurrent time windows.")
+    ap.add_argument("--start", required=True)
+    ap.add_argument("--end", required=True)
+    ap.add_argument("--out", default="JAPAN_USGS.csv")
+    ap.add_argument("--url", default=USGS_URL, help=f"FDSN event service base (default: {USGS_URL})")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--min-magnitude", type=float, default=0)
+    ap.add_argument("--max-events", type=int, default=MAX_EVENTS, help="Service result cap per query")
+    args = ap.parse_args()
+
+    n = fetch_catalog(args.start, args.end, args.out, params={**JAPAN_BBOX, "minmagnitude": args.min_magnitude},
+                      base_url=args.url, workers=args.workers, max_events=args.max_events)
+    print(f"[fdsn] {n} events -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
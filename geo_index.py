@@ -0,0 +1,115 @@
+"""
+Spatial index over event coordinates for radius and nearest-event queries (NumPy only).
+
+Events are bucketed into fixed lat/lon grid cells and stored sorted by cell id, so a
+query only looks at the cells that can contain an answer and computes exact haversine
+distances for those candidates.
+
+Usage:
+  from geo_index import GridIndex
+  idx = GridIndex(df["latitude"], df["longitude"])          # build once per dataset
+  rows, km = idx.query_radius(35.6895, 139.6917, 100)        # events within 100 km
+  rows, km = idx.query_knn(35.6895, 139.6917, k=10)          # 10 nearest events
+  df.iloc[rows]
+"""
+import numpy as np
+from utils import haversine_km, EARTH_RADIUS_KM
+
+
+class GridIndex:
+    def __init__(self, lat, lon, cell_deg: float = 0.5):
+        lat = np.asarray(lat, dtype=float)
+        lon = (np.asarray(lon, dtype=float) + 180) % 360 - 180
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.ceil(180 / cell_deg))
+        self.n_cols = int(np.ceil(360 / cell_deg))
+
+        cell = self._row(lat) * self.n_cols + self._col(lon)
+        self.order = np.argsort(cell, kind="stable")
+        self.cells = cell[self.order]
+        self.lat = lat[self.order]
+        self.lon = lon[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _row(self, lat):
+        return np.clip(np.floor((lat + 90) / self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+
+    def _col(self, lon):
+        return np.clip(np.floor((lon + 180) / self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+
+    def _candidates(self, row_lo, row_hi, cols):
+        """Positions (in sorted order) of the points in rows [row_lo, row_hi] x cols."""
+        rows = np.arange(max(row_lo, 0), min(row_hi, self.n_rows - 1) + 1)
+        ids = (rows[:, None] * self.n_cols + np.asarray(cols)[None, :]).ravel()
+        start = np.searchsorted(self.cells, ids, side="left")
+        stop = np.searchsorted(self.cells, ids, side="right")
+        lengths = stop - start
+        total = int(lengths.sum())
+        # concatenated ranges start[i]:stop[i] without a Python loop
+        offsets = np.repeat(start - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total)
+
+    def _col_span(self, c0, half):
+        """Column ids c0-half .. c0+half, wrapped around the antimeridian."""
+        if 2 * half + 1 >= self.n_cols:
+            return np.arange(self.n_cols)
+        return np.arange(c0 - half, c0 + half + 1) % self.n_cols
+
+    def query_radius(self, lat: float, lon: float, radius_km: float):
+        """Original row positions of all events within radius_km, and their distances, nearest first."""
+        lon = (lon + 180) % 360 - 180
+        ang = radius_km / EARTH_RADIUS_KM
+        dlat = np.degrees(ang)
+        row_lo = int(self._row(lat - dlat))
+        row_hi = int(self._row(lat + dlat))
+        if lat + dlat >= 90 or lat - dlat <= -90 or np.sin(ang) >= np.cos(np.radians(lat)):
+            cols = np.arange(self.n_cols)  # cap reaches a pole: every longitude is possible
+        else:
+            dlon = np.degrees(np.arcsin(np.sin(ang) / np.cos(np.radians(lat))))
+            c0 = int(self._col(lon))
+            cols = self._col_span(c0, int(np.ceil(dlon / self.cell_deg)) + 1)
+
+        pos = self._candidates(row_lo, row_hi, cols)
+        dist = haversine_km(lat, lon, self.lat[pos], self.lon[pos])
+        hit = dist <= radius_km
+        pos, dist = pos[hit], dist[hit]
+        by_dist = np.argsort(dist, kind="stable")
+        return self.order[pos[by_dist]], dist[by_dist]
+
+    def query_knn(self, lat: float, lon: float, k: int = 1):
+        """Original row positions of the k nearest events, and their distances, nearest first."""
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        lon = (lon + 180) % 360 - 180
+        r0, c0 = int(self._row(lat)), int(self._col(lon))
+        ring = 0
+        while True:
+            cols = self._col_span(c0, ring)
+            pos = self._candidates(r0 - ring, r0 + ring, cols)
+            covers_all = (r0 - ring <= 0 and r0 + ring >= self.n_rows - 1 and len(cols) == self.n_cols)
+            if len(pos) >= k or covers_all:
+                dist = haversine_km(lat, lon, self.lat[pos], self.lon[pos])
+                best = np.argsort(dist, kind="stable")[:k]
+                if covers_all or dist[best[-1]] <= self._outside_bound(lat, lon, r0, c0, ring):
+                    return self.order[pos[best]], dist[best]
+            ring += 1
+
+    def _outside_bound(self, lat, lon, r0, c0, ring):
+        """Lower bound (km) on the distance from (lat, lon) to any point outside the searched cells."""
+        lat_lo = (r0 - ring) * self.cell_deg - 90
+        lat_hi = (r0 + ring + 1) * self.cell_deg - 90
+        bounds = []
+        if r0 - ring > 0:
+            bounds.append(np.radians(lat - lat_lo) * EARTH_RADIUS_KM)
+        if r0 + ring < self.n_rows - 1:
+            bounds.append(np.radians(lat_hi - lat) * EARTH_RADIUS_KM)
+        if 2 * ring + 1 < self.n_cols:
+            lon_lo = (c0 - ring) * self.cell_deg - 180
+            lon_hi = (c0 + ring + 1) * self.cell_deg - 180
+            dlon = np.radians(min(lon - lon_lo, lon_hi - lon, 90.0))
+            # distance from a point to a meridian dlon away: asin(cos(lat) * sin(dlon))
+            bounds.append(np.arcsin(np.cos(np.radians(lat)) * np.sin(dlon)) * EARTH_RADIUS_KM)
+        return min(bounds) if bounds else np.inf
@@ -0,0 +1,252 @@
+"""
+On-disk HTTP response cache shared by the USGS, GEOFON and EMSC fetchers.
+
+  key          sha256 of method + URL + normalized params (sorted, lower-cased names, None dropped)
+  freshness    per-host TTLs; queries whose time window ended more than SETTLE_DAYS ago
+               are "closed" and kept for CLOSED_TTL (catalog revisions have settled by then)
+  revalidation stale entries with an ETag / Last-Modified are re-requested conditionally;
+               a 304 refreshes the entry without downloading the body again
+  size bound   bodies live in files; the least recently used are evicted above max_bytes
+               (never the one just stored); a body larger than max_bytes is served, not kept
+
+Usage:
+  from http_cache import default_cache
+  r = default_cache().get("https://geofon.gfz.de/eqinfo/list.php", params={...})
+  r.text, r.from_cache
+
+  EARTHQUAKE_HTTP_CACHE=off python API_saving.py     # bypass the cache
+  EARTHQUAKE_HTTP_CACHE=/tmp/eqcache python ...      # use another directory
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+import pandas as pd
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_DIR = ".http_cache"
+MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL = 600
+TTLS = {                                   # seconds an open-window response stays fresh, per host
+    "earthquake.usgs.gov": 300,            # feed updates every minute; counts drift quickly
+    "geofon.gfz.de": 900,
+    "www.seismicportal.eu": 600,
+    "www.emsc-csem.org": 600,
+}
+CLOSED_TTL = 30 * 24 * 3600
+SETTLE_DAYS = 7
+END_PARAMS = ("endtime", "end", "datemax")  # FDSN / GEOFON names for the window end
+KEPT_HEADERS = ("content-type", "etag", "last-modified")
+TIMEOUT = (10, 120)
+
+
+def cache_key(url: str, params=None, method: str = "GET") -> str:
+    norm = sorted((str(k).lower(), str(v).strip()) for k, v in (params or {}).items() if v is not None)
+    raw = json.dumps([method.upper(), url, norm], separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def ttl_for(url: str, params=None) -> int:
+    """Seconds a response stays fresh: CLOSED_TTL for settled windows, otherwise the host's TTL."""
+    for name in END_PARAMS:
+        value = (params or {}).get(name)
+        if value is None:
+            continue
+        end = pd.to_datetime(value, errors="coerce", utc=True)
+        if pd.notna(end) and end < pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=SETTLE_DAYS):
+            return CLOSED_TTL
+    return TTLS.get(urlparse(url).hostname, DEFAULT_TTL)
+
+
+def _response(url, status, headers, body, from_cache) -> requests.Response:
+    r = requests.Response()
+    r.url = url
+    r.status_code = status
+    r.headers = CaseInsensitiveDict(headers)
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r._content = body
+    r.from_cache = from_cache
+    return r
+
+
+class HTTPCache:
+    def __init__(self, root=DEFAULT_DIR, max_bytes: int = MAX_BYTES, session=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._session = session
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT,
+            size INTEGER, validated REAL, last_access REAL)""")
+        self._db.commit()
+
+    @property
+    def session(self):
+        if self._session is None:
+            from fdsn import get_session
+            self._session = get_session()
+        return self._session
+
+    def _body_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.body"
+
+    def _entry(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT status, headers, validated FROM entries WHERE key=?", (key,)).fetchone()
+        if row is None or not self._body_path(key).exists():
+            return None
+        return {"status": row[0], "headers": json.loads(row[1]), "validated": row[2]}
+
+    def _touch(self, key, validated=False):
+        now = time.time()
+        with self._lock:
+            if validated:
+                self._db.execute("UPDATE entries SET last_access=?, validated=? WHERE key=?", (now, now, key))
+            else:
+                self._db.execute("UPDATE entries SET last_access=? WHERE key=?", (now, key))
+            self._db.commit()
+
+    def _store(self, key, url, status, headers, tmp: Path):
+        path = self._body_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp.replace(path)
+        kept = {k: v for k, v in headers.items() if k.lower() in KEPT_HEADERS}
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (key, url, status, json.dumps(kept), path.stat().st_size, time.time(), time.time()))
+            self._db.commit()
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._body_path(key).unlink(missing_ok=True)
+                self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+                total -= size
+            self._db.commit()
+
+    def _fetch(self, url, params, ttl, timeout):
+        """
+        Make sure the entry for (url, params) is fresh, downloading (streamed to disk) or
+        revalidating it as needed. Returns (key, entry, from_cache, body_path), or
+        (None, response, False, None) for error responses. A body over max_bytes is not
+        stored: body_path is then its download file, which the caller removes.
+        """
+        key = cache_key(url, params)
+        entry = self._entry(key)
+        ttl = ttl_for(url, params) if ttl is None else ttl
+        if entry is not None and entry["validated"] + ttl > time.time():
+            self._touch(key)
+            return key, entry, True, self._body_path(key)
+
+        headers = {}
+        if entry is not None:
+            validators = CaseInsensitiveDict(entry["headers"])
+            if "etag" in validators:
+                headers["If-None-Match"] = validators["etag"]
+            if "last-modified" in validators:
+                headers["If-Modified-Since"] = validators["last-modified"]
+
+        with self.session.get(url, params=params, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304 and entry is not None:
+                self._touch(key, validated=True)
+                return key, entry, True, self._body_path(key)
+            if r.status_code not in (200, 204):
+                r.content  # read the (small) error body before the connection is released
+                return None, r, False, None
+            tmp = self.root / f"{key}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                for block in r.iter_content(chunk_size=1 << 16):
+                    f.write(block)
+            entry = {"status": r.status_code, "headers": dict(r.headers)}
+            if tmp.stat().st_size > self.max_bytes:
+                return key, entry, False, tmp
+            self._store(key, url, r.status_code, dict(r.headers), tmp)
+            return key, entry, False, self._body_path(key)
+
+    def get(self, url: str, params=None, ttl=None, timeout=TIMEOUT) -> requests.Response:
+        """GET through the cache; the returned Response has an extra `from_cache` attribute."""
+        key, entry, hit, path = self._fetch(url, params, ttl, timeout)
+        if key is None:
+            entry.from_cache = False
+            return entry
+        try:
+            body = path.read_bytes()
+        except FileNotFoundError:  # evicted by another thread since _fetch
+            return NoCache(self.session).get(url, params, timeout=timeout)
+        finally:
+            if path != self._body_path(key):
+                path.unlink(missing_ok=True)
+        return _response(url, entry["status"], entry["headers"], body, hit)
+
+    def fetch_to_file(self, url: str, params, out_path, ttl=None, timeout=TIMEOUT) -> requests.Response:
+        """Like get(), but copies the body to out_path on disk instead of loading it into memory."""
+        key, entry, hit, path = self._fetch(url, params, ttl, timeout)
+        if key is None:
+            entry.from_cache = False
+            return entry
+        try:
+            if path != self._body_path(key):
+                shutil.move(path, out_path)
+            else:
+                shutil.copyfile(path, out_path)
+        except FileNotFoundError:  # evicted by another thread since _fetch
+            return NoCache(self.session).fetch_to_file(url, params, out_path, timeout=timeout)
+        return _response(url, entry["status"], entry["headers"], None, hit)
+
+    def clear(self):
+        with self._lock:
+            for (key,) in self._db.execute("SELECT key FROM entries").fetchall():
+                self._body_path(key).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+
+class NoCache:
+    """Same interface, straight to the network (EARTHQUAKE_HTTP_CACHE=off)."""
+
+    def __init__(self, session=None):
+        self._session = session
+
+    session = HTTPCache.session
+
+    def get(self, url, params=None, ttl=None, timeout=TIMEOUT):
+        r = self.session.get(url, params=params, timeout=timeout)
+        r.from_cache = False
+        return r
+
+    def fetch_to_file(self, url, params, out_path, ttl=None, timeout=TIMEOUT):
+        with self.session.get(url, params=params, stream=True, timeout=timeout) as r:
+            if r.status_code in (200, 204):
+                with open(out_path, "wb") as f:
+                    for block in r.iter_content(chunk_size=1 << 16):
+                        f.write(block)
+            r.from_cache = False
+            return r
+
+
+_default = None
+
+
+def default_cache():
+    """Process-wide cache configured by EARTHQUAKE_HTTP_CACHE (a directory, or 'off')."""
+    global _default
+    if _default is None:
+        setting = os.environ.get("EARTHQUAKE_HTTP_CACHE", DEFAULT_DIR)
+        _default = NoCache() if setting.lower() in ("off", "0", "none", "") else HTTPCache(setting)
+    return _default
@@ -0,0 +1,172 @@
+"""
+Link the same physical earthquake across sources (USGS, EMSC, GEOFON).
+
+Events are sorted by time once; every event is only compared with the events that follow
+it within the time tolerance (found with searchsorted), and those candidate pairs are
+kept if they come from different sources and lie within the distance tolerance. Pairs are
+then merged greedily, closest first, with a union-find that allows at most one event per
+source in a group and only joins two groups when every cross pair is within both
+tolerances (no chaining A~B~C with A and C too far apart). Every group gets a shared
+`event_id`.
+
+Usage:
+  import matching
+  linked = matching.match_events(df, time_tol_s=30, dist_km=100)   # adds event_id
+  matching.coverage(linked)                                        # per-source coverage
+  matching.residuals(linked, reference="USGS")                     # dt / location / magnitude residuals
+  matching.residual_summary(linked)
+
+  python matching.py --input outputs/earthquakes_export.csv --out outputs/matched_events.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from utils import haversine_km
+
+TIME_TOL_S = 30
+DIST_KM = 100
+
+
+def candidate_pairs(time_s: np.ndarray, lat: np.ndarray, lon: np.ndarray, src: np.ndarray,
+                    time_tol_s: float = TIME_TOL_S, dist_km: float = DIST_KM):
+    """
+    Pairs (i, j) of positions in time-sorted arrays with |t_i - t_j| <= time_tol_s, different
+    sources and distance <= dist_km. Returns i, j, dt (s), distance (km).
+    """
+    n = len(time_s)
+    stop = np.searchsorted(time_s, time_s + time_tol_s, side="right")
+    lengths = stop - np.arange(n) - 1  # followers of each event inside the window
+    lengths = np.maximum(lengths, 0)
+    i = np.repeat(np.arange(n), lengths)
+    # j runs over i+1 .. stop-1 for every i, without a Python loop
+    j = i + 1 + (np.arange(len(i)) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+
+    keep = src[i] != src[j]
+    i, j = i[keep], j[keep]
+    dist = haversine_km(lat[i], lon[i], lat[j], lon[j])
+    keep = dist <= dist_km
+    i, j, dist = i[keep], j[keep], dist[keep]
+    return i, j, time_s[j] - time_s[i], dist
+
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def _within(ga, gb, time_s, lat, lon, time_tol_s, dist_km) -> bool:
+    """True if every event of group ga is within both tolerances of every event of gb."""
+    a, b = np.repeat(ga, len(gb)), np.tile(gb, len(ga))
+    return bool((np.abs(time_s[a] - time_s[b]) <= time_tol_s).all()
+                and (haversine_km(lat[a], lon[a], lat[b], lon[b]) <= dist_km).all())
+
+
+def match_events(df: pd.DataFrame, time_tol_s: float = TIME_TOL_S, dist_km: float = DIST_KM) -> pd.DataFrame:
+    """
+    Return a copy of df (needs source, time, latitude, longitude) with an `event_id` column:
+    rows that describe the same earthquake in different sources share one id. Ids are
+    numbered 1.. in time order; unmatched rows get their own id.
+    """
+    out = df.copy()
+    if out.empty:
+        out["event_id"] = pd.Series(dtype="int64")
+        return out
+
+    time = pd.to_datetime(out["time"])
+    order = np.argsort(time.to_numpy(), kind="stable")
+    time_s = time.to_numpy()[order].astype("datetime64[ns]").astype(np.int64) / 1e9
+    lat = out["latitude"].to_numpy(dtype=float)[order]
+    lon = out["longitude"].to_numpy(dtype=float)[order]
+    codes, names = pd.factorize(out["source"].to_numpy()[order])
+
+    i, j, dt, dist = candidate_pairs(time_s, lat, lon, codes, time_tol_s, dist_km)
+    # closest pairs first: distance and time offset, each relative to its tolerance
+    score = dist / dist_km + np.abs(dt) / max(time_tol_s, 1e-9)
+    by_score = np.argsort(score, kind="stable")
+
+    n = len(order)
+    parent = list(range(n))
+    mask = [1 << c for c in codes.tolist()]  # sources present in each group, as a bitmask
+    members = {}                             # root -> positions, for groups of 2+ events
+    for a, b in zip(i[by_score].tolist(), j[by_score].tolist()):
+        ra, rb = _find(parent, a), _find(parent, b)
+        if ra == rb or mask[ra] & mask[rb]:
+            continue
+        ga, gb = members.get(ra, [ra]), members.get(rb, [rb])
+        if len(ga) + len(gb) > 2 and not _within(ga, gb, time_s, lat, lon, time_tol_s, dist_km):
+            continue
+        if ra > rb:
+            ra, rb, ga, gb = rb, ra, gb, ga
+        parent[rb] = ra  # the earlier event stays root, so ids follow time order
+        mask[ra] |= mask[rb]
+        members[ra] = ga + gb
+        members.pop(rb, None)
+
+    roots = np.array([_find(parent, x) for x in range(n)])
+    event_id = np.empty(n, dtype=np.int64)
+    event_id[order] = np.unique(roots, return_inverse=True)[1] + 1
+    out["event_id"] = event_id
+    return out
+
+
+def coverage(linked: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per source: its event count, how many of them were matched to another source, and the
+    share of all distinct earthquakes (event ids) that the source reported.
+    """
+    group_size = linked.groupby("event_id")["source"].transform("size")
+    total = linked["event_id"].nunique()
+    rep = linked.assign(matched=group_size > 1).groupby("source").agg(
+        events=("event_id", "size"), matched=("matched", "sum"), event_ids=("event_id", "nunique"))
+    rep["matched_share"] = (rep["matched"] / rep["events"]).round(3)
+    rep["coverage"] = (rep["event_ids"] / total).round(3) if total else 0.0
+    return rep.drop(columns="event_ids").reset_index()
+
+
+def residuals(linked: pd.DataFrame, reference: str = "USGS") -> pd.DataFrame:
+    """
+    Every other-source event that was matched to a `reference` event, with its offsets from it:
+    dt_s (other - reference), dist_km, dmag, ddepth_km.
+    """
+    ref = linked[linked["source"] == reference]
+    other = linked[(linked["source"] != reference) & linked["event_id"].isin(ref["event_id"])]
+    m = other.merge(ref, on="event_id", suffixes=("", "_ref"))
+    return pd.DataFrame({
+        "event_id": m["event_id"],
+        "source": m["source"],
+        "dt_s": (pd.to_datetime(m["time"]) - pd.to_datetime(m["time_ref"])).dt.total_seconds(),
+        "dist_km": haversine_km(m["latitude_ref"], m["longitude_ref"], m["latitude"], m["longitude"]).round(2),
+        "dmag": (m["magnitude"] - m["magnitude_ref"]).round(2),
+        "ddepth_km": (m["depth"] - m["depth_ref"]).round(2),
+    })
+
+
+def residual_summary(linked: pd.DataFrame, reference: str = "USGS") -> pd.DataFrame:
+    """Mean / median / std of the residuals per source against `reference`."""
+    r = residuals(linked, reference)
+    cols = ["dt_s", "dist_km", "dmag", "ddepth_km"]
+    return r.groupby("source")[cols].agg(["count", "mean", "median", "std"]).round(3)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Match the same earthquakes across sources.")
+    ap.add_argument("--input", default="outputs/earthquakes_export.csv",
+                    help="CSV with source, time, latitude, longitude, depth, magnitude (e.g. the DB export)")
+    ap.add_argument("--out", default="outputs/matched_events.csv")
+    ap.add_argument("--time-tol", type=float, default=TIME_TOL_S, help=f"Seconds (default: {TIME_TOL_S})")
+    ap.add_argument("--dist-km", type=float, default=DIST_KM, help=f"Kilometers (default: {DIST_KM})")
+    ap.add_argument("--reference", default="USGS", help="Source the residuals are measured against")
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.input, parse_dates=["time"])
+    linked = match_events(df, args.time_tol, args.dist_km)
+    linked.to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(f"[match] {len(linked)} rows -> {linked['event_id'].nunique()} events -> {args.out}")
+    print(coverage(linked).to_string(index=False))
+    print(residual_summary(linked, args.reference).to_string())
+
+
+if __name__ == "__main__":
+    main()
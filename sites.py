@@ -0,0 +1,122 @@
+"""
+Distances from every event to many sites (prefectural capitals, plants, stations, ...).
+
+Generalizes utils.calculate_distance_to_tokyo to a table of sites. The events x sites
+haversine matrix is computed in row chunks sized to a memory budget, and each chunk is
+reduced right away, so the full dense matrix is never built for large inputs.
+
+Usage:
+  import pandas as pd, sites
+  site_df = pd.DataFrame({"name": ["Tokyo", "Sendai"], "latitude": [35.6895, 38.2682], "longitude": [139.6917, 140.8694]})
+  near = sites.nearest_site(events, site_df)                # -> nearest_site, nearest_site_km per event
+  close = sites.sites_within(events, site_df, max_km=100)   # -> event, site, km (long format)
+  dense = sites.distance_to_sites(events, site_df)          # -> events x sites matrix (small inputs)
+
+  python sites.py --sites sites.csv --events outputs/earthquakes_export.csv --out outputs/nearest_site.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from utils import EARTH_RADIUS_KM
+
+MEMORY_BUDGET_MB = 256
+
+
+def _chunk_rows(n_sites: int, dtype, budget_mb: float) -> int:
+    # a handful of (rows x sites) temporaries are alive at once inside _block
+    per_row = max(n_sites, 1) * np.dtype(dtype).itemsize * 6
+    return max(1, int(budget_mb * 1024 * 1024 // per_row))
+
+
+def _prepare(lat, lon, dtype):
+    lat = np.radians(np.asarray(lat, dtype=np.float64)).astype(dtype)
+    lon = np.radians(np.asarray(lon, dtype=np.float64)).astype(dtype)
+    return lat, lon, np.cos(lat)
+
+
+def _block(ev, st, rows: slice):
+    """Haversine km for events[rows] x all sites, in the prepared dtype."""
+    lat1, lon1, cos1 = ev[0][rows, None], ev[1][rows, None], ev[2][rows, None]
+    lat2, lon2, cos2 = st[0][None, :], st[1][None, :], st[2][None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * np.sin((lon2 - lon1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM) * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def iter_distance_blocks(events: pd.DataFrame, sites: pd.DataFrame, dtype="float64",
+                         budget_mb: float = MEMORY_BUDGET_MB):
+    """Yield (row_slice, block) where block[i, j] is the km from events row i to sites row j."""
+    ev = _prepare(events["latitude"], events["longitude"], dtype)
+    st = _prepare(sites["latitude"], sites["longitude"], dtype)
+    step = _chunk_rows(len(sites), dtype, budget_mb)
+    for start in range(0, len(events), step):
+        rows = slice(start, min(start + step, len(events)))
+        yield rows, _block(ev, st, rows)
+
+
+def nearest_site(events: pd.DataFrame, sites: pd.DataFrame, name_col: str = "name", dtype="float64",
+                 budget_mb: float = MEMORY_BUDGET_MB) -> pd.DataFrame:
+    """Per event: the closest site's name and the distance to it (km, 2 decimals)."""
+    idx = np.empty(len(events), dtype=np.int64)
+    km = np.empty(len(events), dtype=np.float64)
+    for rows, block in iter_distance_blocks(events, sites, dtype, budget_mb):
+        best = np.argmin(block, axis=1)
+        idx[rows] = best
+        km[rows] = block[np.arange(len(best)), best]
+    names = sites[name_col].to_numpy()
+    return pd.DataFrame({"nearest_site": names[idx] if len(sites) else None,
+                         "nearest_site_km": np.round(km, 2)}, index=events.index)
+
+
+def sites_within(events: pd.DataFrame, sites: pd.DataFrame, max_km: float, name_col: str = "name",
+                 dtype="float64", budget_mb: float = MEMORY_BUDGET_MB) -> pd.DataFrame:
+    """Every (event, site) pair closer than max_km, in long format: event (index label), site, km."""
+    ev_idx, site_idx, km = [], [], []
+    for rows, block in iter_distance_blocks(events, sites, dtype, budget_mb):
+        i, j = np.nonzero(block <= max_km)
+        ev_idx.append(i + rows.start)
+        site_idx.append(j)
+        km.append(block[i, j])
+    i = np.concatenate(ev_idx) if ev_idx else np.empty(0, dtype=np.int64)
+    j = np.concatenate(site_idx) if site_idx else np.empty(0, dtype=np.int64)
+    return pd.DataFrame({
+        "event": events.index.to_numpy()[i],
+        "site": sites[name_col].to_numpy()[j],
+        "km": np.round(np.concatenate(km).astype(np.float64), 2) if km else np.empty(0),
+    })
+
+
+def distance_to_sites(events: pd.DataFrame, sites: pd.DataFrame, name_col: str = "name",
+                      dtype="float64") -> pd.DataFrame:
+    """Dense events x sites distance table (one column per site). Only for inputs that fit in memory."""
+    out = np.empty((len(events), len(sites)), dtype=dtype)
+    for rows, block in iter_distance_blocks(events, sites, dtype):
+        out[rows] = block
+    return pd.DataFrame(np.round(out, 2), index=events.index, columns=sites[name_col].to_list())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Nearest site (and optionally all sites within a radius) per event.")
+    ap.add_argument("--sites", required=True, help="CSV with name, latitude, longitude columns")
+    ap.add_argument("--events", default="outputs/earthquakes_export.csv")
+    ap.add_argument("--out", default="outputs/nearest_site.csv")
+    ap.add_argument("--within-km", type=float, default=None,
+                    help="Also write every event/site pair closer than this (to <out>_within.csv)")
+    ap.add_argument("--float32", action="store_true", help="Compute in float32 (half the memory per chunk)")
+    args = ap.parse_args()
+
+    site_df = pd.read_csv(args.sites)
+    events = pd.read_csv(args.events)
+    dtype = "float32" if args.float32 else "float64"
+
+    near = nearest_site(events, site_df, dtype=dtype)
+    events.join(near).to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(f"[sites] nearest of {len(site_df)} sites for {len(events)} events -> {args.out}")
+    if args.within_km is not None:
+        out = args.out.replace(".csv", "_within.csv")
+        pairs = sites_within(events, site_df, args.within_km, dtype=dtype)
+        pairs.to_csv(out, index=False, encoding="utf-8-sig")
+        print(f"[sites] {len(pairs)} pairs within {args.within_km} km -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Exact de-duplication on (source, time, latitude, longitude) across a stream of chunks.
+
+Keys are packed into a fixed 28-byte NumPy record (source code, time in ns, lat, lon)
+and kept as a few sorted runs, so memory grows by 28 bytes per distinct event instead
+of holding earlier chunks (or their Python objects) around.
+
+Usage:
+  seen = SeenKeys()
+  for chunk in chunks:
+      chunk = chunk[seen.filter_new(chunk)]
+"""
+import numpy as np
+import pandas as pd
+
+KEY_DTYPE = np.dtype([("source", "<i4"), ("time", "<i8"), ("latitude", "<f8"), ("longitude", "<f8")])
+
+
+class SeenKeys:
+    def __init__(self):
+        self._codes = {}
+        self._runs = []  # sorted key arrays; merged when a run is no longer much bigger than the next
+
+    def __len__(self):
+        return sum(len(r) for r in self._runs)
+
+    def _encode(self, df: pd.DataFrame) -> np.ndarray:
+        codes, uniques = pd.factorize(df["source"], use_na_sentinel=False)
+        lut = np.array([self._codes.setdefault(None if pd.isna(u) else u, len(self._codes)) for u in uniques],
+                       dtype="i4")
+        keys = np.empty(len(df), dtype=KEY_DTYPE)
+        keys["source"] = lut[codes] if len(lut) else 0
+        keys["time"] = df["time"].to_numpy("datetime64[ns]").view("i8")
+        keys["latitude"] = df["latitude"].to_numpy("f8") + 0.0  # +0.0 folds -0.0 into 0.0
+        keys["longitude"] = df["longitude"].to_numpy("f8") + 0.0
+        return keys
+
+    def filter_new(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Boolean mask over df's rows: True for the first occurrence of each key that was
+        not seen in any earlier call (same result as drop_duplicates(keep="first") over
+        the concatenated stream). The new keys are remembered.
+        """
+        keys = self._encode(df)
+        mask = np.zeros(len(keys), dtype=bool)
+        _, first = np.unique(keys, return_index=True)
+        mask[first] = True
+        for run in self._runs:
+            idx = np.searchsorted(run, keys)
+            hit = (idx < len(run)) & (run[np.minimum(idx, len(run) - 1)] == keys)
+            mask &= ~hit
+        self._push(np.sort(keys[mask]))
+        return mask
+
+    def _push(self, run: np.ndarray):
+        if not len(run):
+            return
+        self._runs.append(run)
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            last = self._runs.pop()
+            self._runs[-1] = np.sort(np.concatenate([self._runs[-1], last]))
@@ -1,20 +1,42 @@
-from sqlalchemy import create_engine
+import math
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import URL
 
-def get_engine():
-    """
-    creates a connection (Engine) to the sqlite database.
-    earthquakes.db is created alongside the project.    
-    """
+# e.g. sqlite:///outputs/earthquakes.db to run the whole pipeline in-process, without a MySQL server
+DB_URL_ENV = "EARTHQUAKE_DB_URL"
+
+
+def _field(value, *options):
+    """MySQL FIELD(): 1-based position of value among options, 0 if absent or NULL."""
+    if value is None:
+        return 0
+    for i, option in enumerate(options, 1):
+        if option == value:
+            return i
+    return 0
+
+
+def _floor(value):
+    return None if value is None else float(math.floor(value))
+
 
+def _register_sqlite_functions(dbapi_conn, _record):
+    # the MySQL functions queries.sql relies on that SQLite lacks (FLOOR only exists in
+    # builds with the math extension)
+    dbapi_conn.create_function("FIELD", -1, _field, deterministic=True)
+    dbapi_conn.create_function("FLOOR", 1, _floor, deterministic=True)
+
+
+def mysql_url():
     user = "root" # نام کاربری MySQL
     password = "@rezp6374" # رمز عبور MySQL
-    host = "localhost" 
+    host = "localhost"
     port = 3306
     database = "earthquakeDB" # نام دیتابیس
 
     # url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4"
-    url = URL.create(
+    return URL.create(
         drivername = "mysql+pymysql",
         username = user,
         password = password,   # handles special chars like '@'
@@ -23,4 +45,17 @@ def get_engine():
         database = database,
         query = {"charset": "utf8mb4"},
     )
-    return create_engine(url, future=True, pool_pre_ping=True)
\ No newline at end of file
+
+
+def get_engine(url=None):
+    """
+    creates a connection (Engine) to the database.
+    url (or the EARTHQUAKE_DB_URL environment variable) picks the backend; without either
+    it is the local MySQL server below. SQLite URLs get FIELD/FLOOR registered so the
+    named queries run unchanged.
+    """
+    url = url or os.environ.get(DB_URL_ENV) or mysql_url()
+    engine = create_engine(url, future=True, pool_pre_ping=True)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _register_sqlite_functions)
+    return engine
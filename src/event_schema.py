@@ -0,0 +1,232 @@
+"""
+Canonical in-memory schema of a normalized event frame (what build_df, normalize_one_csv
+and event_store.read_events return).
+
+  source         category, SOURCES first
+  time           datetime64[ms], naive UTC
+  month          category, the 12 month names in calendar order
+  category       category, CATEGORIES first (Weak < Moderate < Strong)
+  latitude       float64 (part of the unique key, so kept exact)
+  longitude      float64
+  depth          float32
+  magnitude      float32
+  region         category (dictionary-encoded, categories are whatever the frame holds)
+  dist_to_Tokyo  float32
+
+Labels are matched to SOURCES / MONTHS / CATEGORIES ignoring case; any other label is
+kept as an extra category after the known ones (with a warning), so a new source or an
+odd label never fails or blanks a file. The loaders therefore write the canonical
+spelling (EMSC's `moderate` is stored as `Moderate`); rows loaded before this schema keep
+the file's spelling until migrate_labels rewrites them (python src/event_schema.py
+--migrate-db), or a re-load reports them as updated.
+
+float32 keeps 6 significant digits, more than any of our sources report for depth,
+magnitude or distance; widen() turns those columns back into the exact decimal float64s
+(and the categoricals back into strings) for the database driver and the Parquet store.
+
+Usage:
+  from event_schema import to_events, concat_events, validate, memory_report
+  df = to_events(raw_normalized)   # cast; unknown labels warn and become extra categories
+  problems = validate(df)          # [] when df conforms
+  whole = concat_events(iter_build_df(path))   # chunks' region categories merged
+  python src/event_schema.py src/df   # memory of each file: plain dtypes vs this schema
+  python src/event_schema.py --migrate-db --table earthquakes   # canonical labels in stored rows
+"""
+import argparse
+import calendar
+import warnings
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["source", "time", "month", "category", "latitude", "longitude", "depth", "magnitude", "region",
+           "dist_to_Tokyo"]
+SOURCES = ["USGS", "EMSC", "GEOFON", "API", "DATASET", "UNKNOWN"]
+MONTHS = list(calendar.month_name)[1:]
+CATEGORIES = ["Weak", "Moderate", "Strong"]
+LABELS = {"source": SOURCES, "month": MONTHS, "category": CATEGORIES}
+FLOAT32_DIGITS = 6  # significant decimal digits a float32 always round-trips
+
+DTYPES = {
+    "source": pd.CategoricalDtype(SOURCES),
+    "time": np.dtype("datetime64[ms]"),
+    "month": pd.CategoricalDtype(MONTHS, ordered=True),
+    "category": pd.CategoricalDtype(CATEGORIES, ordered=True),
+    "latitude": np.dtype("float64"),
+    "longitude": np.dtype("float64"),
+    "depth": np.dtype("float32"),
+    "magnitude": np.dtype("float32"),
+    "region": "category",
+    "dist_to_Tokyo": np.dtype("float32"),
+}
+BOUNDS = {"latitude": (-90, 90), "longitude": (-180, 180), "magnitude": (-3, 10), "depth": (-15, 800)}
+
+
+def _known(dtype, labels: list) -> bool:
+    """A categorical dtype whose categories start with `labels` (extras may follow)."""
+    return isinstance(dtype, pd.CategoricalDtype) and list(dtype.categories[:len(labels)]) == labels
+
+
+def _labels(s: pd.Series, dtype: pd.CategoricalDtype, column: str) -> pd.Series:
+    """
+    Map strings onto dtype's categories ignoring case and surrounding spaces. Any other
+    label is kept (stripped) as an extra category after the known ones, with a warning.
+    """
+    labels = list(dtype.categories)
+    lookup = {label.lower(): label for label in labels}
+    raw = s.astype("string").str.strip().replace("", pd.NA)
+    mapped = raw.str.lower().map(lookup)
+    unknown = raw.notna() & mapped.isna()
+    if unknown.any():
+        extra = sorted(raw[unknown].unique())
+        warnings.warn(f"{column}: unknown label(s) {extra} kept as extra categories after {labels}", stacklevel=3)
+        mapped = mapped.where(~unknown, raw)
+        dtype = pd.CategoricalDtype(labels + extra, ordered=dtype.ordered)
+    return mapped.astype(object).where(mapped.notna(), None).astype(dtype)
+
+
+def to_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the schema columns df has to DTYPES (other columns are left alone)."""
+    df = df.copy()
+    for c, dtype in DTYPES.items():
+        if c not in df.columns or df[c].dtype == dtype:
+            continue
+        if c in ("source", "month", "category"):
+            if not _known(df[c].dtype, list(dtype.categories)):
+                df[c] = _labels(df[c], dtype, c)
+        elif c == "time":
+            df[c] = pd.to_datetime(df[c]).astype(dtype)
+        elif c == "region":
+            df[c] = df[c].astype("category")
+        else:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype(dtype)
+    return df
+
+
+def concat_events(frames) -> pd.DataFrame:
+    """pd.concat for typed frames (e.g. the chunks of iter_build_df): region stays categorical."""
+    return to_events(pd.concat(frames))
+
+
+def _exact(values: np.ndarray) -> np.ndarray:
+    """float32 -> the float64 of its shortest decimal (np.float32(4.3) -> 4.3, not 4.300000190734863)."""
+    x = values.astype("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decimals = FLOAT32_DIGITS - 1 - np.floor(np.log10(np.abs(x)))
+    decimals = np.where(np.isfinite(decimals), decimals, 0)
+    up = 10.0 ** np.maximum(decimals, 0)
+    down = 10.0 ** np.maximum(-decimals, 0)
+    with np.errstate(invalid="ignore"):
+        return np.where(decimals >= 0, np.round(x * up) / up, np.round(x / down) * down)
+
+
+def widen(df: pd.DataFrame) -> pd.DataFrame:
+    """Plain dtypes for writers: categoricals -> object strings (NaN -> None), float32 -> exact float64."""
+    df = df.copy()
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(object).where(df[c].notna(), None)
+        elif df[c].dtype == np.float32:
+            df[c] = _exact(df[c].to_numpy())
+    return df
+
+
+def validate(df: pd.DataFrame) -> list:
+    """Every way df departs from the schema (missing / extra columns, dtypes, key nulls, bounds); [] if none."""
+    problems = []
+    missing = [c for c in COLUMNS if c not in df.columns]
+    if missing:
+        problems.append(f"missing columns {missing}")
+    extra = [c for c in df.columns if c not in COLUMNS]
+    if extra:
+        problems.append(f"unexpected columns {extra}")
+    for c in COLUMNS:
+        if c not in df.columns:
+            continue
+        want = DTYPES[c]
+        if want == "category":
+            ok = isinstance(df[c].dtype, pd.CategoricalDtype)
+        elif isinstance(want, pd.CategoricalDtype):
+            ok = _known(df[c].dtype, list(want.categories)) and df[c].dtype.ordered == want.ordered
+        else:
+            ok = df[c].dtype == want
+        if not ok:
+            problems.append(f"{c}: dtype {df[c].dtype}, expected {want}")
+    for c in ["source", "time", "latitude", "longitude"]:
+        if c in df.columns and df[c].isna().any():
+            problems.append(f"{c}: {int(df[c].isna().sum())} null(s) in a key column")
+    for c, (lo, hi) in BOUNDS.items():
+        if c in df.columns and pd.api.types.is_numeric_dtype(df[c]):
+            out = ((df[c] < lo) | (df[c] > hi)).sum()
+            if out:
+                problems.append(f"{c}: {int(out)} value(s) outside [{lo}, {hi}]")
+    return problems
+
+
+def migrate_labels(conn, table: str = "earthquakes") -> int:
+    """
+    Rewrite stored source/month/category values that match a known label only ignoring case
+    or surrounding spaces to that label, as the loaders now write them. Run once on a table
+    loaded before this schema. Bumps the table's version when rows change; returns how many did.
+    """
+    from sqlalchemy import text
+    import table_versions
+    changed = 0
+    for column, labels in LABELS.items():
+        # MySQL's default collations compare case-insensitively: compare the bytes there
+        stored = f"`{column}`" if conn.dialect.name == "sqlite" else f"BINARY `{column}`"
+        sql = text(f"UPDATE {table} SET `{column}` = :label "
+                   f"WHERE LOWER(TRIM(`{column}`)) = :lower AND {stored} <> :label")
+        for label in labels:
+            changed += conn.execute(sql, {"label": label, "lower": label.lower()}).rowcount
+    if changed:
+        table_versions.bump(conn, table)
+    return changed
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Deep bytes per column as plain dtypes (what the loaders used to return) and in this schema."""
+    typed = to_events(df)
+    plain = widen(typed)
+    plain["time"] = plain["time"].astype("datetime64[ns]")
+    report = pd.DataFrame({
+        "plain_bytes": plain.memory_usage(index=False, deep=True),
+        "typed_bytes": typed.memory_usage(index=False, deep=True),
+    })
+    report.loc["total"] = report.sum()
+    report["ratio"] = (report["plain_bytes"] / report["typed_bytes"]).round(2)
+    return report
+
+
+def main():
+    from main import discover, build_df
+    ap = argparse.ArgumentParser(description="Memory of normalized event frames: plain dtypes vs the event schema.")
+    ap.add_argument("inputs", nargs="*", help="CSV files/dirs (optional). If none, scans --dir.")
+    ap.add_argument("--dir", default="src/df")
+    ap.add_argument("--pattern", default="*.csv")
+    ap.add_argument("--migrate-db", action="store_true",
+                    help="Instead: rewrite stored labels to the canonical spelling (see migrate_labels)")
+    ap.add_argument("--table", default="earthquakes", help="--migrate-db: table to migrate")
+    args = ap.parse_args()
+
+    if args.migrate_db:
+        from engine import get_engine
+        with get_engine().begin() as conn:
+            print(f"[schema] {migrate_labels(conn, args.table)} row(s) of `{args.table}` relabelled")
+        return
+
+    files = discover(args.inputs, Path(args.dir), args.pattern, False)
+    frames = []
+    for f in files:
+        df = build_df(f)
+        problems = validate(df)
+        print(f"[schema] {f.name}: {len(df)} rows, " + ("; ".join(problems) if problems else "valid"))
+        frames.append(df)
+    if frames:
+        # one frame, as a backfill would hold it (region categories merged across files)
+        report = memory_report(pd.concat([widen(df) for df in frames], ignore_index=True))
+        print(report.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Local Parquet dataset of normalized events (the same frames build_df sends to MySQL).
+
+Layout (hive partitions, one set of part files per input CSV):
+  outputs/event_store/source=USGS/year_month=2025-10/JAPAN_USGS_cleaned-1a2b3c4d-0-0.parquet
+
+Reads only open the partitions and columns they need; time / bbox / magnitude filters
+are pushed down to the Parquet row groups. Part files are kept per input CSV, so an event
+in two overlapping files is stored twice; reads return one row per table key (source,
+time to the second, latitude, longitude), as the database upsert keeps one.
+
+Usage:
+  python src/event_store.py                          # build from src/df
+  python src/event_store.py --root outputs/event_store --dir src/df --chunksize 200000
+  python src/main.py --store outputs/event_store     # write the store while loading the DB
+
+  from event_store import read_events
+  df = read_events("outputs/event_store", columns=["time", "magnitude"],
+                   start="2025-10-01", bbox=(30, 40, 135, 145), min_mag=4.0)
+"""
+import argparse
+import hashlib
+from pathlib import Path
+import pandas as pd
+from event_schema import to_events, widen
+
+DEFAULT_ROOT = "outputs/event_store"
+PARTITION_COLS = ["source", "year_month"]
+
+
+def _schemas():
+    import pyarrow as pa
+    partitions = pa.schema([("source", pa.string()), ("year_month", pa.string())])
+    data = pa.schema([
+        ("time", pa.timestamp("us")),
+        ("month", pa.string()),
+        ("category", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("depth", pa.float64()),
+        ("magnitude", pa.float64()),
+        ("region", pa.string()),
+        ("dist_to_Tokyo", pa.float64()),
+    ])
+    return data, partitions
+
+
+def file_tag(csv_path: Path) -> str:
+    """Stable name prefix for the part files that came from one input CSV."""
+    digest = hashlib.sha1(str(Path(csv_path).resolve()).encode()).hexdigest()[:8]
+    return f"{Path(csv_path).stem}-{digest}"
+
+
+def remove_file(root: Path, tag: str):
+    """Drop every part file previously written for `tag` (so a reload replaces, not appends)."""
+    for p in Path(root).glob(f"source=*/year_month=*/{tag}-*.parquet"):
+        p.unlink()
+
+
+def has_file(root: Path, tag: str) -> bool:
+    """True if the store holds part files written for `tag`."""
+    return next(Path(root).glob(f"source=*/year_month=*/{tag}-*.parquet"), None) is not None
+
+
+def write_events(root: Path, df: pd.DataFrame, tag: str, part: int = 0):
+    """Write one normalized frame (or chunk `part` of a file) into the partitioned store."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    data_schema, part_schema = _schemas()
+    df = widen(df)
+    df["source"] = df["source"].fillna("UNKNOWN").astype(str)
+    df["year_month"] = pd.to_datetime(df["time"]).dt.strftime("%Y-%m")
+    schema = pa.schema(list(data_schema) + list(part_schema))
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    ds.write_dataset(
+        table, str(root), format="parquet",
+        partitioning=ds.partitioning(part_schema, flavor="hive"),
+        basename_template=f"{tag}-{part}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def read_events(root=DEFAULT_ROOT, columns=None, start=None, end=None, bbox=None,
+                min_mag=None, max_mag=None, sources=None) -> pd.DataFrame:
+    """
+    Read events from the store.
+      columns   list of columns to load (None = all); partition columns are allowed too
+      start/end time range [start, end)
+      bbox      (min_lat, max_lat, min_lon, max_lon), inclusive
+      min_mag / max_mag inclusive magnitude bounds
+      sources   e.g. ["USGS", "EMSC"]
+    Columns come back typed as event_schema.DTYPES. Rows sharing the table key (from
+    overlapping input files) are returned once: the copy from the part file that sorts last.
+    """
+    from loader import KEY, db_time
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    data_schema, part_schema = _schemas()
+    dataset = ds.dataset(str(root), format="parquet",
+                         schema=pa.schema(list(data_schema) + list(part_schema)),
+                         partitioning=ds.partitioning(part_schema, flavor="hive"))
+
+    conds = []
+    if sources:
+        conds.append(ds.field("source").isin(list(sources)))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conds.append(ds.field("year_month") >= start.strftime("%Y-%m"))  # partition pruning
+        conds.append(ds.field("time") >= pa.scalar(start.to_pydatetime(), pa.timestamp("us")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conds.append(ds.field("year_month") <= end.strftime("%Y-%m"))
+        conds.append(ds.field("time") < pa.scalar(end.to_pydatetime(), pa.timestamp("us")))
+    if bbox is not None:
+        min_lat, max_lat, min_lon, max_lon = bbox
+        conds += [ds.field("latitude") >= min_lat, ds.field("latitude") <= max_lat,
+                  ds.field("longitude") >= min_lon, ds.field("longitude") <= max_lon]
+    if min_mag is not None:
+        conds.append(ds.field("magnitude") >= min_mag)
+    if max_mag is not None:
+        conds.append(ds.field("magnitude") <= max_mag)
+
+    filt = None
+    for c in conds:
+        filt = c if filt is None else filt & c
+    read = None if columns is None else list(columns) + [c for c in KEY if c not in columns]
+    df = dataset.to_table(columns=read, filter=filt).to_pandas()
+    dup = df[KEY].assign(time=db_time(df["time"])).duplicated(keep="last")
+    df = df[~dup.to_numpy()].reset_index(drop=True)
+    return to_events(df if columns is None else df[list(columns)])
+
+
+def store_files(root: Path, files, chunksize: int = None) -> int:
+    """
+    (Re)write the events of each CSV in `files` to the store, replacing its earlier part files.
+    A file that fails to parse leaves no part files behind. Returns the number of rows written.
+    """
+    from main import build_df, iter_build_df
+    total = 0
+    for i, f in enumerate(files, 1):
+        tag = file_tag(f)
+        try:
+            remove_file(root, tag)
+            parts = iter_build_df(f, chunksize) if chunksize else [build_df(f)]
+            rows = 0
+            for n, df in enumerate(parts):
+                write_events(root, df, tag, n)
+                rows += len(df)
+            total += rows
+            print(f"[{i}/{len(files)}] +{rows} from {f}")
+        except Exception as e:
+            remove_file(root, tag)
+            print(f"[{i}/{len(files)}] FAILED {f}: {e}")
+    return total
+
+
+def main():
+    from main import discover
+    ap = argparse.ArgumentParser(description="Build the local Parquet event store from CSVs.")
+    ap.add_argument("inputs", nargs="*", help="CSV files/dirs (optional). If none, scans --dir.")
+    ap.add_argument("--dir", default="src/df")
+    ap.add_argument("--pattern", default="*.csv")
+    ap.add_argument("--recursive", action="store_true")
+    ap.add_argument("--root", default=DEFAULT_ROOT, help=f"Store directory (default: {DEFAULT_ROOT})")
+    ap.add_argument("--chunksize", type=int, default=None, help="Stream each CSV in chunks of N rows")
+    args = ap.parse_args()
+
+    files = discover(args.inputs, Path(args.dir), args.pattern, args.recursive)
+    print(f"[store] Found {len(files)} CSV(s) -> {args.root}")
+    store_files(args.root, files, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
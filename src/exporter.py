@@ -0,0 +1,137 @@
+"""
+Chunk writers for exporting the `earthquakes` table.
+
+Formats:
+  csv      plain UTF-8-BOM CSV (what export_all always wrote)
+  csv.gz   gzip-compressed CSV
+  csv.zst  zstandard-compressed CSV (needs `zstandard`)
+  parquet  Parquet with a fixed schema (needs `pyarrow`)
+
+Partitioned output is laid out as <dir>/source=<SOURCE>/year_month=<YYYY-MM>/part-00000.<ext>.
+At most MAX_OPEN partition files are open at once (see PartitionedWriter).
+"""
+from collections import OrderedDict
+import gzip
+from pathlib import Path
+import pandas as pd
+
+FORMATS = ["csv", "csv.gz", "csv.zst", "parquet"]
+PARTITION_COLS = ["source", "year_month"]
+MAX_OPEN = 64               # partition files open at once; beyond that the least recently written is closed
+APPENDABLE = ("csv", "csv.gz")  # formats a closed partition file can be reopened to append to
+
+
+def target_path(out_path: Path, fmt: str) -> Path:
+    """outputs/earthquakes_export.csv + 'parquet' -> outputs/earthquakes_export.parquet"""
+    name = out_path.name
+    for ext in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith("." + ext):
+            name = name[:-len(ext) - 1]
+            break
+    return out_path.with_name(f"{name}.{fmt}")
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()),
+        ("source", pa.string()),
+        ("time", pa.timestamp("ms")),
+        ("month", pa.string()),
+        ("category", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("depth", pa.float64()),
+        ("magnitude", pa.float64()),
+        ("region", pa.string()),
+        ("dist_to_Tokyo", pa.float64()),
+    ])
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to one file; the header/schema is written once.
+    append=True continues a CSV written earlier (fmt in APPENDABLE): no BOM, no header.
+    """
+    def __init__(self, path: Path, fmt: str, append: bool = False):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown export format {fmt!r} (choose from {', '.join(FORMATS)})")
+        if append and fmt not in APPENDABLE:
+            raise ValueError(f"cannot append to a {fmt} file")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path, self.fmt, self.rows = path, fmt, 0
+        self._header = not append
+        encoding = "utf-8" if append else "utf-8-sig"
+        if fmt == "csv":
+            self._fh = open(path, "a" if append else "w", encoding=encoding, newline="")
+        elif fmt == "csv.gz":
+            self._fh = gzip.open(path, "at" if append else "wt", encoding=encoding, newline="")
+        elif fmt == "csv.zst":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("csv.zst export needs the `zstandard` package: pip install zstandard")
+            self._fh = zstandard.open(path, "wt", encoding="utf-8-sig", newline="")
+        else:
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("parquet export needs the `pyarrow` package: pip install pyarrow")
+            self._schema = _parquet_schema()
+            self._fh = pq.ParquetWriter(path, self._schema)
+
+    def write(self, df: pd.DataFrame):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            cols = [c for c in self._schema.names if c in df.columns]
+            self._fh.write_table(pa.Table.from_pandas(df[cols], schema=self._schema, preserve_index=False))
+        else:
+            df.to_csv(self._fh, index=False, header=self._header and self.rows == 0)
+        self.rows += len(df)
+
+    def close(self):
+        self._fh.close()
+
+
+class PartitionedWriter:
+    """
+    Route each chunk's rows to one ChunkWriter per (source, year_month) partition.
+    At most max_open writers are open: past that the least recently written one is closed,
+    and rows that arrive for it later are appended to its file (csv, csv.gz) or go to its
+    next part file (part-00001...; csv.zst and parquet files cannot be reopened).
+    """
+    def __init__(self, root: Path, fmt: str, max_open: int = MAX_OPEN):
+        self.root, self.fmt, self.rows = root, fmt, 0
+        self.max_open = max_open
+        self._writers = OrderedDict()  # open writers, least recently written first
+        self._parts = {}               # partition -> number of its current part file
+
+    def _writer(self, key) -> ChunkWriter:
+        w = self._writers.get(key)
+        if w is not None:
+            self._writers.move_to_end(key)
+            return w
+        while len(self._writers) >= self.max_open:
+            self._writers.popitem(last=False)[1].close()
+        append = key in self._parts and self.fmt in APPENDABLE
+        part = self._parts[key] + (not append) if key in self._parts else 0
+        self._parts[key] = part
+        source, month = key
+        path = self.root / f"source={source}" / f"year_month={month}" / f"part-{part:05d}.{self.fmt}"
+        w = self._writers[key] = ChunkWriter(path, self.fmt, append)
+        return w
+
+    def write(self, df: pd.DataFrame):
+        ym = pd.to_datetime(df["time"]).dt.strftime("%Y-%m")
+        for key, part in df.groupby([df["source"].fillna("UNKNOWN"), ym.fillna("unknown")], sort=False):
+            self._writer(key).write(part)
+        self.rows += len(df)
+
+    def close(self):
+        for w in self._writers.values():
+            w.close()
+        self._writers.clear()
+
+    @property
+    def partitions(self):
+        return len(self._parts)
@@ -0,0 +1,349 @@
+"""
+Headless renderer for the figures of `Drawing diagrams.ipynb` and `analysis.ipynb`.
+
+Every figure is drawn with matplotlib's Agg backend (no display, no pyplot state) from the
+CSVs main.py writes: outputs/queries/<name>.csv and the export. Figures are rendered in
+parallel worker processes and saved as PNG and/or SVG under outputs/figures/, together
+with render_report.json (seconds, points and draw mode per figure).
+
+Scatters with more than --density-threshold points are pre-aggregated into a 2-D
+histogram and drawn as one log-scaled raster instead of one marker per event, and box
+plots draw at most MAX_FLIERS outliers per box, so render time stays flat as the catalog
+grows.
+
+Usage:
+  python src/figures.py                                   # every figure, PNG, up to 4 processes
+  python src/figures.py --format png svg --workers 8
+  python src/figures.py --only magnitude_vs_depth magnitude_vs_time --density-threshold 100000
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import time
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib import cbook, dates as mdates
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+import numpy as np
+import pandas as pd
+
+QUERIES_DIR = Path("outputs/queries")
+EXPORT_PATH = Path("outputs/earthquakes_export.csv")
+OUT_DIR = Path("outputs/figures")
+REPORT_FILE = "render_report.json"
+DENSITY_THRESHOLD = 50_000  # scatters above this many points become density rasters
+DENSITY_BINS = (400, 300)
+GRID_DEG = 0.1  # cell size of the heatmap query (ROUND(latitude, 1), ROUND(longitude, 1))
+MAX_FLIERS = 2_000
+DPI = 120
+MAG_LIMIT, DEPTH_LIMIT = 5.0, 70.0  # analysis.ipynb's "strong" and "shallow"
+
+
+def _read(path: Path, columns: list, dates=()) -> pd.DataFrame:
+    df = pd.read_csv(path, usecols=columns, encoding="utf-8-sig")
+    for c in columns:
+        if c in dates:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+        elif c in ("depth", "magnitude", "quake_count", "total_quakes", "avg_magnitude", "lat", "lon",
+                   "distance_range"):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df
+
+
+def _scatter(fig, ax, x, y, threshold: int, color: str, **kwargs) -> str:
+    """Markers for small inputs, a log-density raster above `threshold` points. Returns the mode."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    if len(x) <= threshold:
+        ax.scatter(x, y, alpha=0.6, c=color, **kwargs)
+        return "markers"
+    counts, xe, ye = np.histogram2d(x, y, bins=DENSITY_BINS)
+    im = ax.imshow(np.ma.masked_equal(counts.T, 0), origin="lower", aspect="auto", cmap="viridis",
+                   extent=[xe[0], xe[-1], ye[0], ye[-1]], norm=LogNorm(), interpolation="nearest")
+    fig.colorbar(im, ax=ax, label="Events per cell")
+    return "density"
+
+
+def _boxplot(ax, groups: list, labels: list):
+    """ax.boxplot from precomputed stats, with the fliers of each box capped at MAX_FLIERS."""
+    rng = np.random.default_rng(0)
+    stats = []
+    for values, label in zip(groups, labels):
+        s = cbook.boxplot_stats(np.asarray(values, dtype=float), labels=[label])[0]
+        if len(s["fliers"]) > MAX_FLIERS:
+            s["fliers"] = rng.choice(s["fliers"], MAX_FLIERS, replace=False)
+        stats.append(s)
+    ax.bxp(stats, patch_artist=True)
+
+
+def _annotated(fig, ax, table: pd.DataFrame, cmap: str, label: str):
+    im = ax.imshow(table.to_numpy(dtype=float), cmap=cmap, aspect="auto")
+    ax.set_xticks(range(table.shape[1]), table.columns, rotation=45, ha="right")
+    ax.set_yticks(range(table.shape[0]), table.index)
+    for (i, j), v in np.ndenumerate(table.to_numpy()):
+        # light text on the dark end of the colour map
+        light = (im.norm(v) < 0.5) == (cmap == "hot")
+        ax.text(j, i, f"{v:g}", ha="center", va="center", fontsize=8, color="white" if light else "black")
+    fig.colorbar(im, ax=ax, label=label)
+
+
+def magnitude_vs_depth(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "Scattering.csv", ["depth", "magnitude"])
+    ax = fig.subplots()
+    mode = _scatter(fig, ax, df["depth"], df["magnitude"], threshold, "teal")
+    ax.set(xlabel="Earthquake depth", ylabel="Earthquake magnitude", title="Scatter plot of Magnitude versus depth")
+    ax.grid(True)
+    return len(df), mode
+
+
+def magnitude_vs_time(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "Scattering2.csv", ["time", "magnitude"], dates=["time"])
+    ax = fig.subplots()
+    mode = _scatter(fig, ax, mdates.date2num(df["time"]), df["magnitude"], threshold, "darkorange")
+    ax.xaxis_date()
+    ax.set(xlabel="Earthquake time", ylabel="Earthquake magnitude", title="Scatter plot of magnitude versus time")
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.grid(True)
+    return len(df), mode
+
+
+def daily_counts(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "Linear.csv", ["day", "total_quakes", "avg_magnitude"], dates=["day"])
+    ax1, ax2 = fig.subplots(2, 1, sharex=True)
+    ax1.plot(df["day"], df["total_quakes"], color="orange", marker="o")
+    ax1.set_ylabel("Number of earthquakes", color="orange")
+    ax1.set_title("Number of earthquakes over Day")
+    ax1.grid(True)
+    ax2.plot(df["day"], df["avg_magnitude"], color="blue", marker="8")
+    ax2.set(ylabel="Average magnitude", title="Average magnitude of earthquakes over Day", xlabel="Day")
+    ax2.tick_params(axis="x", labelrotation=45)
+    ax2.grid(True)
+    return len(df), "lines"
+
+
+def heatmap(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "heatmap.csv", ["lat", "lon", "quake_count"])
+    # the query's cells on the full GRID_DEG lattice (cells without events are 0), so each one
+    # is drawn at its own coordinates
+    lat0, lon0 = df["lat"].min(), df["lon"].min()
+    lat_i = np.rint((df["lat"] - lat0) / GRID_DEG).astype(int).to_numpy()
+    lon_i = np.rint((df["lon"] - lon0) / GRID_DEG).astype(int).to_numpy()
+    grid = np.zeros((lat_i.max() + 1, lon_i.max() + 1))
+    np.add.at(grid, (lat_i, lon_i), df["quake_count"].to_numpy())
+    half = GRID_DEG / 2
+    ax = fig.subplots()
+    im = ax.imshow(grid, origin="lower", cmap="hot", aspect="auto", interpolation="nearest",
+                   extent=[lon0 - half, lon0 + GRID_DEG * lon_i.max() + half,
+                           lat0 - half, lat0 + GRID_DEG * lat_i.max() + half])
+    fig.colorbar(im, ax=ax)
+    ax.set(title="Heat map of the geographical distribution of earthquakes", xlabel="Longitude", ylabel="Latitude")
+    return len(df), "raster"
+
+
+def heatmap_bands(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "heatmap2.csv", ["lat_range", "lon_range", "quake_count"])
+    table = df.pivot_table(index="lat_range", columns="lon_range", values="quake_count", fill_value=0)
+    ax = fig.subplots()
+    _annotated(fig, ax, table, "hot", "Number of earthquakes")
+    ax.set(title="Heatmap of Earthquake Distribution by Latitude and Longitude", xlabel="Longitude Range",
+           ylabel="Latitude Range")
+    return len(df), "raster"
+
+
+def distance_bands(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "heatmapEx.csv", ["distance_range", "quake_count"])
+    table = df.pivot_table(index="distance_range", values="quake_count").T
+    ax = fig.subplots()
+    _annotated(fig, ax, table, "YlOrRd", "Number of Earthquakes")
+    ax.set(title="Heatmap of Earthquake Count by Distance to Tokyo", xlabel="Distance Range (km)")
+    return len(df), "raster"
+
+
+def magnitude_hist_by_source(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "histogramS.csv", ["source", "magnitude"])
+    ax = fig.subplots()
+    for source, group in df.groupby("source", sort=False):
+        ax.hist(group["magnitude"].dropna(), bins=15, alpha=0.6, label=source)
+    ax.set(xlabel="Magnitude", ylabel="Frequency", title="Distribution of Earthquake Magnitudes by Source")
+    ax.legend()
+    ax.grid(True)
+    return len(df), "bars"
+
+
+def magnitude_hist_per_source(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "histogramS.csv", ["source", "magnitude"])
+    groups = list(df.groupby("source", sort=False))
+    fig.set_size_inches(5 * max(len(groups), 1), 5)
+    axes = np.atleast_1d(fig.subplots(1, max(len(groups), 1), sharey=True))
+    for i, (source, group) in enumerate(groups):
+        axes[i].hist(group["magnitude"].dropna(), bins=15, color="hotpink", edgecolor="black")
+        axes[i].set(title=f"Source: {source}", xlabel="Magnitude")
+        axes[i].grid(True)
+    axes[0].set_ylabel("Frequency")
+    return len(df), "bars"
+
+
+def magnitude_by_depth_zone(fig, inputs, threshold):
+    df = _read(inputs["queries"] / "boxPlot.csv", ["depth_zone", "magnitude"])
+    zones = list(df["depth_zone"].unique())
+    ax = fig.subplots()
+    _boxplot(ax, [df.loc[df["depth_zone"] == z, "magnitude"].dropna() for z in zones], zones)
+    ax.set(title="Distribution of Earthquake Magnitudes by Depth Zone", xlabel="Depth Zone", ylabel="Magnitude")
+    ax.grid(True)
+    return len(df), "boxes"
+
+
+def depth_hist(fig, inputs, threshold):
+    df = _read(inputs["export"], ["depth"])
+    ax = fig.subplots()
+    ax.hist(df["depth"].dropna(), bins=30, color="purple", rwidth=0.7)
+    ax.set(xlabel="Depth (km)", ylabel="Count", title="Depth distribution of earthquakes in Japan")
+    ax.grid(True, alpha=0.3)
+    return len(df), "bars"
+
+
+def strong_depth_by_source(fig, inputs, threshold):
+    df = _read(inputs["export"], ["source", "depth", "magnitude"])
+    strong = df[df["magnitude"] >= MAG_LIMIT]
+    groups = [(src, g["depth"].dropna()) for src, g in strong.groupby("source")]
+    ax = fig.subplots()
+    _boxplot(ax, [g for _, g in groups], [src for src, _ in groups])
+    ax.set(ylabel="Depth (km)", title=f"Depth of >{MAG_LIMIT:g} magnitude earthquakes by source")
+    ax.grid(True, alpha=0.3)
+    return len(strong), "boxes"
+
+
+def weak_ratio_by_source(fig, inputs, threshold):
+    df = _read(inputs["export"], ["source", "category"])
+    weak = df["category"].astype(str).str.lower() == "weak"
+    ratio = (weak.groupby(df["source"]).sum() / df.groupby("source").size()).fillna(0).round(2)
+    ax = fig.subplots()
+    ax.bar(ratio.index, ratio.to_numpy(), color="pink", edgecolor="black")
+    ax.set(ylabel="Weak-to-total ratio", title="Coverage of weak earthquakes per source")
+    ax.grid(True, axis="y", alpha=0.3)
+    return len(df), "bars"
+
+
+def strong_shallow_scatter(fig, inputs, threshold):
+    df = _read(inputs["export"], ["depth", "magnitude"])
+    danger = df[(df["magnitude"] >= MAG_LIMIT) & (df["depth"] <= DEPTH_LIMIT)]
+    ax = fig.subplots()
+    mode = _scatter(fig, ax, danger["depth"], danger["magnitude"], threshold, "purple", edgecolor="black")
+    ax.set(xlabel="Depth (km)", ylabel="Magnitude",
+           title=f"Earthquakes with magnitude ≥ {MAG_LIMIT} & depth ≤ {DEPTH_LIMIT} km")
+    ax.grid(True, alpha=0.3)
+    return len(danger), mode
+
+
+def strong_count_by_source(fig, inputs, threshold):
+    df = _read(inputs["export"], ["source", "magnitude"])
+    counts = df[df["magnitude"] >= MAG_LIMIT].groupby("source").size()
+    ax = fig.subplots()
+    ax.bar(counts.index, counts.to_numpy(), color="pink", edgecolor="black")
+    ax.set(ylabel="Count", title=f"Number of earthquakes with magnitude ≥ {MAG_LIMIT}")
+    ax.grid(True, axis="y", alpha=0.3)
+    return int(counts.sum()), "bars"
+
+
+# name -> (draw function, figure size in inches)
+FIGURES = {
+    "magnitude_vs_depth": (magnitude_vs_depth, (10, 6)),
+    "magnitude_vs_time": (magnitude_vs_time, (10, 6)),
+    "daily_counts": (daily_counts, (14, 8)),
+    "heatmap": (heatmap, (12, 10)),
+    "heatmap_bands": (heatmap_bands, (8, 8)),
+    "distance_bands": (distance_bands, (12, 2.5)),
+    "magnitude_hist_by_source": (magnitude_hist_by_source, (12, 6)),
+    "magnitude_hist_per_source": (magnitude_hist_per_source, (12, 5)),
+    "magnitude_by_depth_zone": (magnitude_by_depth_zone, (10, 6)),
+    "depth_hist": (depth_hist, (8, 5)),
+    "strong_depth_by_source": (strong_depth_by_source, (8, 5)),
+    "weak_ratio_by_source": (weak_ratio_by_source, (8, 5)),
+    "strong_shallow_scatter": (strong_shallow_scatter, (8, 5)),
+    "strong_count_by_source": (strong_count_by_source, (8, 5)),
+}
+
+
+def render_one(name: str, inputs: dict, out_dir, formats=("png",), threshold: int = DENSITY_THRESHOLD) -> dict:
+    """Draw FIGURES[name] and save it as out_dir/<name>.<fmt> for each format."""
+    t0 = time.perf_counter()
+    draw, size = FIGURES[name]
+    try:
+        fig = Figure(figsize=size, dpi=DPI)
+        points, mode = draw(fig, inputs, threshold)
+        fig.tight_layout()
+        files = []
+        for fmt in formats:
+            path = Path(out_dir) / f"{name}.{fmt}"
+            tmp = path.with_name(f".{path.name}.tmp")
+            fig.savefig(tmp, format=fmt)
+            os.replace(tmp, path)  # readers never see a half-written image
+            files.append(str(path))
+    except FileNotFoundError as e:
+        return {"name": name, "status": "skipped", "reason": f"missing input {e.filename}"}
+    except Exception as e:
+        return {"name": name, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+    return {"name": name, "status": "rendered", "points": int(points), "mode": mode,
+            "seconds": round(time.perf_counter() - t0, 4), "files": files}
+
+
+def render_all(queries_dir=QUERIES_DIR, export_path=EXPORT_PATH, out_dir=OUT_DIR, formats=("png",),
+               workers: int = 4, only=None, threshold: int = DENSITY_THRESHOLD) -> dict:
+    """Render FIGURES (or `only` of them) in `workers` processes; returns (and writes) the report."""
+    names = list(only or FIGURES)
+    unknown = set(names) - set(FIGURES)
+    if unknown:
+        raise ValueError(f"unknown figures {sorted(unknown)}; expected some of {list(FIGURES)}")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    inputs = {"queries": Path(queries_dir), "export": Path(export_path)}
+
+    started = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    args = [(name, inputs, out, tuple(formats), threshold) for name in names]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(render_one, *zip(*args)))
+    else:
+        results = [render_one(*a) for a in args]
+    report = {
+        "started_at": started.isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - t0, 4),
+        "workers": workers,
+        "density_threshold": threshold,
+        "figures": results,
+    }
+    (out / REPORT_FILE).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Render the notebook figures headlessly (Agg) to PNG/SVG.")
+    ap.add_argument("--queries-dir", default=str(QUERIES_DIR), help="Where main.py --run-queries wrote its CSVs")
+    ap.add_argument("--export", default=str(EXPORT_PATH), help="The CSV export of the events table")
+    ap.add_argument("--out", default=str(OUT_DIR))
+    ap.add_argument("--format", nargs="+", default=["png"], choices=["png", "svg"])
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                    help="Render in N processes (default: up to 4, one per CPU; 1: in this process)")
+    ap.add_argument("--only", nargs="+", choices=list(FIGURES), help="Render only these figures")
+    ap.add_argument("--density-threshold", type=int, default=DENSITY_THRESHOLD,
+                    help=f"Scatters with more points are drawn as density rasters (default: {DENSITY_THRESHOLD})")
+    args = ap.parse_args()
+
+    report = render_all(args.queries_dir, args.export, args.out, args.format, args.workers, args.only,
+                        args.density_threshold)
+    for r in report["figures"]:
+        if r["status"] == "rendered":
+            print(f"[figures] {r['name']:<26} {r['seconds']:>7.2f}s  {r['points']:>10,} pts  {r['mode']}")
+        else:
+            print(f"[figures] {r['name']:<26} {r['status'].upper()}: {r.get('reason') or r.get('error')}")
+    print(f"[figures] {report['seconds']:.2f}s total -> {args.out}/{REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Per-stage instrumentation for main.py: wall and CPU time, rows in / out, rows dropped per
+rule and peak RSS, per stage and per file, collected into one JSON report.
+
+Usage:
+  metrics = Metrics(profile_dir="outputs/profiles")   # profile_dir optional
+  with metrics.stage("load", file="a.csv") as rec:
+      rec["rows_in"] = 100
+  metrics.write("outputs/metrics.json")                 # also dumps <stage>.prof per stage
+
+Peak RSS is the process high-water mark when the stage ended (ru_maxrss), so it never goes
+down; rss_growth_mb is how much the stage raised it. cProfile only sees the calling thread:
+work done in worker processes (--workers) or query threads is timed but not profiled.
+"""
+import cProfile
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def add_step(stats: dict, step: str, t0: float) -> float:
+    """Add the seconds since t0 to stats["steps"][step] (if stats is given); returns now."""
+    now = time.perf_counter()
+    if stats is not None:
+        steps = stats.setdefault("steps", {})
+        steps[step] = steps.get(step, 0.0) + now - t0
+    return now
+
+
+def add_dropped(stats: dict, rule: str, n: int):
+    if stats is not None and n:
+        dropped = stats.setdefault("dropped", {})
+        dropped[rule] = dropped.get(rule, 0) + int(n)
+
+
+def add_rows(stats: dict, rows_in: int, rows_out: int):
+    if stats is not None:
+        stats["rows_in"] = stats.get("rows_in", 0) + int(rows_in)
+        stats["rows_out"] = stats.get("rows_out", 0) + int(rows_out)
+
+
+def _tidy(rec: dict) -> dict:
+    if "steps" in rec:
+        rec["steps"] = {k: round(v, 4) for k, v in rec["steps"].items()}
+    return rec
+
+
+class Metrics:
+    def __init__(self, profile_dir=None):
+        self.records = []
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self._profiles = {}
+        self._started = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        """Time the block; the yielded dict takes rows_in / rows_out / dropped / any extra fields."""
+        rec = {"stage": name, **labels}
+        prof = None
+        if self.profile_dir is not None:
+            prof = self._profiles.setdefault(name, cProfile.Profile())
+        rss0, cpu0, t0 = peak_rss_mb(), time.process_time(), time.perf_counter()
+        if prof:
+            prof.enable()
+        try:
+            yield rec
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if prof:
+                prof.disable()
+            rec["seconds"] = round(time.perf_counter() - t0, 4)
+            rec["cpu_seconds"] = round(time.process_time() - cpu0, 4)
+            rec["peak_rss_mb"] = peak_rss_mb()
+            if rss0 is not None:
+                rec["rss_growth_mb"] = round(rec["peak_rss_mb"] - rss0, 1)
+            self.records.append(_tidy(rec))
+
+    def add(self, name: str, **fields):
+        """Record a stage measured elsewhere (e.g. in a worker process)."""
+        self.records.append(_tidy({"stage": name, **fields}))
+
+    def summary(self) -> dict:
+        """Per stage: entries, total seconds / cpu_seconds / rows, dropped rows per rule, max peak RSS."""
+        out = {}
+        for rec in self.records:
+            s = out.setdefault(rec["stage"], {"entries": 0, "seconds": 0.0, "cpu_seconds": 0.0, "rows_in": 0,
+                                              "rows_out": 0, "dropped": defaultdict(int), "peak_rss_mb": None,
+                                              "errors": 0})
+            s["entries"] += 1
+            for k in ("seconds", "cpu_seconds", "rows_in", "rows_out"):
+                s[k] += rec.get(k) or 0
+            for rule, n in rec.get("dropped", {}).items():
+                s["dropped"][rule] += n
+            if rec.get("peak_rss_mb") is not None:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0, rec["peak_rss_mb"])
+            s["errors"] += "error" in rec
+        for s in out.values():
+            s["seconds"] = round(s["seconds"], 4)
+            s["cpu_seconds"] = round(s["cpu_seconds"], 4)
+            s["dropped"] = dict(s["dropped"])
+        return out
+
+    def report(self) -> dict:
+        return {
+            "started_at": self._started.isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - self._t0, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.summary(),
+            "records": self.records,
+        }
+
+    def dump_profiles(self) -> list:
+        if self.profile_dir is None:
+            return []
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name, prof in self._profiles.items():
+            path = self.profile_dir / f"{name}.prof"
+            prof.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def write(self, path) -> dict:
+        report = self.report()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+        self.dump_profiles()
+        return report
@@ -0,0 +1,183 @@
+"""
+Live tailing of an event feed (the USGS event service: python follow.py).
+
+Every poll calls `fetch(since, now)` for the events *updated* after a watermark stored in
+the `feed_watermarks` table. The caller supplies it (follow.usgs_fetcher queries the FDSN
+service and adds the columns the cleaned USGS files carry); it returns build_df input
+columns plus the feed's `id` and `updated`. The rows go through main.normalize_frame (the
+build_df rules) and are upserted in small batches, one transaction each, so new events
+show up within about one poll interval. The watermark (the newest `updated` seen) is
+written in the same transaction as the last batch: a crash re-reads that poll, never skips it.
+
+Each poll re-reads OVERLAP before the watermark (the service indexes events a little
+after their `updated` time; re-read rows are skipped as unchanged).
+The table is keyed on (source, time, latitude, longitude), so `feed_events` remembers the
+key each USGS event id was stored under: a revision that moves the origin time or the
+hypocentre deletes the earlier row (and takes it out of the rollups) before the new one
+is written. Deleted events are not followed.
+
+Usage:
+  python follow.py --poll-interval 60 --since 2025-10-01
+  from live import follow, poll_once
+  stats = poll_once(engine, fetch)
+"""
+import time
+import pandas as pd
+from sqlalchemy import bindparam, text
+from event_schema import widen
+from loader import KEY, COLUMNS, upsert_df, BatchTuner, db_time, insert_rows, insert_sql, quote, to_rows
+from main import normalize_frame
+import rollups
+from tables import WATERMARKS_DDL, FEED_EVENTS_DDL
+
+FEED = "usgs"
+POLL_SECONDS = 60
+BATCH_ROWS = 500
+OVERLAP = pd.Timedelta(minutes=2)
+FIRST_SINCE = pd.Timedelta(days=1)  # first poll without --since: events of the last day
+
+
+def _now() -> pd.Timestamp:
+    return pd.Timestamp.now(tz="UTC").tz_convert(None)
+
+
+def _fmt(t: pd.Timestamp) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+
+def ensure(conn):
+    conn.execute(text(WATERMARKS_DDL))
+    conn.execute(text(FEED_EVENTS_DDL))
+
+
+def load_watermark(conn, feed: str = FEED):
+    row = conn.execute(text("SELECT updated_after FROM feed_watermarks WHERE feed = :f"), {"f": feed}).first()
+    return None if row is None else pd.Timestamp(row[0])
+
+
+def save_watermark(conn, feed: str, updated_after: pd.Timestamp):
+    sql = "INSERT INTO feed_watermarks (feed, updated_after, polled_at) VALUES (:f, :u, :p) "
+    if conn.dialect.name == "sqlite":
+        sql += "ON CONFLICT (feed) DO UPDATE SET updated_after=excluded.updated_after, polled_at=excluded.polled_at"
+    else:
+        sql += "ON DUPLICATE KEY UPDATE updated_after=VALUES(updated_after), polled_at=VALUES(polled_at)"
+    conn.execute(text(sql), {"f": feed, "u": _fmt(updated_after),
+                             "p": _now().to_pydatetime().replace(microsecond=0)})
+
+
+def _event_keys(df: pd.DataFrame, ids: pd.Series) -> pd.DataFrame:
+    """event_id + the table key each normalized row is stored under (time as the loader rounds it)."""
+    keys = widen(df[KEY])
+    keys["time"] = db_time(keys["time"])
+    keys.insert(0, "event_id", ids.loc[df.index].astype(str).to_numpy())
+    return keys.reset_index(drop=True)
+
+
+def retire_moved(conn, keys: pd.DataFrame, table: str = "earthquakes", feed: str = FEED) -> int:
+    """
+    Delete the stored rows of events in `keys` that were last stored under another key
+    (a revision moved their time or hypocentre) and subtract them from the rollups.
+    Returns the number of rows deleted.
+    """
+    stmt = text("SELECT event_id, source, `time`, latitude, longitude FROM feed_events "
+                "WHERE feed = :f AND event_id IN :ids").bindparams(bindparam("ids", expanding=True))
+    old = pd.DataFrame(conn.execute(stmt, {"f": feed, "ids": keys["event_id"].tolist()}).all(),
+                       columns=["event_id"] + KEY)
+    if old.empty:
+        return 0
+    old["time"] = pd.to_datetime(old["time"])
+    both = old.merge(keys, on="event_id", suffixes=("", "_new"))
+    moved = pd.Series(False, index=both.index)
+    for c in KEY:
+        moved |= both[c] != both[c + "_new"]
+    if not moved.any():
+        return 0
+    where = " AND ".join(f"{quote(c)} = :{c}" for c in KEY)
+    params = [dict(zip(KEY, row)) for row in to_rows(both.loc[moved, KEY])]
+    select = text(f"SELECT {', '.join(quote(c) for c in COLUMNS)} FROM {table} WHERE {where}")
+    stored = [r for r in (conn.execute(select, p).mappings().first() for p in params) if r is not None]
+    if not stored:
+        return 0
+    removed = pd.DataFrame([dict(r) for r in stored], columns=COLUMNS)
+    removed["time"] = pd.to_datetime(removed["time"])
+    conn.execute(text(f"DELETE FROM {table} WHERE {where}"), params)
+    rollups.apply_delta(conn, removed.iloc[:0], removed)
+    return len(removed)
+
+
+def save_event_keys(conn, keys: pd.DataFrame, feed: str = FEED):
+    cols = ["feed", "event_id"] + KEY
+    sql = insert_sql(conn, "feed_events", cols) + " "
+    if conn.dialect.name == "sqlite":
+        sql += "ON CONFLICT (feed, event_id) DO UPDATE SET " + ", ".join(f"{quote(c)}=excluded.{quote(c)}" for c in KEY)
+    else:
+        sql += "ON DUPLICATE KEY UPDATE " + ", ".join(f"{quote(c)}=VALUES({quote(c)})" for c in KEY)
+    insert_rows(conn, sql, [(feed, *row) for row in to_rows(keys)])
+
+
+def poll_once(engine, fetch, table: str = "earthquakes", feed: str = FEED, since=None,
+              batch_rows: int = BATCH_ROWS) -> dict:
+    """
+    One incremental poll: fetch(start, now) returns the feed's rows updated after `start`
+    (build_df input columns plus `id` and `updated`; an empty frame when there are none).
+    `since` only applies while the feed has no watermark yet.
+    Returns fetched / rows (after build_df rules) / inserted / updated / skipped, moved
+    (earlier rows of revised events deleted because their key changed), the new watermark
+    and lag_s: seconds from the newest event's `updated` time to its commit.
+    """
+    now = _now()
+    with engine.connect() as conn:
+        watermark = load_watermark(conn, feed)
+    start = watermark - OVERLAP if watermark is not None else pd.Timestamp(since or now - FIRST_SINCE)
+    raw = fetch(start, now)
+
+    stats = {"fetched": len(raw), "rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "moved": 0,
+             "watermark": None if watermark is None else _fmt(watermark), "lag_s": None}
+    if raw.empty:
+        return stats
+    updated = pd.to_datetime(raw["updated"], utc=True).dt.tz_convert(None)
+    newest = max(updated.max(), watermark) if watermark is not None else updated.max()
+    df = normalize_frame(raw)
+    stats["rows"] = len(df)
+    keys = _event_keys(df, raw["id"])
+
+    tuner = BatchTuner(size=batch_rows, min_size=batch_rows, max_size=batch_rows)
+    starts = range(0, len(df), batch_rows) if len(df) else [0]
+    for i in starts:
+        with engine.begin() as conn:
+            part = keys.iloc[i:i + batch_rows]
+            if len(part):
+                stats["moved"] += retire_moved(conn, part, table, feed)
+            counts = upsert_df(conn, df.iloc[i:i + batch_rows], table, tuner)
+            save_event_keys(conn, part, feed)
+            if i == starts[-1]:
+                save_watermark(conn, feed, newest)
+        for k in counts:
+            stats[k] += counts[k]
+    stats["watermark"] = _fmt(newest)
+    stats["lag_s"] = round((_now() - updated.max()).total_seconds(), 1)
+    return stats
+
+
+def follow(engine, interval: float = POLL_SECONDS, max_polls: int = None, sleep=time.sleep, **poll_args):
+    """
+    Poll every `interval` seconds (measured start to start) until interrupted or `max_polls`
+    polls have run. A failed poll is reported and retried on the next tick; the watermark
+    only moves on success. Returns the stats of the last poll.
+    """
+    with engine.begin() as conn:
+        ensure(conn)
+    polls, stats = 0, None
+    while max_polls is None or polls < max_polls:
+        t0 = time.perf_counter()
+        try:
+            stats = poll_once(engine, **poll_args)
+            print(f"[follow] fetched {stats['fetched']}, inserted {stats['inserted']}, updated {stats['updated']}, "
+                  f"moved {stats['moved']}, unchanged {stats['skipped']}; watermark {stats['watermark']}"
+                  + (f", lag {stats['lag_s']}s" if stats["lag_s"] is not None else ""))
+        except Exception as e:
+            print(f"[follow] ✖ poll failed: {e}")
+        polls += 1
+        if max_polls is None or polls < max_polls:
+            sleep(max(0.0, interval - (time.perf_counter() - t0)))
+    return stats
@@ -2,7 +2,13 @@ import pandas as pd
 from pathlib import Path
 from columns_map import RENAME_MAP as rename_map
 from engine import get_engine
+from loader import upsert_df
+from main import ensure_table
+from dedup import SeenKeys
+from timeparse import parse_times
+from event_schema import to_events
 
+CHUNKSIZE = 100_000  # rows per chunk when streaming large files into the DB
 REQUIRED = ["source","time","month","category","latitude","longitude","depth","magnitude","region","dist_to_Tokyo"]
 
 def infer_source_from_name(path: Path) -> str:
@@ -31,9 +37,18 @@ def coalesce_dupes(frame: pd.DataFrame, colname: str) -> pd.DataFrame:
     frame[colname] = combined
     return frame
 
-def normalize_one_csv(csv_path: Path) -> pd.DataFrame:
-    """Read one CSV, normalize columns/types, and return clean dataframe."""
-    df = pd.read_csv(csv_path)
+def _fallback_times(values: pd.Series) -> pd.Series:
+    """Robust datetime parsing with fallbacks (utc, then naive, then dayfirst)."""
+    t0 = pd.to_datetime(values, utc=True, errors="coerce")
+    if t0.isna().mean() > 0.5:
+        t0 = pd.to_datetime(values, errors="coerce")
+    if t0.isna().mean() > 0.5:
+        t0 = pd.to_datetime(values, errors="coerce", dayfirst=True)
+    return pd.to_datetime(t0, utc=True, errors="coerce")
+
+def _normalize(df: pd.DataFrame, csv_path: Path) -> pd.DataFrame:
+    """Normalize columns/types of a raw frame (whole file or one chunk) and drop rows missing key fields."""
+    header = tuple(df.columns)
 
     # Ensure/patch source
     inferred = infer_source_from_name(csv_path)
@@ -54,13 +69,8 @@ def normalize_one_csv(csv_path: Path) -> pd.DataFrame:
         if c not in df.columns:
             df[c] = None
 
-    # Robust datetime parsing with fallbacks
-    t0 = pd.to_datetime(df["time"], utc=True, errors="coerce")
-    if t0.isna().mean() > 0.5:
-        t0 = pd.to_datetime(df["time"], errors="coerce")
-    if t0.isna().mean() > 0.5:
-        t0 = pd.to_datetime(df["time"], errors="coerce", dayfirst=True)
-    df["time"] = pd.to_datetime(t0, utc=True, errors="coerce").dt.tz_convert(None)
+    # Datetime parsing: one pass with the detected (and cached) format, fallbacks only for misses
+    df["time"] = parse_times(df["time"], key=(inferred,) + header, fallback=_fallback_times)
 
     # Clean distance like "380.5 km" and cast numerics
     if "dist_to_Tokyo" in df.columns:
@@ -80,12 +90,15 @@ def normalize_one_csv(csv_path: Path) -> pd.DataFrame:
     except Exception:
         pass
 
-    # Keep only required columns (ordered)
-    df = df[REQUIRED]
+    # Keep only required columns (ordered, typed as event_schema.DTYPES), drop rows missing key fields
+    return to_events(df[REQUIRED]).dropna(subset=["time","latitude","longitude"])
+
+def normalize_one_csv(csv_path: Path) -> pd.DataFrame:
+    """Read one CSV, normalize columns/types, and return clean dataframe."""
+    df = pd.read_csv(csv_path)
 
-    # Drop rows missing key fields
     before = len(df)
-    df = df.dropna(subset=["time","latitude","longitude"])
+    df = _normalize(df, csv_path)
     dropped = before - len(df)
 
     # De-duplicate
@@ -96,6 +109,25 @@ def normalize_one_csv(csv_path: Path) -> pd.DataFrame:
     print(f"  - {csv_path.name}: {before} rows, dropped {dropped} invalid, removed {removed_dups} dups -> {len(df)} kept")
     return df
 
+def iter_normalize_one_csv(csv_path: Path, chunksize: int = CHUNKSIZE):
+    """
+    Streaming normalize_one_csv: yields clean chunks of at most `chunksize` rows.
+    De-duplication is exact across chunks (same rows kept as normalize_one_csv).
+    """
+    seen = SeenKeys()
+    before = dropped = removed_dups = kept = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        before += len(chunk)
+        df = _normalize(chunk, csv_path)
+        dropped += len(chunk) - len(df)
+        new = seen.filter_new(df)
+        removed_dups += int((~new).sum())
+        df = df[new]
+        kept += len(df)
+        yield df
+
+    print(f"  - {csv_path.name}: {before} rows, dropped {dropped} invalid, removed {removed_dups} dups -> {kept} kept")
+
 def main():
     folder = Path("src/df")
     files = sorted(p for p in folder.glob("*.csv") if p.is_file())
@@ -105,32 +137,23 @@ def main():
         return
 
     print(f"📂 Found {len(files)} CSV file(s) in {folder}")
-    frames = []
+
+    # Stream each file into MySQL chunk by chunk (memory stays ~one chunk; safe to re-run)
+    engine = get_engine()
+    ensure_table(engine)
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
     for f in files:
         try:
-            frames.append(normalize_one_csv(f))
+            with engine.begin() as conn:
+                for df in iter_normalize_one_csv(f):
+                    counts = upsert_df(conn, df, "earthquakes")
+                    for k in totals:
+                        totals[k] += counts[k]
         except Exception as e:
             print(f"  ✖ Failed on {f.name}: {e}")
 
-    if not frames:
-        print("⚠ No valid dataframes to insert.")
-        return
-
-    df_all = pd.concat(frames, ignore_index=True)
-    print(f"[merge] Total rows to insert: {len(df_all)}")
-
-    # Insert into MySQL
-    engine = get_engine()
-    with engine.begin() as conn:
-        df_all.to_sql(
-            name="earthquakes",
-            con=conn,
-            if_exists="append",
-            index=False,
-            chunksize=1000
-        )
-
-    print(f"✔ Inserted {len(df_all)} rows into MySQL table 'earthquakes'.")
+    print(f"✔ Inserted {totals['inserted']}, updated {totals['updated']}, "
+          f"unchanged {totals['skipped']} rows in MySQL table 'earthquakes'.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
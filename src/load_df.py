@@ -2,6 +2,8 @@ import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.engine import URL
 from columns_map import RENAME_MAP as rename_map
+from loader import upsert_df
+from main import ensure_table
 
 df = pd.read_csv("japan_clean_dataset.csv")
 
@@ -37,14 +39,12 @@ url = URL.create(
     query = {"charset": "utf8mb4"},
 )
 engine = create_engine(url)
+# the upsert also maintains the rollup / table_versions tables: make sure they exist first
+ensure_table(engine, "earthquakes")
 
-# Insert data
-df.to_sql(
-    name = "earthquakes",
-    con = engine,
-    if_exists = "append",
-    index = False,
-    chunksize = 1000
-)
+# Upsert data (re-running the script updates rows instead of failing on duplicates)
+with engine.begin() as conn:
+    counts = upsert_df(conn, df, "earthquakes")
 
-print("Data successfully loaded into MySQL table.")
\ No newline at end of file
+print(f"Data successfully loaded into MySQL table: {counts['inserted']} inserted, "
+      f"{counts['updated']} updated, {counts['skipped']} unchanged.")
\ No newline at end of file
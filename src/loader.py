@@ -0,0 +1,197 @@
+"""
+Bulk, idempotent loader for the `earthquakes` table.
+
+Rows are written with one prepared INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT ... DO
+UPDATE on SQLite) against uq_src_time_lat_lon, run with executemany over each batch, so
+re-loading an overlapping USGS/EMSC/GEOFON window updates rows in place instead of failing
+the whole file on the first duplicate. The keys of a batch are staged in a temporary
+table and joined to the target to find the rows already stored.
+
+Usage:
+  from loader import upsert_df, BatchTuner
+  with engine.begin() as conn:
+      counts = upsert_df(conn, df, "earthquakes")
+  # counts -> {"inserted": 10, "updated": 2, "skipped": 35}
+"""
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from event_schema import widen
+import rollups
+import table_versions
+
+KEY = ["source", "time", "latitude", "longitude"]
+COLUMNS = ["source", "time", "month", "category", "latitude", "longitude", "depth", "magnitude", "region", "dist_to_Tokyo"]
+VALUES = [c for c in COLUMNS if c not in KEY]
+KEYS_TABLE = "upsert_keys"
+KEYS_DDL = f"""
+CREATE TEMPORARY TABLE IF NOT EXISTS {KEYS_TABLE} (
+  n INT NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  `time` DATETIME NOT NULL,
+  latitude DOUBLE NOT NULL,
+  longitude DOUBLE NOT NULL
+)"""
+
+
+class BatchTuner:
+    """
+    Pick the rows-per-statement for the next batch from the throughput of the last one.
+    Keeps growing (x2) while rows/sec improves and turns around when it drops by >10%.
+    """
+    def __init__(self, size: int = 500, min_size: int = 100, max_size: int = 20000):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self._rate = 0.0
+        self._step = 2.0
+
+    def record(self, rows: int, seconds: float):
+        if rows < self.size:
+            return  # short tail batch says nothing about the batch size
+        rate = rows / seconds if seconds > 0 else float("inf")
+        if rate < self._rate * 0.9:
+            self._step = 1 / self._step
+        self._rate = rate
+        self.size = int(min(self.max_size, max(self.min_size, self.size * self._step)))
+
+
+def quote(col: str) -> str:
+    """Backtick-quoted column name (MySQL syntax; SQLite accepts it too)."""
+    return f"`{col}`"
+
+
+def to_rows(df: pd.DataFrame) -> list:
+    """DataFrame -> list of tuples of Python values (datetime.datetime, None for NaN/NaT)."""
+    columns = []
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            values = s.to_numpy().astype("datetime64[us]").astype(object)  # datetime.datetime, NaT -> None
+        else:
+            values = s.to_numpy(dtype=object)
+        columns.append(np.where(s.notna().to_numpy(), values, None).tolist())
+    return list(zip(*columns))
+
+
+def db_time(values) -> pd.Series:
+    """Times rounded to whole seconds, the precision the DATETIME key column stores."""
+    return (pd.to_datetime(values) + pd.Timedelta(milliseconds=500)).dt.floor("s")
+
+
+def insert_sql(conn, table: str, columns: list) -> str:
+    """Single-row INSERT with the driver's own placeholders, for executemany (see insert_rows)."""
+    mark = {"qmark": "?", "format": "%s", "pyformat": "%s"}[conn.dialect.paramstyle]
+    return (f"INSERT INTO {table} ({', '.join(quote(c) for c in columns)}) "
+            f"VALUES ({', '.join([mark] * len(columns))})")
+
+
+def insert_rows(conn, sql: str, rows: list):
+    """
+    Run one prepared statement over all `rows` (tuples) with the driver's executemany.
+    Goes straight to the DB-API cursor: binding rows through text() costs more than
+    the insert itself on large batches.
+    """
+    if rows:
+        conn.exec_driver_sql(sql, rows)
+
+
+def _existing_rows(conn, table: str, batch: pd.DataFrame) -> pd.DataFrame:
+    """
+    The stored non-key columns of the rows of `table` whose unique key matches a row of
+    `batch`, indexed by that row's position in `batch`.
+    """
+    conn.execute(text(KEYS_DDL))  # temporary: one per connection, gone when it closes
+    conn.execute(text(f"DELETE FROM {KEYS_TABLE}"))
+    keys = [(n, *row) for n, row in enumerate(to_rows(batch[KEY]))]
+    insert_rows(conn, insert_sql(conn, KEYS_TABLE, ["n"] + KEY), keys)
+    on = " AND ".join(f"e.{quote(c)} = k.{quote(c)}" for c in KEY)
+    sql = (f"SELECT k.n, {', '.join(f'e.{quote(c)}' for c in VALUES)} "
+           f"FROM {KEYS_TABLE} k JOIN {table} e ON {on}")
+    old = pd.DataFrame(conn.execute(text(sql)).all(), columns=["n"] + VALUES)
+    old = old.set_index(old["n"].astype("int64")).drop(columns="n")
+    for c in ["depth", "magnitude", "dist_to_Tokyo"]:
+        old[c] = pd.to_numeric(old[c], errors="coerce")
+    return old
+
+
+def _changed(new: pd.DataFrame, old: pd.DataFrame) -> pd.Series:
+    """Null-safe 'any non-key column differs' for two aligned frames."""
+    diff = pd.Series(False, index=new.index)
+    for c in VALUES:
+        a, b = new[c], old[c]
+        same = (a == b) | (a.isna() & b.isna())
+        diff |= ~same.fillna(False).astype(bool)
+    return diff
+
+
+def _upsert_sql(conn, table: str) -> str:
+    sql = insert_sql(conn, table, COLUMNS) + " "
+    if conn.dialect.name == "sqlite":
+        updates = ", ".join(f"{quote(c)}=excluded.{quote(c)}" for c in VALUES)
+        return sql + f"ON CONFLICT ({', '.join(quote(c) for c in KEY)}) DO UPDATE SET {updates}"
+    updates = ", ".join(f"{quote(c)}=VALUES({quote(c)})" for c in VALUES)
+    return sql + f"ON DUPLICATE KEY UPDATE {updates}"
+
+
+def upsert_batch(conn, batch: pd.DataFrame, table: str = "earthquakes", update_rollups: bool = True) -> dict:
+    """
+    Upsert one batch (unique keys). Rows whose key is new are inserted, rows whose key exists
+    with different values are updated, and rows identical to what is stored are skipped
+    (they are not sent to the server at all). The rollup tables get the written rows
+    added and the replaced versions of updated rows subtracted (see rollups.py).
+    """
+    batch = batch.reset_index(drop=True)
+    found = _existing_rows(conn, table, batch)
+    exists = np.zeros(len(batch), dtype=bool)
+    exists[found.index.to_numpy()] = True
+    old = found.reindex(batch.index)
+    changed = exists & _changed(batch, old).to_numpy()
+
+    to_write = batch[~exists | changed]
+    if len(to_write):
+        insert_rows(conn, _upsert_sql(conn, table), to_rows(to_write))
+        if update_rollups:
+            replaced = pd.concat([batch.loc[changed, KEY], old.loc[changed, VALUES]], axis=1)[COLUMNS]
+            rollups.apply_delta(conn, to_write, replaced)
+
+    return {
+        "inserted": int((~exists).sum()),
+        "updated": int(changed.sum()),
+        "skipped": int((exists & ~changed).sum()),
+    }
+
+
+def upsert_df(conn, df: pd.DataFrame, table: str = "earthquakes", tuner: BatchTuner = None,
+              update_rollups: bool = True) -> dict:
+    """
+    Upsert a normalized frame (see main.build_df) in self-sizing batches.
+    `time` is rounded to whole seconds first, the precision the DATETIME column stores,
+    so keys compare equal to what is already in the table; categorical / float32 columns
+    are widened back to strings / exact float64s (event_schema.widen).
+    The rollup and table_versions tables must exist (main.ensure_table / rollups.ensure; not created here
+    because DDL would commit the caller's transaction on MySQL). update_rollups=False
+    leaves them alone (rebuild them later with rollups.py).
+    Loads that insert or update rows bump the table's version (table_versions.py).
+    Returns {"inserted", "updated", "skipped"} row counts.
+    """
+    tuner = tuner or BatchTuner()
+    df = widen(df[COLUMNS])
+    df["time"] = db_time(df["time"])
+    before = len(df)
+    df = df.drop_duplicates(subset=KEY)
+    counts = {"inserted": 0, "updated": 0, "skipped": before - len(df)}
+
+    start = 0
+    while start < len(df):
+        batch = df.iloc[start:start + tuner.size]
+        t0 = time.perf_counter()
+        got = upsert_batch(conn, batch, table, update_rollups)
+        tuner.record(len(batch), time.perf_counter() - t0)
+        for k in counts:
+            counts[k] += got[k]
+        start += len(batch)
+    if counts["inserted"] or counts["updated"]:
+        table_versions.bump(conn, table)
+    return counts
@@ -4,16 +4,35 @@ Main runner: ensure table, load CSVs from src/df (or given paths), and export DB
 Usage:
   python src/main.py
   python src/main.py --run-queries
+  python src/main.py --run-queries --query-workers 8 --no-query-cache
   python src/main.py --dir src/df --pattern "*.csv" --recursive
   python src/main.py file1.csv folderA/
   python src/main.py --export-path outputs/dump.csv
+  python src/main.py --export-format parquet --export-partition
+  python src/main.py --workers 4
+  python src/main.py --force          # reload files even if the manifest says unchanged
+  python src/main.py --chunksize 200000  # stream huge CSVs in fixed-size chunks
+  python src/main.py --store outputs/event_store  # also keep a local Parquet copy of the events
+  python src/main.py --metrics-out outputs/metrics.json --profile-dir outputs/profiles
 """
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 import pandas as pd
 from sqlalchemy import text
 from engine import get_engine
-from tables import DDL as MYSQL_DDL
+from tables import schema_ddl, VERSIONS_DDL
+from loader import upsert_df, BatchTuner
+from dedup import SeenKeys
+from timeparse import parse_times
+from exporter import FORMATS as EXPORT_FORMATS, ChunkWriter, PartitionedWriter, target_path
+import manifest
+import event_store
+import rollups
+from event_schema import to_events
+from instrument import Metrics, add_step, add_dropped, add_rows
+from query_runner import run_named_queries, REPORT_FILE
 import re
 from columns_map import RENAME_MAP as rename_map
 
@@ -22,7 +41,10 @@ REQUIRED = ["source","time","month","category","latitude","longitude","depth","m
 
 def ensure_table(engine, table="earthquakes"):
     with engine.begin() as conn:
-        conn.execute(text(MYSQL_DDL))
+        for ddl in schema_ddl(conn.dialect.name):
+            conn.execute(text(ddl))
+        conn.execute(text(VERSIONS_DDL))
+        rollups.ensure(conn, table)
     print(f"[init] ensured table `{table}`")
 
 def discover(paths, base: Path, pattern: str, recursive: bool):
@@ -44,13 +66,22 @@ def discover(paths, base: Path, pattern: str, recursive: bool):
             out.append(f); seen.add(r)
     return out
 
-def build_df(csv_path: Path):
-    df = pd.read_csv(csv_path)
+def normalize_frame(df: pd.DataFrame, stats: dict = None):
+    """
+    Rename/coerce one raw frame (a whole file or one chunk of it) to REQUIRED columns,
+    typed as event_schema.DTYPES.
+    With `stats`, adds rows in/out, dropped rows per rule and seconds per step to it.
+    """
+    t = time.perf_counter()
+    rows_in = len(df)
+    header = tuple(df.columns)  # files with the same header share one detected time format
     df = df.rename(columns={k:v for k,v in rename_map.items() if k in df.columns})
     for c in REQUIRED:
         if c not in df.columns:
             df[c] = None
-    df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce").dt.tz_convert(None)
+    t = add_step(stats, "rename", t)
+    df["time"] = parse_times(df["time"], key=header)
+    t = add_step(stats, "parse_times", t)
     if "dist_to_Tokyo" in df.columns:
         df["dist_to_Tokyo"] = (
             df["dist_to_Tokyo"].astype(str)
@@ -64,16 +95,189 @@ def build_df(csv_path: Path):
             df["month"] = df["time"].dt.month_name()
         except Exception:
             pass
-    df = df[REQUIRED].dropna(subset=["time","latitude","longitude"])
+    t = add_step(stats, "to_numeric", t)
+    df = to_events(df[REQUIRED])
+    t = add_step(stats, "typed", t)
+    if stats is not None:
+        # each dropped row is counted under the first rule it fails
+        gone = pd.Series(False, index=df.index)
+        for c in ["time", "latitude", "longitude"]:
+            miss = df[c].isna() & ~gone
+            add_dropped(stats, f"missing_{c}", miss.sum())
+            gone |= miss
+    df = df.dropna(subset=["time","latitude","longitude"])
+    before = len(df)
     df = df.drop_duplicates(subset=["source","time","latitude","longitude"])
+    add_dropped(stats, "duplicate_key", before - len(df))
+    add_step(stats, "dropna_dedup", t)
+    add_rows(stats, rows_in, len(df))
     return df
 
-def export_all(engine, table: str, out_path: Path):
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with engine.begin() as conn:
-        out = pd.read_sql(f"SELECT * FROM {table}", conn)
-    out.to_csv(out_path, index=False, encoding="utf-8-sig")
-    print(f"[export] {len(out):,} rows -> {out_path}")
+def build_df(csv_path: Path, stats: dict = None):
+    t = time.perf_counter()
+    raw = pd.read_csv(csv_path)
+    add_step(stats, "read_csv", t)
+    return normalize_frame(raw, stats)
+
+def iter_build_df(csv_path: Path, chunksize: int = 100_000, stats: dict = None):
+    """
+    Streaming build_df: read `chunksize` rows at a time and yield each normalized chunk.
+    Duplicates on (source, time, latitude, longitude) are removed exactly across chunk
+    boundaries, so the concatenated output equals build_df(csv_path).
+    """
+    seen = SeenKeys()
+    reader = iter(pd.read_csv(csv_path, chunksize=chunksize))
+    while True:
+        t = time.perf_counter()
+        chunk = next(reader, None)
+        add_step(stats, "read_csv", t)
+        if chunk is None:
+            return
+        df = normalize_frame(chunk, stats)
+        t = time.perf_counter()
+        new = seen.filter_new(df)
+        add_step(stats, "dedup_across_chunks", t)
+        add_dropped(stats, "duplicate_across_chunks", len(df) - new.sum())
+        if stats is not None:
+            stats["rows_out"] -= int(len(df) - new.sum())
+        yield df[new]
+
+def _build_with_stats(csv_path: Path):
+    """build_df in a worker process; returns the frame and its `build_df` stage record."""
+    metrics = Metrics()
+    with metrics.stage("build_df", file=str(csv_path)) as rec:
+        df = build_df(csv_path, rec)
+    return df, rec
+
+def _iter_chunks_recorded(csv_path: Path, chunksize: int, metrics: Metrics):
+    # parsing happens while the load loop consumes the chunks, so the stage is the sum of the parse steps
+    rec = {"file": str(csv_path)}
+    try:
+        yield from iter_build_df(csv_path, chunksize, rec)
+    except Exception as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        rec["seconds"] = round(sum(rec.get("steps", {}).values()), 4)
+        metrics.add("build_df", **rec)
+
+def iter_built(files, workers: int = 1, chunksize: int = None, metrics: Metrics = None):
+    """
+    Normalize files with build_df and yield (path, df, error) as each one finishes.
+    With workers > 1 files are parsed in a process pool; at most 2*workers frames
+    are in flight so finished frames never pile up faster than the writer drains them.
+    With chunksize, `df` is instead a lazy iterator of chunks (see iter_build_df).
+    Each file adds a `build_df` record to `metrics`.
+    """
+    metrics = metrics or Metrics()
+    if chunksize:
+        for f in files:
+            yield f, _iter_chunks_recorded(f, chunksize, metrics), None
+        return
+    if workers <= 1:
+        for f in files:
+            try:
+                with metrics.stage("build_df", file=str(f)) as rec:
+                    df = build_df(f, rec)
+            except Exception as e:
+                yield f, None, e
+                continue
+            yield f, df, None
+        return
+
+    pending = {}
+    todo = iter(files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for f in todo:
+            pending[pool.submit(_build_with_stats, f)] = f
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                f = pending.pop(fut)
+                try:
+                    df, rec = fut.result()
+                except Exception as e:
+                    metrics.add("build_df", file=str(f), error=f"{type(e).__name__}: {e}")
+                    yield f, None, e
+                else:
+                    metrics.add(rec.pop("stage"), **rec)
+                    yield f, df, None
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending[pool.submit(_build_with_stats, nxt)] = nxt
+
+def load_files(engine, files, table: str, workers: int = 1, fingerprints: dict = None, chunksize: int = None,
+               store: Path = None, metrics: Metrics = None):
+    """
+    Upsert every file into `table` through a single writer connection.
+    Each file is its own transaction, so one bad file does not roll back the others
+    (in streaming mode too: a bad chunk rolls back the chunks already sent for that file).
+    Files with an entry in `fingerprints` (see manifest.plan_loads) are recorded in
+    the ingest manifest in that same transaction. With `store`, the same normalized
+    frames are also written to the local Parquet event store (see event_store.py).
+    Every file adds a `load` record (and a `build_df` one) to `metrics`.
+    Returns total {"inserted", "updated", "skipped"} counts.
+    """
+    metrics = metrics or Metrics()
+    tuner = BatchTuner()
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
+    with engine.connect() as conn:
+        for i, (f, df, err) in enumerate(iter_built(files, workers, chunksize, metrics), 1):
+            if err is None:
+                try:
+                    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+                    rows = 0
+                    if store:
+                        event_store.remove_file(store, event_store.file_tag(f))
+                    with metrics.stage("load", file=str(f)) as rec, conn.begin():
+                        for n, part in enumerate([df] if isinstance(df, pd.DataFrame) else df):
+                            got = upsert_df(conn, part, table, tuner)
+                            if store:
+                                event_store.write_events(store, part, event_store.file_tag(f), n)
+                            for k in counts:
+                                counts[k] += got[k]
+                            rows += len(part)
+                        if fingerprints and f in fingerprints:
+                            manifest.record(conn, fingerprints[f], rows)
+                        rec.update(rows_in=rows, rows_out=counts["inserted"] + counts["updated"], **counts)
+                    for k in totals:
+                        totals[k] += counts[k]
+                    print(f"[{i}/{len(files)}] +{counts['inserted']} ~{counts['updated']} ={counts['skipped']} from {f}")
+                    continue
+                except Exception as e:
+                    err = e
+                    if store:
+                        event_store.remove_file(store, event_store.file_tag(f))
+            print(f"[{i}/{len(files)}] FAILED {f}: {err}")
+    return totals
+
+def export_all(engine, table: str, out_path: Path, fmt: str = "csv", partition: bool = False,
+               chunksize: int = 50_000, metrics: Metrics = None):
+    """
+    Stream `table` out through a server-side cursor, `chunksize` rows at a time,
+    so peak memory is about one chunk. fmt is one of exporter.FORMATS; with
+    partition=True files are split by source and month under a directory.
+    """
+    metrics = metrics or Metrics()
+    out_path = target_path(out_path, fmt)
+    if partition:
+        out_path = out_path.with_name(out_path.name.split(".")[0])
+        writer = PartitionedWriter(out_path, fmt)
+    else:
+        writer = ChunkWriter(out_path, fmt)
+    with metrics.stage("export", file=str(out_path)) as rec:
+        try:
+            with engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True)
+                for chunk in pd.read_sql(f"SELECT * FROM {table}", conn, chunksize=chunksize, parse_dates=["time"]):
+                    writer.write(chunk)
+        finally:
+            writer.close()
+        rec["rows_out"] = writer.rows
+    where = f"{out_path}/ ({writer.partitions} partitions)" if partition else out_path
+    print(f"[export] {writer.rows:,} rows -> {where}")
 
 
 
@@ -99,18 +303,20 @@ def parse_named_queries(sql_text: str):
             named.append((name, sql))
     return named
 
-def run_queries_and_export(engine, sql_path: str, out_dir: str):
+def run_queries_and_export(engine, sql_path: str, out_dir: str, workers: int = 4, table: str = "earthquakes",
+                           use_cache: bool = True, metrics: Metrics = None):
     """
-    Run each named SELECT in sql_path and export to {out_dir}/{name}.csv
+    Run each named SELECT in sql_path (`workers` at a time) and export to {out_dir}/{name}.csv.
+    Queries whose text and source tables are unchanged since the last run are served from the
+    previous CSV; timings go to {out_dir}/run_report.json (see query_runner.py) and, per
+    query, to `metrics` as `query` records next to the whole `queries` stage.
     """
+    metrics = metrics or Metrics()
     sql_file = Path(sql_path)
     if not sql_file.exists():
         print(f"[queries] File not found: {sql_file}. Skipping.")
         return
 
-    p = Path(out_dir)
-    p.mkdir(parents=True, exist_ok=True)
-
     text = sql_file.read_text(encoding="utf-8")
     queries = parse_named_queries(text)
     print(f"[queries] Found {len(queries)} named SELECT query(ies) in {sql_file}.")
@@ -119,19 +325,21 @@ def run_queries_and_export(engine, sql_path: str, out_dir: str):
         print(f"[queries] No named queries found in {sql_path}. Use lines like:  -- name: my_query")
         return
 
-    with engine.begin() as conn:
-        for i, (name, sql) in enumerate(queries, 1):
-            # فقط SELECT ها را خروجی بگیریم (ایمن‌تر)
-            if not sql.strip().lower().startswith("select"):
-                print(f"[queries] Skipped non-SELECT: {name}")
-                continue
-            try:
-                df = pd.read_sql(sql, conn)
-                out_file = p / f"{name}.csv"
-                df.to_csv(out_file, index=False, encoding="utf-8-sig")
-                print(f"[queries] ({i}/{len(queries)}) wrote {out_file}  rows={len(df)}")
-            except Exception as e:
-                print(f"[queries] ({i}/{len(queries)}) FAILED {name}: {e}")
+    with metrics.stage("queries", file=str(sql_file)) as rec:
+        report = run_named_queries(engine, queries, out_dir, workers, table, use_cache)
+        rec["rows_out"] = sum(q.get("rows", 0) for q in report["queries"])
+    for q in report["queries"]:
+        fields = {k: q[k] for k in ("status", "seconds", "bytes", "error") if k in q}
+        metrics.add("query", file=q["name"], rows_out=q.get("rows", 0), **fields)
+    for i, q in enumerate(report["queries"], 1):
+        if q["status"] == "skipped":
+            print(f"[queries] Skipped non-SELECT: {q['name']}")
+        elif q["status"] == "failed":
+            print(f"[queries] ({i}/{len(queries)}) FAILED {q['name']}: {q['error']}")
+        else:
+            print(f"[queries] ({i}/{len(queries)}) {q['status']} {Path(out_dir) / (q['name'] + '.csv')}  "
+                  f"rows={q['rows']}  {q['seconds']:.3f}s")
+    print(f"[queries] {len(queries)} queries in {report['seconds']:.2f}s -> {Path(out_dir) / REPORT_FILE}")
 
 
 
@@ -144,6 +352,18 @@ def main():
     ap.add_argument("--recursive", action="store_true")
     ap.add_argument("--table", default="earthquakes")
     ap.add_argument("--export-path", default="outputs/earthquakes_export.csv")
+    ap.add_argument("--export-format", default="csv", choices=EXPORT_FORMATS,
+                    help="Export file format (default: csv)")
+    ap.add_argument("--export-partition", action="store_true",
+                    help="Write the export as source=<S>/year_month=<YYYY-MM>/ partitions under a directory")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Parse CSVs in N worker processes (default: 1, no pool)")
+    ap.add_argument("--chunksize", type=int, default=None,
+                    help="Stream each CSV in chunks of N rows instead of reading it whole (bounded memory)")
+    ap.add_argument("--store", default=None,
+                    help="Also write loaded events to a local Parquet store at this directory (e.g. outputs/event_store)")
+    ap.add_argument("--force", action="store_true",
+                    help="Load every discovered CSV, even ones the ingest manifest marks unchanged")
 
     ap.add_argument("--queries", default="src/queries.sql",
                     help="Path to .sql file with named queries (default: src/queries.sql)")
@@ -151,35 +371,70 @@ def main():
                     help="Directory to save per-query CSVs (default: outputs/queries)")
     ap.add_argument("--run-queries", action="store_true",
                     help="Run queries from --queries and export each to CSV")
+    ap.add_argument("--query-workers", type=int, default=4,
+                    help="Run up to N named queries at once, one pooled connection each (default: 4)")
+    ap.add_argument("--no-query-cache", action="store_true",
+                    help="Re-run every query even if its table versions are unchanged since the last run")
+    ap.add_argument("--metrics-out", default=None,
+                    help="Write per-stage / per-file timings, row counts and peak RSS as JSON (e.g. outputs/metrics.json)")
+    ap.add_argument("--profile-dir", default=None,
+                    help="Also cProfile each stage and dump <stage>.prof files into this directory")
 
     args = ap.parse_args()
+    if args.chunksize and args.workers > 1:
+        ap.error("--chunksize streams files in this process; it cannot be combined with --workers")
 
+    metrics = Metrics(args.profile_dir)
     eng = get_engine()
     ensure_table(eng, args.table)
 
-    files = discover(args.inputs, Path(args.dir), args.pattern, args.recursive)
+    with metrics.stage("discover") as rec:
+        files = discover(args.inputs, Path(args.dir), args.pattern, args.recursive)
+        rec["rows_out"] = len(files)
     if files:
         print(f"[load] Found {len(files)} CSV(s).")
-        total = 0
-        for i, f in enumerate(files, 1):
-            try:
-                df = build_df(f)
-                with eng.begin() as conn:
-                    df.to_sql(args.table, conn, if_exists="append", index=False, chunksize=1000)
-                total += len(df)
-                print(f"[{i}/{len(files)}] +{len(df)} from {f}")
-            except Exception as e:
-                print(f"[{i}/{len(files)}] FAILED {f}: {e}")
-        print(f"[load] Total inserted: {total}")
+        found = len(files)
+        with metrics.stage("manifest", rows_in=found) as rec:
+            unchanged = files
+            files, fingerprints = manifest.plan_loads(eng, files, args.table, force=args.force)
+            unchanged = [f for f in unchanged if f not in fingerprints]
+            rec["rows_out"] = len(files)
+            add_dropped(rec, "unchanged", found - len(files))
+        print(f"[manifest] {len(files)} to load, {found - len(files)} unchanged skipped.")
+        totals = load_files(eng, files, args.table, args.workers, fingerprints, args.chunksize,
+                            Path(args.store) if args.store else None, metrics)
+        print(f"[load] Total inserted: {totals['inserted']}, updated: {totals['updated']}, unchanged: {totals['skipped']}")
+        if args.store:
+            # the manifest tracks the database only: unchanged files can still be missing from the store
+            missing = [f for f in unchanged if not event_store.has_file(args.store, event_store.file_tag(f))]
+            if missing:
+                print(f"[store] {len(missing)} unchanged CSV(s) missing from {args.store}")
+                with metrics.stage("store", files=len(missing)) as rec:
+                    rec["rows_out"] = event_store.store_files(Path(args.store), missing, args.chunksize)
     else:
         print("[load] No CSVs found in scan.")
     
 
     print(f"[queries] Running named queries from {args.queries} -> {args.queries_out}")
     if args.run_queries:
-        run_queries_and_export(eng, args.queries, args.queries_out)
+        run_queries_and_export(eng, args.queries, args.queries_out, args.query_workers, args.table,
+                               not args.no_query_cache, metrics)
 
-    export_all(eng, args.table, Path(args.export_path))
+    export_all(eng, args.table, Path(args.export_path), args.export_format, args.export_partition,
+               metrics=metrics)
+    if args.metrics_out:
+        report = metrics.write(args.metrics_out)
+    else:
+        report = metrics.report()
+        metrics.dump_profiles()
+    for name, st in report["stages"].items():
+        dropped = ", ".join(f"{k}={v}" for k, v in st["dropped"].items())
+        print(f"[metrics] {name:<10} {st['seconds']:>8.3f}s  in={st['rows_in']} out={st['rows_out']}"
+              + (f"  dropped: {dropped}" if dropped else ""))
+    if args.metrics_out:
+        print(f"[metrics] report -> {args.metrics_out}")
+    if args.profile_dir:
+        print(f"[metrics] profiles -> {args.profile_dir}/<stage>.prof")
     print("✅ Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""
+Ingestion manifest: remembers which CSVs were loaded into which table (path, table, size,
+mtime, sha256, rows) in the `ingest_manifest` table so later runs only parse new or changed
+files. Entries are per target table: a file loaded into `earthquakes` is still new to another.
+
+A file is considered unchanged when size and mtime match the manifest entry. If they
+differ but the content hash is the same (file was touched/copied), it is still skipped
+and the entry's mtime is refreshed so the next run does not hash it again.
+"""
+import hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlalchemy import text
+
+
+def file_sha256(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def needs_load(path: Path, entry: dict = None, table: str = "earthquakes"):
+    """
+    Compare a file on disk with its manifest entry for `table` (None if never loaded there).
+    Returns (changed, fingerprint) where fingerprint has path/table_name/size/mtime/sha256.
+    The hash is only computed when size or mtime differ from the entry.
+    """
+    st = Path(path).stat()
+    fp = {"path": str(Path(path).resolve()), "table_name": table, "size": st.st_size, "mtime": st.st_mtime,
+          "sha256": None}
+    if entry is not None and entry["size"] == fp["size"] and entry["mtime"] == fp["mtime"]:
+        fp["sha256"] = entry["sha256"]
+        return False, fp
+    fp["sha256"] = file_sha256(path)
+    if entry is not None and entry["size"] == fp["size"] and entry["sha256"] == fp["sha256"]:
+        return False, fp
+    return True, fp
+
+
+def load_manifest(conn, table: str = "earthquakes") -> dict:
+    """The manifest entries of the files loaded into `table`, by resolved path."""
+    rows = conn.execute(text("SELECT path, size, mtime, sha256, rows_loaded FROM ingest_manifest "
+                             "WHERE table_name = :table"), {"table": table}).mappings().all()
+    return {r["path"]: dict(r) for r in rows}
+
+
+def record(conn, fp: dict, rows_loaded: int):
+    """Insert or refresh the manifest entry for one file (call inside the file's transaction)."""
+    sql = ("INSERT INTO ingest_manifest (path, table_name, size, mtime, sha256, rows_loaded, loaded_at) "
+           "VALUES (:path, :table_name, :size, :mtime, :sha256, :rows_loaded, :loaded_at) ")
+    if conn.dialect.name == "sqlite":
+        sql += ("ON CONFLICT (path, table_name) DO UPDATE SET size=excluded.size, mtime=excluded.mtime, sha256=excluded.sha256, "
+                "rows_loaded=excluded.rows_loaded, loaded_at=excluded.loaded_at")
+    else:
+        sql += ("ON DUPLICATE KEY UPDATE size=VALUES(size), mtime=VALUES(mtime), sha256=VALUES(sha256), "
+                "rows_loaded=VALUES(rows_loaded), loaded_at=VALUES(loaded_at)")
+    conn.execute(text(sql), {**fp, "rows_loaded": rows_loaded, "loaded_at": datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)})
+
+
+def plan_loads(engine, files, table: str = "earthquakes", force: bool = False):
+    """
+    Split discovered files into the ones that must be parsed and loaded into `table`.
+    Returns (todo, fingerprints) where fingerprints maps each todo path to its fingerprint
+    (pass it to main.load_files so the manifest is updated in the same transaction).
+    """
+    with engine.begin() as conn:
+        known = load_manifest(conn, table)
+        todo, fingerprints = [], {}
+        for f in files:
+            entry = known.get(str(Path(f).resolve()))
+            changed, fp = needs_load(f, entry, table)
+            if changed or force:
+                todo.append(f)
+                fingerprints[f] = fp
+            elif entry["mtime"] != fp["mtime"]:
+                record(conn, fp, entry["rows_loaded"])  # touched but identical: remember new mtime
+    return todo, fingerprints
@@ -1,3 +1,6 @@
+-- Linear, heatmap, heatmap2, heatmapEx and quakes_by_month_region read the rollup tables the
+-- loader keeps up to date (see rollups.py); their full-scan versions are in queries_scan.sql.
+
 -- name: histogramS
 SELECT 
 source, magnitude
@@ -5,12 +8,12 @@ FROM earthquakes
 WHERE magnitude IS NOT NULL;
 
 -- name: Linear
-SELECT DATE(time) AS day,  -- تاریخ روز
-    COUNT(*) AS total_quakes, -- تعداد زلزله‌های آن روز
-    ROUND(AVG(magnitude), 2) AS avg_magnitude -- میانگین بزرگی زلزله‌ها
-FROM earthquakes
-WHERE magnitude IS NOT NULL
+SELECT day,  -- تاریخ روز
+    SUM(mag_quakes) AS total_quakes, -- تعداد زلزله‌های آن روز
+    ROUND(SUM(mag_sum) / SUM(mag_quakes), 2) AS avg_magnitude -- میانگین بزرگی زلزله‌ها
+FROM rollup_daily_source
 GROUP BY day
+HAVING SUM(mag_quakes) > 0
 ORDER BY day;
 
 -- name: Scattering
@@ -41,57 +44,43 @@ ORDER BY FIELD(depth_zone,
   
 -- name: heatmap
 SELECT 
-    ROUND(latitude, 1) AS lat,
-    ROUND(longitude, 1) AS lon,
-    COUNT(*) AS quake_count
-FROM earthquakes
-WHERE latitude IS NOT NULL 
-  AND longitude IS NOT NULL
+    lat,
+    lon,
+    SUM(quakes) AS quake_count
+FROM rollup_grid_source
 GROUP BY lat, lon
+HAVING SUM(quakes) > 0
 ORDER BY quake_count DESC;
 
 -- name: heatmap2
 SELECT
-  CASE
-    WHEN latitude < 28.8 THEN 'Lat 1 (24–28.8°N)'
-    WHEN latitude < 33.6 THEN 'Lat 2 (28.8–33.6°N)'
-    WHEN latitude < 38.4 THEN 'Lat 3 (33.6–38.4°N)'
-    ELSE 'Lat 4 (38.4–43.1°N)'
-  END AS lat_range,
-  CASE
-    WHEN longitude < 128.5 THEN 'Lon 1 (123–128.5°E)'
-    WHEN longitude < 134.0 THEN 'Lon 2 (128.5–134°E)'
-    WHEN longitude < 139.5 THEN 'Lon 3 (134–139.5°E)'
-    ELSE 'Lon 4 (139.5–145°E)'
-  END AS lon_range,
-
-  COUNT(*) AS quake_count
-FROM earthquakes
-WHERE latitude BETWEEN 24 AND 43.1
-  AND longitude BETWEEN 123 AND 145
+  lat_range,
+  lon_range,
+  SUM(quakes) AS quake_count
+FROM rollup_band_source
 GROUP BY lat_range, lon_range
+HAVING SUM(quakes) > 0
 ORDER BY lat_range, lon_range;
 
 -- name: heatmapEx
 SELECT	
-	FLOOR(dist_to_Tokyo / 50) * 50 AS distance_range,
-	COUNT(*) AS quake_count,
-	ROUND(AVG(magnitude), 2) AS avg_magnitude,
-	ROUND(AVG(depth), 1) AS avg_depth
-FROM earthquakes
-WHERE dist_to_Tokyo IS NOT NULL
-GROUP BY distance_range
+	distance_range,
+	quakes AS quake_count,
+	ROUND(mag_sum / NULLIF(mag_quakes, 0), 2) AS avg_magnitude,
+	ROUND(depth_sum / NULLIF(depth_quakes, 0), 1) AS avg_depth
+FROM rollup_distance_band
+WHERE quakes > 0
 ORDER BY distance_range;
 
 
 
 -- name: quakes_by_month_region
 SELECT 
-    month,
-    region,
-    COUNT(*) AS total_quakes
-FROM earthquakes
-GROUP BY month, region
+    NULLIF(month, '') AS month,
+    NULLIF(region, '') AS region,
+    quakes AS total_quakes
+FROM rollup_month_region
+WHERE quakes > 0
 ORDER BY month, total_quakes DESC;
 
 -- name: region_source_avg_magnitude
@@ -0,0 +1,64 @@
+-- Full-scan versions of the queries in queries.sql that read the rollup tables (see rollups.py).
+-- Same names and columns; handy for checking the rollups or on a database without them.
+
+-- name: Linear
+SELECT DATE(time) AS day,  -- تاریخ روز
+    COUNT(*) AS total_quakes, -- تعداد زلزله‌های آن روز
+    ROUND(AVG(magnitude), 2) AS avg_magnitude -- میانگین بزرگی زلزله‌ها
+FROM earthquakes
+WHERE magnitude IS NOT NULL
+GROUP BY day
+ORDER BY day;
+
+-- name: heatmap
+SELECT 
+    ROUND(latitude, 1) AS lat,
+    ROUND(longitude, 1) AS lon,
+    COUNT(*) AS quake_count
+FROM earthquakes
+WHERE latitude IS NOT NULL 
+  AND longitude IS NOT NULL
+GROUP BY lat, lon
+ORDER BY quake_count DESC;
+
+-- name: heatmap2
+SELECT
+  CASE
+    WHEN latitude < 28.8 THEN 'Lat 1 (24–28.8°N)'
+    WHEN latitude < 33.6 THEN 'Lat 2 (28.8–33.6°N)'
+    WHEN latitude < 38.4 THEN 'Lat 3 (33.6–38.4°N)'
+    ELSE 'Lat 4 (38.4–43.1°N)'
+  END AS lat_range,
+  CASE
+    WHEN longitude < 128.5 THEN 'Lon 1 (123–128.5°E)'
+    WHEN longitude < 134.0 THEN 'Lon 2 (128.5–134°E)'
+    WHEN longitude < 139.5 THEN 'Lon 3 (134–139.5°E)'
+    ELSE 'Lon 4 (139.5–145°E)'
+  END AS lon_range,
+
+  COUNT(*) AS quake_count
+FROM earthquakes
+WHERE latitude BETWEEN 24 AND 43.1
+  AND longitude BETWEEN 123 AND 145
+GROUP BY lat_range, lon_range
+ORDER BY lat_range, lon_range;
+
+-- name: heatmapEx
+SELECT	
+	FLOOR(dist_to_Tokyo / 50) * 50 AS distance_range,
+	COUNT(*) AS quake_count,
+	ROUND(AVG(magnitude), 2) AS avg_magnitude,
+	ROUND(AVG(depth), 1) AS avg_depth
+FROM earthquakes
+WHERE dist_to_Tokyo IS NOT NULL
+GROUP BY distance_range
+ORDER BY distance_range;
+
+-- name: quakes_by_month_region
+SELECT 
+    month,
+    region,
+    COUNT(*) AS total_quakes
+FROM earthquakes
+GROUP BY month, region
+ORDER BY month, total_quakes DESC;
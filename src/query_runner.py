@@ -0,0 +1,122 @@
+"""
+Run the named queries of a .sql file concurrently and export each to {out_dir}/{name}.csv.
+
+Every query gets its own pooled connection, so `workers` queries run at once. A run writes
+{out_dir}/run_report.json with wall time, rows, bytes and rows/s per query.
+
+Results are cached: {out_dir}/query_cache.json remembers, per query, a key made of the
+query text, the table_versions snapshot (bumped by every load) and the highest `id` in
+the events table. When the key is unchanged and the CSV is still there, the query is not
+run again and the previous output is reported as "cached".
+
+Usage:
+  from query_runner import run_named_queries
+  report = run_named_queries(engine, queries, "outputs/queries", workers=4)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+import pandas as pd
+from sqlalchemy import text
+import table_versions
+
+CACHE_FILE = "query_cache.json"
+REPORT_FILE = "run_report.json"
+
+
+def data_state(conn, table: str = "earthquakes") -> dict:
+    """What the cache keys depend on: table versions plus the high-water mark of `table`."""
+    high_water = conn.execute(text(f"SELECT MAX(id) FROM {table}")).scalar()
+    return {"versions": table_versions.snapshot(conn), "high_water": None if high_water is None else int(high_water)}
+
+
+def cache_key(sql: str, state: dict) -> str:
+    payload = json.dumps({"sql": sql, "state": state}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _run_one(engine, name: str, sql: str, out_file: Path) -> dict:
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        df = pd.read_sql(sql, conn)
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, out_file)  # a failed run never leaves a half-written CSV behind
+    seconds = time.perf_counter() - t0
+    return {"rows": len(df), "bytes": out_file.stat().st_size, "seconds": round(seconds, 4),
+            "rows_per_s": round(len(df) / seconds, 1) if seconds > 0 else None}
+
+
+def run_named_queries(engine, queries, out_dir, workers: int = 4, table: str = "earthquakes",
+                      use_cache: bool = True) -> dict:
+    """
+    queries: list of (name, sql) (see main.parse_named_queries). Non-SELECT blocks are skipped.
+    Returns the run report (also written to {out_dir}/run_report.json).
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    cache_path = out / CACHE_FILE
+    cache = _load_json(cache_path) if use_cache else {}
+
+    started = datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        state = data_state(conn, table)
+
+    results, todo = {}, []
+    for name, sql in queries:
+        out_file = out / f"{name}.csv"
+        if not sql.strip().lower().startswith("select"):
+            results[name] = {"status": "skipped", "reason": "not a SELECT"}
+            continue
+        key = cache_key(sql, state)
+        hit = cache.get(name)
+        if hit and hit.get("key") == key and out_file.exists():
+            results[name] = {"status": "cached", "rows": hit["rows"], "bytes": out_file.stat().st_size,
+                             "seconds": 0.0, "rows_per_s": None}
+            continue
+        todo.append((name, sql, out_file, key))
+
+    def run(item):
+        name, sql, out_file, key = item
+        try:
+            return name, key, {"status": "ran", **_run_one(engine, name, sql, out_file)}
+        except Exception as e:
+            return name, key, {"status": "failed", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for name, key, res in ex.map(run, todo):
+            results[name] = res
+            if res["status"] == "ran":
+                cache[name] = {"key": key, "rows": res["rows"]}
+            else:
+                cache.pop(name, None)
+
+    report = {
+        "started_at": started.isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - t0, 4),
+        "workers": workers,
+        "data_state": state,
+        "queries": [{"name": name, **results[name]} for name, _ in queries],
+    }
+    if use_cache:
+        _write_json(cache_path, cache)
+    _write_json(out / REPORT_FILE, report)
+    return report
@@ -0,0 +1,165 @@
+"""
+Rollup tables for the queries.sql workloads, maintained incrementally by the loader.
+
+Every upserted batch is turned into signed rows (+1 for the rows written, -1 for the
+previous version of updated rows) in a per-connection temporary table, and each rollup
+adds the grouped deltas with INSERT ... SELECT ... GROUP BY ... ON DUPLICATE KEY UPDATE.
+The group keys use the same SQL expressions as the original full-scan queries (kept in
+queries_scan.sql), so the rollup queries return the same rows.
+
+  rollup_daily_source    DATE(time) x source             -> Linear
+  rollup_grid_source     ROUND(lat, 1), ROUND(lon, 1) x source -> heatmap
+  rollup_band_source     heatmap2 lat/lon bands x source -> heatmap2
+  rollup_distance_band   FLOOR(dist_to_Tokyo / 50) * 50  -> heatmapEx
+  rollup_month_region    month x region                  -> quakes_by_month_region
+
+Usage:
+  python src/rollups.py --rebuild        # recompute every rollup from `earthquakes`
+"""
+import argparse
+from sqlalchemy import text
+from tables import ROLLUP_DDL
+import table_versions
+
+DELTA_TABLE = "rollup_delta"
+DELTA_COLUMNS = ["source", "time", "month", "latitude", "longitude", "depth", "magnitude", "region", "dist_to_Tokyo"]
+DELTA_DDL = f"""
+CREATE TEMPORARY TABLE IF NOT EXISTS {DELTA_TABLE} (
+  w INT NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  `time` DATETIME NOT NULL,
+  month VARCHAR(20) NULL,
+  latitude DOUBLE NOT NULL,
+  longitude DOUBLE NOT NULL,
+  depth DOUBLE NULL,
+  magnitude DOUBLE NULL,
+  region VARCHAR(100) NULL,
+  dist_to_Tokyo DOUBLE NULL
+)"""
+
+# table -> group keys (name, expression), measures (name, expression with {w} = row weight), row filter
+ROLLUPS = {
+    "rollup_daily_source": {
+        "keys": [("day", "DATE(`time`)"), ("source", "source")],
+        "measures": [("quakes", "SUM({w})"),
+                     ("mag_quakes", "SUM(CASE WHEN magnitude IS NOT NULL THEN {w} ELSE 0 END)"),
+                     ("mag_sum", "SUM(COALESCE(magnitude, 0) * {w})")],
+        "where": "1 = 1",
+    },
+    "rollup_grid_source": {
+        "keys": [("lat", "ROUND(latitude, 1)"), ("lon", "ROUND(longitude, 1)"), ("source", "source")],
+        "measures": [("quakes", "SUM({w})")],
+        "where": "latitude IS NOT NULL AND longitude IS NOT NULL",
+    },
+    "rollup_band_source": {
+        "keys": [
+            ("lat_range", """CASE
+    WHEN latitude < 28.8 THEN 'Lat 1 (24–28.8°N)'
+    WHEN latitude < 33.6 THEN 'Lat 2 (28.8–33.6°N)'
+    WHEN latitude < 38.4 THEN 'Lat 3 (33.6–38.4°N)'
+    ELSE 'Lat 4 (38.4–43.1°N)'
+  END"""),
+            ("lon_range", """CASE
+    WHEN longitude < 128.5 THEN 'Lon 1 (123–128.5°E)'
+    WHEN longitude < 134.0 THEN 'Lon 2 (128.5–134°E)'
+    WHEN longitude < 139.5 THEN 'Lon 3 (134–139.5°E)'
+    ELSE 'Lon 4 (139.5–145°E)'
+  END"""),
+            ("source", "source"),
+        ],
+        "measures": [("quakes", "SUM({w})")],
+        "where": "latitude BETWEEN 24 AND 43.1 AND longitude BETWEEN 123 AND 145",
+    },
+    "rollup_distance_band": {
+        "keys": [("distance_range", "FLOOR(dist_to_Tokyo / 50) * 50")],
+        "measures": [("quakes", "SUM({w})"),
+                     ("mag_quakes", "SUM(CASE WHEN magnitude IS NOT NULL THEN {w} ELSE 0 END)"),
+                     ("mag_sum", "SUM(COALESCE(magnitude, 0) * {w})"),
+                     ("depth_quakes", "SUM(CASE WHEN depth IS NOT NULL THEN {w} ELSE 0 END)"),
+                     ("depth_sum", "SUM(COALESCE(depth, 0) * {w})")],
+        "where": "dist_to_Tokyo IS NOT NULL",
+    },
+    "rollup_month_region": {
+        # primary key columns cannot be NULL: NULL month/region are stored as '' (the queries map them back)
+        "keys": [("month", "COALESCE(month, '')"), ("region", "COALESCE(region, '')")],
+        "measures": [("quakes", "SUM({w})")],
+        "where": "1 = 1",
+    },
+}
+
+
+def _accumulate_sql(conn, table: str, source: str, weight: str) -> str:
+    """INSERT ... SELECT that adds the grouped `source` rows (each weighted by `weight`) to rollup `table`."""
+    spec = ROLLUPS[table]
+    keys = [k for k, _ in spec["keys"]]
+    measures = [m for m, _ in spec["measures"]]
+    select = [f"{expr} AS {k}" for k, expr in spec["keys"]]
+    select += [f"{expr.format(w=weight)} AS {m}" for m, expr in spec["measures"]]
+    positions = ", ".join(str(i) for i in range(1, len(keys) + 1))
+    sql = (f"INSERT INTO {table} ({', '.join(keys + measures)}) "
+           f"SELECT {', '.join(select)} FROM {source} WHERE {spec['where']} GROUP BY {positions} ")
+    if conn.dialect.name == "sqlite":
+        return sql + f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(f"{m} = {m} + excluded.{m}" for m in measures)
+    return sql + "ON DUPLICATE KEY UPDATE " + ", ".join(f"{m} = {m} + VALUES({m})" for m in measures)
+
+
+def ensure(conn, table: str = "earthquakes"):
+    """
+    Create the rollup tables if needed. If they are empty while `table` already has rows
+    (rollups added to an existing database), they are rebuilt first so later deltas start
+    from the right totals. Run it outside the load transactions: CREATE TABLE commits
+    the current transaction on MySQL.
+    """
+    table_versions.ensure(conn)
+    for ddl in ROLLUP_DDL:
+        conn.execute(text(ddl))
+    empty = conn.execute(text("SELECT 1 FROM rollup_daily_source LIMIT 1")).first() is None
+    if empty and conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is not None:
+        rebuild(conn, table)
+
+
+def apply_delta(conn, added, removed=None):
+    """
+    Add the rows of `added` to every rollup and subtract the rows of `removed`
+    (the stored versions of rows that were just updated). Both are frames with the
+    loader's columns; the rollup tables must exist (ensure).
+    """
+    from loader import to_rows, insert_sql, insert_rows
+    conn.execute(text(DELTA_DDL))  # temporary: one per connection, gone when it closes
+    conn.execute(text(f"DELETE FROM {DELTA_TABLE}"))
+    parts = [(1, added)] + ([(-1, removed)] if removed is not None and len(removed) else [])
+    rows = [(w, *r) for w, df in parts for r in to_rows(df[DELTA_COLUMNS])]
+    if not rows:
+        return
+    insert_rows(conn, insert_sql(conn, DELTA_TABLE, ["w"] + DELTA_COLUMNS), rows)
+    for table in ROLLUPS:
+        conn.execute(text(_accumulate_sql(conn, table, DELTA_TABLE, "w")))
+
+
+def rebuild(conn, table: str = "earthquakes"):
+    """Recompute every rollup from `table` (one grouped scan per rollup)."""
+    for rollup in ROLLUPS:
+        conn.execute(text(f"DELETE FROM {rollup}"))
+        conn.execute(text(_accumulate_sql(conn, rollup, table, "1")))
+        table_versions.bump(conn, rollup)  # cached query results built on the old rows are stale
+
+
+def main():
+    from engine import get_engine
+    ap = argparse.ArgumentParser(description="Maintain the rollup tables behind the named queries.")
+    ap.add_argument("--table", default="earthquakes")
+    ap.add_argument("--rebuild", action="store_true", help="Recompute every rollup from the events table")
+    args = ap.parse_args()
+
+    with get_engine().begin() as conn:
+        ensure(conn, args.table)
+        if args.rebuild:
+            rebuild(conn, args.table)
+            print(f"[rollups] rebuilt {len(ROLLUPS)} rollup tables from `{args.table}`")
+        for rollup in ROLLUPS:
+            n = conn.execute(text(f"SELECT COUNT(*) FROM {rollup}")).scalar()
+            print(f"[rollups] {rollup}: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
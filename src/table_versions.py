@@ -0,0 +1,28 @@
+"""
+Per-table change counters in `table_versions`.
+
+The loader bumps the counter of a table in the same transaction as every load that
+inserts or updates rows in it, so a (table, version) pair identifies its contents.
+"""
+from sqlalchemy import text
+from tables import VERSIONS_DDL
+
+
+def ensure(conn):
+    conn.execute(text(VERSIONS_DDL))
+
+
+def bump(conn, table: str):
+    """Increment the version of `table` (first bump creates it at 1)."""
+    sql = "INSERT INTO table_versions (table_name, version) VALUES (:t, 1) "
+    if conn.dialect.name == "sqlite":
+        sql += "ON CONFLICT (table_name) DO UPDATE SET version = version + 1"
+    else:
+        sql += "ON DUPLICATE KEY UPDATE version = version + 1"
+    conn.execute(text(sql), {"t": table})
+
+
+def snapshot(conn) -> dict:
+    """{table_name: version} for every table that has been loaded at least once."""
+    rows = conn.execute(text("SELECT table_name, version FROM table_versions")).all()
+    return {name: int(version) for name, version in rows}
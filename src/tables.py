@@ -27,6 +27,133 @@ CREATE TABLE IF NOT EXISTS earthquakes (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
+# one row per loaded CSV and target table: lets main.py skip files that have not changed
+# since they were last loaded into that table
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+  path VARCHAR(512) NOT NULL,
+  table_name VARCHAR(64) NOT NULL,
+  size BIGINT NOT NULL,
+  mtime DOUBLE NOT NULL,
+  sha256 CHAR(64) NOT NULL,
+  rows_loaded INT NOT NULL,
+  loaded_at DATETIME NOT NULL,
+  PRIMARY KEY (path, table_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# the same tables for the embedded SQLite backend (engine.get_engine with a sqlite:// URL):
+# no AUTO_INCREMENT / inline KEY / table options, indexes are separate statements
+SQLITE_DDL = [
+    """
+CREATE TABLE IF NOT EXISTS earthquakes (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  source VARCHAR(20) NOT NULL,
+  `time` DATETIME NOT NULL,
+  month VARCHAR(20) NULL,
+  category VARCHAR(20) NULL,
+  latitude DOUBLE NOT NULL,
+  longitude DOUBLE NOT NULL,
+  depth DOUBLE NULL,
+  magnitude DOUBLE NULL,
+  region VARCHAR(100) NULL,
+  dist_to_Tokyo DOUBLE NULL,
+  CONSTRAINT uq_src_time_lat_lon UNIQUE (source, `time`, latitude, longitude)
+)""",
+    "CREATE INDEX IF NOT EXISTS ix_time ON earthquakes (`time`)",
+    "CREATE INDEX IF NOT EXISTS ix_region ON earthquakes (region)",
+    "CREATE INDEX IF NOT EXISTS ix_magnitude ON earthquakes (magnitude)",
+    MANIFEST_DDL.replace(" ENGINE=InnoDB DEFAULT CHARSET=utf8mb4", ""),
+]
+
+
+# one counter per table, bumped by every load that changes it; query_runner.py keys its
+# result cache on these so unchanged queries are not re-run
+VERSIONS_DDL = """
+CREATE TABLE IF NOT EXISTS table_versions (
+  table_name VARCHAR(64) NOT NULL,
+  version BIGINT NOT NULL,
+  PRIMARY KEY (table_name)
+)"""
+
+# newest `updated` time ingested per live feed (see live.py); the next poll asks for
+# events updated after it
+WATERMARKS_DDL = """
+CREATE TABLE IF NOT EXISTS feed_watermarks (
+  feed VARCHAR(64) NOT NULL,
+  updated_after VARCHAR(32) NOT NULL,
+  polled_at DATETIME NOT NULL,
+  PRIMARY KEY (feed)
+)"""
+
+# the key of the row each followed feed event is stored under: a revision that moves an
+# event's time or hypocentre replaces that row instead of adding a second one
+FEED_EVENTS_DDL = """
+CREATE TABLE IF NOT EXISTS feed_events (
+  feed VARCHAR(64) NOT NULL,
+  event_id VARCHAR(64) NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  `time` DATETIME NOT NULL,
+  latitude DOUBLE NOT NULL,
+  longitude DOUBLE NOT NULL,
+  PRIMARY KEY (feed, event_id)
+)"""
+
+# aggregates the loader keeps up to date batch by batch (see rollups.py); the named
+# queries read these instead of scanning `earthquakes`. No table options, so the same
+# statements also run on SQLite (MySQL's default engine is InnoDB anyway).
+ROLLUP_DDL = [
+    """
+CREATE TABLE IF NOT EXISTS rollup_daily_source (
+  day DATE NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  quakes BIGINT NOT NULL,
+  mag_quakes BIGINT NOT NULL,
+  mag_sum DOUBLE NOT NULL,
+  PRIMARY KEY (day, source)
+)""",
+    """
+CREATE TABLE IF NOT EXISTS rollup_grid_source (
+  lat DOUBLE NOT NULL,
+  lon DOUBLE NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  quakes BIGINT NOT NULL,
+  PRIMARY KEY (lat, lon, source)
+)""",
+    """
+CREATE TABLE IF NOT EXISTS rollup_band_source (
+  lat_range VARCHAR(40) NOT NULL,
+  lon_range VARCHAR(40) NOT NULL,
+  source VARCHAR(20) NOT NULL,
+  quakes BIGINT NOT NULL,
+  PRIMARY KEY (lat_range, lon_range, source)
+)""",
+    """
+CREATE TABLE IF NOT EXISTS rollup_distance_band (
+  distance_range DOUBLE NOT NULL,
+  quakes BIGINT NOT NULL,
+  mag_quakes BIGINT NOT NULL,
+  mag_sum DOUBLE NOT NULL,
+  depth_quakes BIGINT NOT NULL,
+  depth_sum DOUBLE NOT NULL,
+  PRIMARY KEY (distance_range)
+)""",
+    """
+CREATE TABLE IF NOT EXISTS rollup_month_region (
+  month VARCHAR(20) NOT NULL,
+  region VARCHAR(100) NOT NULL,
+  quakes BIGINT NOT NULL,
+  PRIMARY KEY (month, region)
+)""",
+]
+
+def schema_ddl(dialect: str) -> list:
+    """CREATE statements for `earthquakes` and `ingest_manifest` on the given SQLAlchemy dialect name."""
+    if dialect == "sqlite":
+        return SQLITE_DDL
+    return [DDL, MANIFEST_DDL]
+
+
 def main():
     p = argparse.ArgumentParser(description="Create MySQL DB and 'earthquakes' table (no ORM).")
     p.add_argument("--db", required=True, help="Database name")
@@ -76,7 +203,19 @@ def main():
     try:
         with db_engine.begin() as conn:
             conn.execute(text(DDL))
+            conn.execute(text(MANIFEST_DDL))
+            conn.execute(text(VERSIONS_DDL))
+            conn.execute(text(WATERMARKS_DDL))
+            conn.execute(text(FEED_EVENTS_DDL))
+            for ddl in ROLLUP_DDL:
+                conn.execute(text(ddl))
             print("Table ensured: earthquakes")
+            print("Table ensured: ingest_manifest")
+            print("Table ensured: table_versions")
+            print("Table ensured: feed_watermarks")
+            print("Table ensured: feed_events")
+            print("Tables ensured: rollup_daily_source, rollup_grid_source, rollup_band_source, "
+                  "rollup_distance_band, rollup_month_region")
             print("Indexes and UNIQUE constraint created if missing.")
     except Exception as e:
         print("Could not create table 'earthquakes'.")
@@ -0,0 +1,256 @@
+"""
+Multi-resolution spatial binning: count, max magnitude and mean depth per lat/lon cell,
+for a pyramid of zoom levels built in one pass over the events.
+
+Zoom 0 is the grid of the `heatmap` query: cells centred on ROUND(latitude, 1),
+ROUND(longitude, 1). Zoom z merges 2^z x 2^z zoom-0 cells (0.1, 0.2, 0.4, ... 6.4 deg),
+so every level is exact, not resampled. Events are streamed from the table once; the
+coarser levels are reduced from zoom 0.
+
+Pyramids are cached in memory and under outputs/tiles/, keyed like the query results
+(query_runner.data_state: table_versions + MAX(id)) plus the filter, so any zoom level or
+bbox is served from the cache until the next load changes the table.
+
+Usage:
+  from tiles import build
+  pyr = build(engine, filters={"sources": ["USGS"], "min_mag": 3})
+  pyr.query(zoom=2, bbox=(30, 40, 135, 145))   # lat, lon, bounds, quake_count, max_magnitude, mean_depth
+  lats, lons, grid = pyr.grid(zoom=0, value="quake_count")
+
+  python src/tiles.py --zoom 3 --bbox 30 40 135 145 --out outputs/tiles/z3.csv
+"""
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from engine import get_engine
+from query_runner import cache_key, data_state
+
+CACHE_DIR = Path("outputs/tiles")
+LEVELS = 7            # zoom 0..6: 0.1 .. 6.4 degrees
+DECIMALS = 1          # zoom-0 cells: ROUND(x, 1)
+CHUNKSIZE = 200_000
+FIELDS = ["quake_count", "max_magnitude", "depth_sum", "depth_n"]
+
+_memory = {}
+
+
+def _round_half_away(x: np.ndarray, decimals: int) -> np.ndarray:
+    """ROUND as SQLite (and MySQL DECIMAL) do it: half away from zero on the printed value."""
+    scaled = np.abs(x) * 10.0 ** decimals
+    k = np.floor(scaled + 0.5)
+    # x*10^d is inexact; decide values near a .5 boundary on their shortest decimal instead
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        k[i] = float(Decimal(repr(abs(float(x[i])))).scaleb(decimals).quantize(Decimal(1), ROUND_HALF_UP))
+    return np.sign(x) * k
+
+
+def _round_half_even(x: np.ndarray, decimals: int) -> np.ndarray:
+    """ROUND of a MySQL DOUBLE: rint(x * 10^d), ties to even."""
+    return np.rint(x * 10.0 ** decimals)
+
+
+ROUNDING = {"sqlite": _round_half_away, "mysql": _round_half_even}
+
+
+def bin_index(values, decimals: int = DECIMALS, dialect: str = "sqlite") -> np.ndarray:
+    """Integer k with k / 10^decimals == ROUND(value, decimals) on `dialect`."""
+    rnd = ROUNDING.get(dialect, _round_half_away)
+    return rnd(np.asarray(values, dtype="float64"), decimals).astype(np.int64)
+
+
+def _reduce(lat_k, lon_k, count, max_mag, depth_sum, depth_n):
+    """Merge rows that share a cell. Returns the cell arrays sorted by (lat_k, lon_k)."""
+    key = np.stack([lat_k, lon_k])
+    cells, inv = np.unique(key, axis=1, return_inverse=True)
+    inv = inv.ravel()
+    n = cells.shape[1]
+    mx = np.full(n, np.nan)
+    np.fmax.at(mx, inv, max_mag)  # fmax skips NaN magnitudes
+    return {"lat_k": cells[0], "lon_k": cells[1],
+            "quake_count": np.bincount(inv, weights=count, minlength=n).astype(np.int64),
+            "max_magnitude": mx,
+            "depth_sum": np.bincount(inv, weights=depth_sum, minlength=n),
+            "depth_n": np.bincount(inv, weights=depth_n, minlength=n).astype(np.int64)}
+
+
+def _concat(parts: list) -> dict:
+    return {k: np.concatenate([p[k] for p in parts]) for k in ["lat_k", "lon_k"] + FIELDS}
+
+
+class TilePyramid:
+    def __init__(self, levels: list, decimals: int = DECIMALS, meta: dict = None):
+        self.levels = levels        # one dict of cell arrays per zoom level
+        self.decimals = decimals
+        self.meta = meta or {}
+
+    @classmethod
+    def from_chunks(cls, chunks, levels: int = LEVELS, decimals: int = DECIMALS, dialect: str = "sqlite",
+                    meta: dict = None):
+        """Build from frames with latitude / longitude / magnitude / depth, read once."""
+        parts = []
+        for df in chunks:
+            df = df[df["latitude"].notna() & df["longitude"].notna()]
+            if df.empty:
+                continue
+            depth = df["depth"].to_numpy("float64")
+            parts.append(_reduce(bin_index(df["latitude"], decimals, dialect),
+                                 bin_index(df["longitude"], decimals, dialect),
+                                 np.ones(len(df)), df["magnitude"].to_numpy("float64"),
+                                 np.nan_to_num(depth), (~np.isnan(depth)).astype(float)))
+        if parts:
+            base = _reduce(*_concat(parts).values())
+        else:
+            base = {k: np.array([], dtype=np.int64 if k in ("lat_k", "lon_k", "quake_count", "depth_n") else float)
+                    for k in ["lat_k", "lon_k"] + FIELDS}
+        pyramid = [base]
+        for _ in range(1, levels):
+            prev = pyramid[-1]
+            pyramid.append(_reduce(prev["lat_k"] // 2, prev["lon_k"] // 2,
+                                   *(prev[k] for k in FIELDS)))
+        return cls(pyramid, decimals, meta)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs):
+        return cls.from_chunks([df], **kwargs)
+
+    def resolution(self, zoom: int) -> float:
+        """Cell size in degrees at `zoom`."""
+        return 2 ** zoom / 10 ** self.decimals
+
+    def query(self, zoom: int = 0, bbox=None) -> pd.DataFrame:
+        """
+        Cells of one zoom level, sorted by (lat, lon); with bbox=(min_lat, max_lat, min_lon, max_lon),
+        only the cells that overlap it. lat / lon are cell centres.
+        """
+        if not 0 <= zoom < len(self.levels):
+            raise ValueError(f"zoom {zoom} not in the pyramid (0..{len(self.levels) - 1})")
+        cells = self.levels[zoom]
+        step, unit = 2 ** zoom, 10.0 ** -self.decimals
+        lo = {c: (cells[c + "_k"] * step - 0.5) * unit for c in ("lat", "lon")}
+        hi = {c: ((cells[c + "_k"] + 1) * step - 0.5) * unit for c in ("lat", "lon")}
+        out = pd.DataFrame({
+            "lat": (cells["lat_k"] * step + (step - 1) / 2) * unit,
+            "lon": (cells["lon_k"] * step + (step - 1) / 2) * unit,
+            "lat_min": lo["lat"], "lat_max": hi["lat"], "lon_min": lo["lon"], "lon_max": hi["lon"],
+            "quake_count": cells["quake_count"],
+            "max_magnitude": cells["max_magnitude"],
+            "mean_depth": np.divide(cells["depth_sum"], cells["depth_n"], out=np.full(len(cells["depth_n"]), np.nan),
+                                    where=cells["depth_n"] > 0),
+        })
+        if zoom == 0:
+            out[["lat", "lon"]] = out[["lat", "lon"]].round(self.decimals)
+        if bbox is not None:
+            min_lat, max_lat, min_lon, max_lon = bbox
+            out = out[(out["lat_max"] > min_lat) & (out["lat_min"] <= max_lat)
+                      & (out["lon_max"] > min_lon) & (out["lon_min"] <= max_lon)]
+        return out.reset_index(drop=True)
+
+    def grid(self, zoom: int = 0, bbox=None, value: str = "quake_count"):
+        """Dense (lat centres, lon centres, 2-D array) of one column, NaN where there are no events."""
+        cells = self.query(zoom, bbox)
+        if cells.empty:
+            return np.array([]), np.array([]), np.empty((0, 0))
+        step = self.resolution(zoom)
+        lat_i = np.rint((cells["lat"] - cells["lat"].min()) / step).astype(int).to_numpy()
+        lon_i = np.rint((cells["lon"] - cells["lon"].min()) / step).astype(int).to_numpy()
+        lats = cells["lat"].min() + step * np.arange(lat_i.max() + 1)
+        lons = cells["lon"].min() + step * np.arange(lon_i.max() + 1)
+        out = np.full((len(lats), len(lons)), np.nan)
+        out[lat_i, lon_i] = cells[value].to_numpy()
+        return lats, lons, out
+
+    def save(self, path):
+        arrays = {f"{z}_{k}": v for z, cells in enumerate(self.levels) for k, v in cells.items()}
+        meta = json.dumps({"levels": len(self.levels), "decimals": self.decimals, **self.meta})
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez_compressed(tmp, meta=np.array(meta), **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            levels = [{k: data[f"{z}_{k}"] for k in ["lat_k", "lon_k"] + FIELDS} for z in range(meta.pop("levels"))]
+        return cls(levels, meta.pop("decimals"), meta)
+
+
+def _events_sql(table: str, filters: dict):
+    """SELECT of the binned columns with the filters of event_store.read_events."""
+    where, params = ["latitude IS NOT NULL", "longitude IS NOT NULL"], {}
+    if filters.get("sources"):
+        where.append("source IN :sources")
+        params["sources"] = list(filters["sources"])
+    for key, cond in [("start", "`time` >= :start"), ("end", "`time` < :end"),
+                      ("min_mag", "magnitude >= :min_mag"), ("max_mag", "magnitude <= :max_mag")]:
+        if filters.get(key) is not None:
+            where.append(cond)
+            params[key] = filters[key]
+    sql = text(f"SELECT latitude, longitude, magnitude, depth FROM {table} WHERE {' AND '.join(where)}")
+    if "sources" in params:
+        sql = sql.bindparams(bindparam("sources", expanding=True))
+    return sql, params
+
+
+def build(engine, table: str = "earthquakes", filters: dict = None, levels: int = LEVELS,
+          cache_dir=CACHE_DIR, use_cache: bool = True) -> TilePyramid:
+    """
+    The pyramid of `table` under `filters` (sources, start, end, min_mag, max_mag), from the
+    cache when the table has not changed since it was built. cache_dir=None: memory only.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    sql, params = _events_sql(table, filters)
+    with engine.connect() as conn:
+        state = data_state(conn, table)
+    dialect = engine.dialect.name
+    spec = json.dumps({"table": table, "filters": filters, "levels": levels, "decimals": DECIMALS,
+                       "rounding": dialect if dialect in ROUNDING else "sqlite"}, sort_keys=True, default=str)
+    key = cache_key(spec, state)
+    path = Path(cache_dir) / f"{key[:24]}.npz" if cache_dir else None
+    if use_cache:
+        if key in _memory:
+            return _memory[key]
+        if path is not None and path.exists():
+            _memory[key] = TilePyramid.load(path)
+            return _memory[key]
+
+    with engine.connect() as conn:
+        chunks = pd.read_sql(sql, conn, params=params, chunksize=CHUNKSIZE)
+        pyramid = TilePyramid.from_chunks(chunks, levels, DECIMALS, dialect,
+                                          meta={"key": key, "spec": json.loads(spec), "data_state": state})
+    if use_cache:
+        _memory[key] = pyramid
+        if path is not None:
+            pyramid.save(path)
+    return pyramid
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve a zoom level of the cached tile pyramid as CSV.")
+    ap.add_argument("--table", default="earthquakes")
+    ap.add_argument("--zoom", type=int, default=0, help=f"0 (0.1 deg) .. {LEVELS - 1} ({2 ** (LEVELS - 1) / 10} deg)")
+    ap.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LAT", "MAX_LAT", "MIN_LON", "MAX_LON"))
+    ap.add_argument("--sources", nargs="+")
+    ap.add_argument("--start")
+    ap.add_argument("--end")
+    ap.add_argument("--min-mag", type=float)
+    ap.add_argument("--max-mag", type=float)
+    ap.add_argument("--out", default=None, help="CSV path (default: outputs/tiles/z<zoom>.csv)")
+    args = ap.parse_args()
+
+    filters = {"sources": args.sources, "start": args.start, "end": args.end,
+               "min_mag": args.min_mag, "max_mag": args.max_mag}
+    cells = build(get_engine(), args.table, filters).query(args.zoom, args.bbox)
+    out = Path(args.out or CACHE_DIR / f"z{args.zoom}.csv")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    cells.to_csv(out, index=False, encoding="utf-8-sig")
+    print(f"[tiles] zoom {args.zoom}: {len(cells)} cells -> {out}")
+
+
+if __name__ == "__main__":
+    main()
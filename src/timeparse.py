@@ -0,0 +1,83 @@
+"""
+Timestamp parsing with format detection and a per-layout format cache.
+
+pd.to_datetime without `format=` infers the format again on every call (and the loaders
+used to call it up to three times per column). Here a small sample of each file is tried
+against the formats our sources actually use, the winner is cached under a key (header
+signature and/or source), and the whole column is parsed once with that explicit format.
+Only the rows that do not match fall back to the caller's generic parser.
+
+  USGS API          2025-10-17T20:28:15.043Z
+  USGS cleaned      2025-10-17 20:28:15.043
+  EMSC / GEOFON     2025-10-17 20:28:15
+"""
+import pandas as pd
+
+KNOWN_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S.%f%z",  # %z accepts the trailing "Z" and keeps the ISO fast path
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%d",
+]
+SAMPLE_SIZE = 200
+MIN_MATCH = 0.9  # share of the sample a format must parse to be chosen
+
+_format_cache = {}
+
+
+def _default_fallback(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values, utc=True, errors="coerce")
+
+
+def detect_format(values: pd.Series, sample_size: int = SAMPLE_SIZE):
+    """Return the KNOWN_FORMATS entry that parses the most sampled values (None if none is good enough)."""
+    sample = values.dropna().head(sample_size).astype(str).str.strip()
+    sample = sample[sample != ""]
+    if sample.empty:
+        return None
+    best, best_hits = None, 0
+    for fmt in KNOWN_FORMATS:
+        hits = pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+    return best if best_hits >= MIN_MATCH * len(sample) else None
+
+
+def parse_times(values: pd.Series, key=None, fallback=_default_fallback) -> pd.Series:
+    """
+    Parse a raw time column to naive UTC datetimes.
+    key      cache key for the detected format, e.g. the CSV header tuple or the source name
+    fallback callable(values) -> tz-aware UTC datetimes, used only for rows the format misses
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        out = pd.to_datetime(values, utc=True)
+        return out.dt.tz_convert(None)
+
+    fmt = _format_cache.get(key) if key is not None else None
+    cached = fmt is not None
+    if fmt is None:
+        fmt = detect_format(values)
+    if fmt is None:
+        return fallback(values).dt.tz_convert(None)
+
+    out = pd.to_datetime(values, format=fmt, utc=True, errors="coerce")
+    missed = out.isna() & values.notna()
+    if cached and missed.mean() > 0.5:
+        # layout changed under the same key: detect again instead of falling back row by row
+        _format_cache.pop(key, None)
+        return parse_times(values, key, fallback)
+    if key is not None:
+        _format_cache[key] = fmt
+    if missed.any():
+        out[missed] = fallback(values[missed])
+    return out.dt.tz_convert(None)
+
+
+def clear_cache():
+    _format_cache.clear()
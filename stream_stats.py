@@ -0,0 +1,330 @@
+"""
+Single-pass, mergeable statistics for columns that arrive in chunks (NumPy only).
+
+Moments keeps count / mean / sum of squared deviations / min / max and folds each chunk in
+with Chan's parallel form of Welford's update, so two partial results combine exactly as
+if their values had been seen together. KLL is a quantile sketch: a level holding too
+many values is sorted and compacted into half as many of twice the weight, so the sketch
+keeps at most about 3k values however many it sees, and a quantile is off by about
+1.7/k in rank (~1% at the default k=200). With exact=True it never compacts and its
+quantiles are np.percentile's (for when the values fit in memory).
+
+ColumnStats is one Moments + one KLL per column; GroupedStats holds one per group of the
+`by` columns (source / region / month). Every class has merge(), pickles cleanly for
+worker processes, and GroupedStats saves to / loads from JSON, so partials built from
+separate files or processes can be combined later. NaNs are skipped, as pandas does.
+
+Usage:
+  from stream_stats import GroupedStats
+  gs = GroupedStats(["magnitude", "depth"], by=["source"])
+  for chunk in pd.read_csv(path, chunksize=100_000):
+      gs.update(chunk)
+  gs.merge(GroupedStats.load("other_part.json"))
+  gs.to_frame()   # source, column, count, mean, std, min, max, p25, p50, p75
+  python stream_stats.py outputs/earthquakes_export.csv --by source month --workers 4
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+K = 200
+COMPACT_RATIO = 2 / 3  # each level below the top holds 2/3 of the one above
+QUANTILES = (0.25, 0.5, 0.75)
+COLUMNS = ["magnitude", "depth", "dist_to_Tokyo"]
+
+
+def _values(values) -> np.ndarray:
+    x = np.asarray(values, dtype=float).ravel()
+    return x[~np.isnan(x)]
+
+
+class Moments:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        x = _values(values)
+        if len(x):
+            part = Moments()
+            part.count = len(x)
+            part.mean = float(x.mean())
+            part.m2 = float(np.square(x - part.mean).sum())
+            part.min, part.max = float(x.min()), float(x.max())
+            self.merge(part)
+        return self
+
+    def merge(self, other: "Moments"):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def var(self, ddof: int = 1) -> float:
+        return self.m2 / (self.count - ddof) if self.count > ddof else math.nan
+
+    def std(self, ddof: int = 1) -> float:
+        return math.sqrt(self.var(ddof))
+
+    def state(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Moments":
+        m = cls()
+        m.count, m.mean, m.m2, m.min, m.max = (state[k] for k in ("count", "mean", "m2", "min", "max"))
+        return m
+
+
+class KLL:
+    """
+    KLL quantile sketch. levels[h] holds values of weight 2**h; a level over its capacity
+    is sorted and every other value (odd or even positions, at random) moves up a level.
+    """
+
+    def __init__(self, k: int = K, exact: bool = False, seed: int = None):
+        self.k = k
+        self.exact = exact
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h: int) -> int:
+        return max(2, math.ceil(self.k * COMPACT_RATIO ** (len(self.levels) - 1 - h)))
+
+    def update(self, values):
+        x = _values(values)
+        self.count += len(x)
+        self.levels[0] = np.concatenate([self.levels[0], x])
+        self._compress()
+        return self
+
+    def merge(self, other: "KLL"):
+        if other.exact != self.exact:
+            raise ValueError("cannot merge an exact sketch with an approximate one")
+        self.k = max(self.k, other.k)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _compress(self):
+        if self.exact:
+            return
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._capacity(h):
+                items = np.sort(items)
+                keep = items[:len(items) % 2]  # an odd value out stays at this weight
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                up = items[len(keep) + self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], up])
+            h += 1
+
+    def __len__(self):
+        """Values held (not values seen, which is .count)."""
+        return sum(len(items) for items in self.levels)
+
+    def quantile(self, q):
+        """q in [0, 1] (scalar or list). Linear interpolation between ranks, like np.percentile."""
+        qs = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.count == 0:
+            out = np.full(len(qs), np.nan)
+        elif len(self.levels) == 1:
+            out = np.percentile(self.levels[0], qs * 100)
+        else:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(v), 2.0 ** h) for h, v in enumerate(self.levels)])
+            order = np.argsort(items, kind="stable")
+            items, weights = items[order], weights[order]
+            # a value of weight w stands for w equal ranks; place it at their middle
+            centers = np.cumsum(weights) - (weights + 1) / 2
+            out = np.interp(qs * (weights.sum() - 1), centers, items)
+        return out if np.ndim(q) else float(out[0])
+
+    def state(self) -> dict:
+        return {"k": self.k, "exact": self.exact, "count": self.count, "levels": [v.tolist() for v in self.levels]}
+
+    @classmethod
+    def from_state(cls, state: dict, seed: int = None) -> "KLL":
+        s = cls(state["k"], state["exact"], seed)
+        s.count = state["count"]
+        s.levels = [np.asarray(v, dtype=float) for v in state["levels"]]
+        return s
+
+
+class ColumnStats:
+    def __init__(self, k: int = K, exact: bool = False, seed: int = None):
+        self.moments = Moments()
+        self.sketch = KLL(k, exact, seed)
+
+    def update(self, values):
+        x = _values(values)
+        self.moments.update(x)
+        self.sketch.update(x)
+        return self
+
+    def merge(self, other: "ColumnStats"):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self, quantiles=QUANTILES, ddof: int = 1) -> dict:
+        m = self.moments
+        out = {"count": m.count, "mean": m.mean if m.count else math.nan, "std": m.std(ddof),
+               "min": m.min if m.count else math.nan, "max": m.max if m.count else math.nan}
+        for q, v in zip(quantiles, self.sketch.quantile(list(quantiles))):
+            out[f"p{round(q * 100):02d}"] = float(v)
+        return out
+
+    def state(self) -> dict:
+        return {"moments": self.moments.state(), "sketch": self.sketch.state()}
+
+    @classmethod
+    def from_state(cls, state: dict, seed: int = None) -> "ColumnStats":
+        c = cls()
+        c.moments = Moments.from_state(state["moments"])
+        c.sketch = KLL.from_state(state["sketch"], seed)
+        return c
+
+
+class GroupedStats:
+    """ColumnStats for each of `columns`, per group of the `by` columns (by=[] -> one overall group)."""
+
+    def __init__(self, columns=COLUMNS, by=(), k: int = K, exact: bool = False, seed: int = None):
+        self.columns = list(columns)
+        self.by = list(by)
+        self.k, self.exact, self.seed = k, exact, seed
+        self.groups = {}
+
+    def _group(self, key: tuple) -> dict:
+        if key not in self.groups:
+            self.groups[key] = {c: ColumnStats(self.k, self.exact, self.seed) for c in self.columns}
+        return self.groups[key]
+
+    def update(self, df: pd.DataFrame):
+        if not self.by:
+            parts = [((), df)]
+        else:
+            parts = df.groupby(self.by, observed=True, sort=False, dropna=False)
+        for key, part in parts:
+            key = tuple(None if pd.isna(v) else v.item() if isinstance(v, np.generic) else v
+                        for v in (key if isinstance(key, tuple) else (key,)))
+            group = self._group(key)
+            for c in self.columns:
+                group[c].update(pd.to_numeric(part[c], errors="coerce"))
+        return self
+
+    def merge(self, other: "GroupedStats"):
+        if (other.columns, other.by) != (self.columns, self.by):
+            raise ValueError(f"cannot merge stats of {other.columns} by {other.by} into {self.columns} by {self.by}")
+        for key, group in other.groups.items():
+            mine = self._group(key)
+            for c in self.columns:
+                mine[c].merge(group[c])
+        return self
+
+    def to_frame(self, quantiles=QUANTILES, ddof: int = 1) -> pd.DataFrame:
+        """One row per (group, column), sorted by group."""
+        rows = [{**dict(zip(self.by, key)), "column": c, **group[c].summary(quantiles, ddof)}
+                for key, group in self.groups.items() for c in self.columns]
+        df = pd.DataFrame(rows)
+        return df.sort_values(self.by, kind="stable").reset_index(drop=True) if self.by and len(df) else df
+
+    def state(self) -> dict:
+        return {"columns": self.columns, "by": self.by, "k": self.k, "exact": self.exact,
+                "groups": [{"key": list(key), "stats": {c: s.state() for c, s in group.items()}}
+                           for key, group in self.groups.items()]}
+
+    @classmethod
+    def from_state(cls, state: dict, seed: int = None) -> "GroupedStats":
+        gs = cls(state["columns"], state["by"], state["k"], state["exact"], seed)
+        for g in state["groups"]:
+            gs.groups[tuple(g["key"])] = {c: ColumnStats.from_state(s, seed) for c, s in g["stats"].items()}
+        return gs
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.state()), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path, seed: int = None) -> "GroupedStats":
+        return cls.from_state(json.loads(Path(path).read_text(encoding="utf-8")), seed)
+
+
+def stats_of_csv(path, columns=COLUMNS, by=(), k: int = K, exact: bool = False, chunksize: int = 100_000,
+                 seed: int = None) -> GroupedStats:
+    """GroupedStats of one CSV, read `chunksize` rows at a time."""
+    gs = GroupedStats(columns, by, k, exact, seed)
+    for chunk in pd.read_csv(path, usecols=[*columns, *by], chunksize=chunksize):
+        gs.update(chunk)
+    return gs
+
+
+def stats_of_csvs(paths, columns=COLUMNS, by=(), k: int = K, exact: bool = False, chunksize: int = 100_000,
+                  workers: int = 1, seed: int = None) -> GroupedStats:
+    """One GroupedStats per file (in `workers` processes when > 1), merged."""
+    args = [(p, columns, by, k, exact, chunksize, seed) for p in paths]
+    total = GroupedStats(columns, by, k, exact, seed)
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(stats_of_csv, *zip(*args)))
+    else:
+        parts = [stats_of_csv(*a) for a in args]
+    for part in parts:
+        total.merge(part)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Streaming per-group stats and percentiles of normalized event CSVs.")
+    ap.add_argument("inputs", nargs="+", help="CSV files or folders of *.csv (e.g. the export or its partitions)")
+    ap.add_argument("--columns", nargs="+", default=COLUMNS)
+    ap.add_argument("--by", nargs="*", default=["source"], help="group columns, e.g. source region month")
+    ap.add_argument("--k", type=int, default=K, help="sketch size; rank error is about 1.7/k")
+    ap.add_argument("--exact", action="store_true", help="keep every value (exact percentiles)")
+    ap.add_argument("--chunksize", type=int, default=100_000)
+    ap.add_argument("--workers", type=int, default=1, help="processes, one file each")
+    ap.add_argument("--merge", nargs="*", default=[], help="saved partial stats (JSON) to merge in")
+    ap.add_argument("--save", help="write the merged partial stats to this JSON file")
+    ap.add_argument("--out", help="write the summary table to this CSV")
+    args = ap.parse_args()
+
+    paths = []
+    for p in map(Path, args.inputs):
+        paths += sorted(p.glob("*.csv")) if p.is_dir() else [p]
+    gs = stats_of_csvs(paths, args.columns, args.by, args.k, args.exact, args.chunksize, args.workers)
+    for part in args.merge:
+        gs.merge(GroupedStats.load(part))
+    if args.save:
+        gs.save(args.save)
+    table = gs.to_frame()
+    if args.out:
+        table.to_csv(args.out, index=False)
+    print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
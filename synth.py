@@ -0,0 +1,215 @@
+"""
+Seeded generator of synthetic earthquake catalogs for the Japan bbox, for benchmarks and tests.
+
+Events are drawn from a handful of seismic zones (Japan Trench, Izu-Bonin, Ryukyu, Hokkaido,
+Kyushu, central Honshu), with Gutenberg-Richter magnitudes (b = 1 above M2.5) and zone-specific
+depths (the Izu-Bonin slab is partly deep). Each catalog is written in one of the header
+layouts of the cleaned files in src/df, which src/columns_map.RENAME_MAP maps:
+
+  EMSC     date_time_UTC, latitude_deg, ...   (JAPAN_EMSC_cleaned.csv)
+  GEOFON   Magnitude, Place, DateTime_UTC ... (JAPAN_GEOFON_cleaned.csv)
+  USGS     time, latitude, longitude, ...     (JAPAN_USGS_cleaned.csv)
+  DATASET  Datetime, Month, Latitude, ...     (japan_clean_dataset.csv)
+
+`messiness` (0-1) is the fraction of rows given one of the defects seen in the real files:
+exact duplicate rows, missing coordinates ('N/A' / ''), junk magnitudes ('unknown', ''),
+depths with units ('10 km'), padded region names, distances with a ' km' suffix and times
+in a second format. Same seed, same arguments -> byte-identical file.
+
+Usage:
+  python synth.py --rows 1000000 --layout USGS --messiness 0.05 --out outputs/synth/usgs_1m.csv
+  from synth import generate, write_catalog
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from cleaning import categorize_mag, classify_mag
+from utils import haversine_km
+
+LAT_RANGE = (24.0, 46.0)
+LON_RANGE = (123.0, 146.0)
+TOKYO = (35.6895, 139.6917)
+CHUNK_ROWS = 500_000
+
+# name, lat, lon, sd lat, sd lon, weight, share of deep (slab) events
+ZONES = [
+    ("Off East Coast of Honshu", 38.3, 142.5, 1.2, 0.8, 0.30, 0.0),
+    ("Izu Islands", 30.5, 139.5, 2.0, 0.8, 0.15, 0.5),
+    ("Ryukyu Islands", 27.5, 128.5, 1.5, 1.5, 0.20, 0.0),
+    ("Hokkaido", 42.5, 144.0, 1.0, 1.2, 0.15, 0.0),
+    ("Kyushu", 32.0, 131.0, 1.0, 0.8, 0.10, 0.0),
+    ("Eastern Honshu", 36.0, 137.5, 1.0, 1.2, 0.10, 0.0),
+]
+
+LAYOUTS = {
+    "EMSC": ["date_time_UTC", "Month", "latitude_deg", "longitude_deg", "dist_to_Tokyo_km", "depth_km",
+             "magnitude_value", "magnitude_type", "Category", "place", "region", "data_source"],
+    "GEOFON": ["Magnitude", "Place", "DateTime_UTC", "Depth_km", "Latitude", "Longitude", "Dist_to_Tokyo_km",
+               "Event_ID", "Month", "Category", "Region", "Data_source"],
+    "USGS": ["time", "latitude", "longitude", "depth", "mag", "magType", "nst", "gap", "dmin", "rms", "net", "id",
+             "updated", "place", "type", "horizontalError", "depthError", "magError", "magNst", "Month", "Category",
+             "region", "source", "dist_to_tokyo_km"],
+    "DATASET": ["Datetime", "Month", "Latitude", "Longitude", "dist_to_Tokyo_km", "Depth", "Magnitude", "Place",
+                "Category", "Region", "data_source"],
+}
+# per layout: time, latitude, depth, magnitude, distance and region columns (what _mess edits)
+FIELDS = {
+    "EMSC": ("date_time_UTC", "latitude_deg", "depth_km", "magnitude_value", "dist_to_Tokyo_km", "region"),
+    "GEOFON": ("DateTime_UTC", "Latitude", "Depth_km", "Magnitude", "Dist_to_Tokyo_km", "Region"),
+    "USGS": ("time", "latitude", "depth", "mag", "dist_to_tokyo_km", "region"),
+    "DATASET": ("Datetime", "Latitude", "Depth", "Magnitude", "dist_to_Tokyo_km", "Region"),
+}
+# the real files with a byte-order mark
+BOM_LAYOUTS = {"EMSC", "GEOFON", "DATASET"}
+
+
+def _events(rng, n: int, t0: pd.Timestamp, t1: pd.Timestamp) -> pd.DataFrame:
+    """n clean events with times in [t0, t1), newest first."""
+    weights = np.array([z[5] for z in ZONES])
+    zone = rng.choice(len(ZONES), size=n, p=weights / weights.sum())
+    z = np.array([z[1:5] for z in ZONES])[zone]
+    lat = np.clip(z[:, 0] + rng.normal(0, 1, n) * z[:, 2], *LAT_RANGE)
+    lon = np.clip(z[:, 1] + rng.normal(0, 1, n) * z[:, 3], *LON_RANGE)
+
+    deep = rng.random(n) < np.array([z[6] for z in ZONES])[zone]
+    depth = np.where(deep, rng.normal(420, 60, n), 5 + rng.exponential(30, n))
+    depth = np.clip(depth, 0, 700)
+    mag = np.minimum(2.5 + rng.exponential(1 / np.log(10), n), 9.0)  # Gutenberg-Richter, b = 1
+
+    span = (t1 - t0).value
+    ns = np.sort(rng.integers(0, span, n))[::-1]
+    time = t0 + pd.to_timedelta(ns, unit="ns")
+    return pd.DataFrame({
+        "time": time.floor("ms"),
+        "latitude": lat.round(4), "longitude": lon.round(4), "depth": depth.round(3), "mag": mag.round(1),
+        "region": np.array([z[0] for z in ZONES])[zone],
+    })
+
+
+def _stamp(time: pd.Series, unit: str) -> np.ndarray:
+    """'YYYY-MM-DD HH:MM:SS[.fff]' strings; much faster than Series.dt.strftime."""
+    return np.char.replace(np.datetime_as_string(time.to_numpy(), unit=unit), "T", " ")
+
+
+def _layout(ev: pd.DataFrame, layout: str, rng, first_id: int) -> pd.DataFrame:
+    """Clean events -> the columns and value formats of one source's cleaned CSV."""
+    n = len(ev)
+    dist = np.round(haversine_km(ev["latitude"], ev["longitude"], *TOKYO), 2)
+    month = ev["time"].dt.month_name()
+    ids = np.arange(first_id, first_id + n)
+    if layout == "EMSC":
+        region = ev["region"].str.upper()
+        return pd.DataFrame({
+            "date_time_UTC": _stamp(ev["time"], "s"), "Month": month,
+            "latitude_deg": ev["latitude"].round(3), "longitude_deg": ev["longitude"].round(3),
+            "dist_to_Tokyo_km": dist, "depth_km": ev["depth"].round(0), "magnitude_value": ev["mag"],
+            "magnitude_type": np.where(ev["mag"] < 4, "ML", "mb"), "Category": classify_mag(ev["mag"]),
+            "place": region + ", JAPAN", "region": region, "data_source": "EMSC"})
+    if layout == "GEOFON":
+        return pd.DataFrame({
+            "Magnitude": ev["mag"], "Place": ev["region"] + ", Japan",
+            "DateTime_UTC": _stamp(ev["time"], "s"), "Depth_km": ev["depth"].round(0),
+            "Latitude": ev["latitude"].round(2), "Longitude": ev["longitude"].round(2), "Dist_to_Tokyo_km": dist,
+            "Event_ID": [f"gfz{i:010d}" for i in ids], "Month": month, "Category": categorize_mag(ev["mag"]),
+            "Region": ev["region"], "Data_source": "GEOFON"})
+    if layout == "USGS":
+        stamp = _stamp(ev["time"], "ms")
+        return pd.DataFrame({
+            "time": stamp, "latitude": ev["latitude"], "longitude": ev["longitude"], "depth": ev["depth"],
+            "mag": ev["mag"], "magType": "mb", "nst": rng.integers(10, 200, n).astype(float),
+            "gap": rng.integers(20, 200, n).astype(float), "dmin": rng.uniform(0.5, 5, n).round(3),
+            "rms": rng.uniform(0.2, 1.2, n).round(2), "net": "us", "id": [f"us7{i:07d}" for i in ids],
+            "updated": stamp, "place": ev["region"] + ", Japan region", "type": "earthquake",
+            "horizontalError": rng.uniform(3, 12, n).round(2), "depthError": rng.uniform(1, 8, n).round(3),
+            "magError": rng.uniform(0.02, 0.2, n).round(3), "magNst": rng.integers(5, 300, n).astype(float),
+            "Month": month, "Category": categorize_mag(ev["mag"]), "region": ev["region"], "source": "USGS",
+            "dist_to_tokyo_km": dist})
+    if layout == "DATASET":
+        return pd.DataFrame({
+            "Datetime": _stamp(ev["time"], "ms"), "Month": month,
+            "Latitude": ev["latitude"].round(3), "Longitude": ev["longitude"].round(4), "dist_to_Tokyo_km": dist,
+            "Depth": ev["depth"].round(1), "Magnitude": ev["mag"], "Place": ev["region"] + ", Japan",
+            "Category": categorize_mag(ev["mag"]), "Region": ev["region"], "data_source": "DATASET"})
+    raise ValueError(f"unknown layout {layout!r}; expected one of {sorted(LAYOUTS)}")
+
+
+def _mess(df: pd.DataFrame, layout: str, rng, messiness: float) -> pd.DataFrame:
+    """Give a `messiness` share of rows one defect each (duplicates are appended copies)."""
+    if messiness <= 0 or df.empty:
+        return df
+    time_c, lat_c, depth_c, mag_c, dist_c, region_c = FIELDS[layout]
+    df = df.astype({c: object for c in FIELDS[layout]})
+    n = len(df)
+    hit = np.flatnonzero(rng.random(n) < messiness)
+    kind = rng.integers(0, 7, len(hit))
+    pick = {k: df.index[hit[kind == k]] for k in range(7)}
+    df.loc[pick[1], lat_c] = rng.choice(["N/A", ""], len(pick[1]))
+    df.loc[pick[2], mag_c] = rng.choice(["unknown", ""], len(pick[2]))
+    df.loc[pick[3], depth_c] = [f"{float(d):.0f} km" for d in df.loc[pick[3], depth_c]]
+    df.loc[pick[4], region_c] = "  " + df.loc[pick[4], region_c].astype(str) + "  "
+    df.loc[pick[5], dist_c] = df.loc[pick[5], dist_c].astype(str) + " km"
+    df.loc[pick[6], time_c] = pd.to_datetime(df.loc[pick[6], time_c]).dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if len(pick[0]):
+        dup = df.loc[pick[0]]
+        df = pd.concat([df, dup]).sort_index(kind="stable").reset_index(drop=True)
+    return df
+
+
+def _chunk(rows: int, layout: str, seed: int, messiness: float, t0, t1, index: int, first_id: int):
+    rng = np.random.default_rng([seed, index])
+    return _mess(_layout(_events(rng, rows, t0, t1), layout, rng, first_id), layout, rng, messiness)
+
+
+def _spans(rows: int, start, end, chunk_rows: int):
+    """(rows, t0, t1) per chunk; chunk 0 holds the newest slice so the file is newest first."""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    n = max(1, -(-rows // chunk_rows))
+    edges = [start + (end - start) * i / n for i in range(n + 1)]
+    sizes = [rows // n + (1 if i < rows % n else 0) for i in range(n)]
+    return [(sizes[i], edges[n - 1 - i], edges[n - i]) for i in range(n)]
+
+
+def generate(rows: int, layout: str = "USGS", seed: int = 0, messiness: float = 0.0,
+             start="2025-09-15", end="2025-10-20", chunk_rows: int = CHUNK_ROWS) -> pd.DataFrame:
+    """The catalog write_catalog would write, as one DataFrame of strings and numbers."""
+    parts, first_id = [], 0
+    for i, (n, t0, t1) in enumerate(_spans(rows, start, end, chunk_rows)):
+        parts.append(_chunk(n, layout, seed, messiness, t0, t1, i, first_id))
+        first_id += n
+    return pd.concat(parts, ignore_index=True)
+
+
+def write_catalog(path, rows: int, layout: str = "USGS", seed: int = 0, messiness: float = 0.0,
+                  start="2025-09-15", end="2025-10-20", chunk_rows: int = CHUNK_ROWS) -> Path:
+    """Write `rows` events (plus duplicates from messiness) to `path`, chunk by chunk (memory ~ one chunk)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    first_id = 0
+    for i, (n, t0, t1) in enumerate(_spans(rows, start, end, chunk_rows)):
+        part = _chunk(n, layout, seed, messiness, t0, t1, i, first_id)
+        first_id += n
+        if i == 0:
+            part.to_csv(path, index=False, encoding="utf-8-sig" if layout in BOM_LAYOUTS else "utf-8")
+        else:
+            part.to_csv(path, index=False, header=False, mode="a", encoding="utf-8")
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a synthetic Japan earthquake catalog CSV.")
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--layout", default="USGS", choices=sorted(LAYOUTS))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--messiness", type=float, default=0.0, help="Share of rows with a defect (0-1)")
+    ap.add_argument("--start", default="2025-09-15")
+    ap.add_argument("--end", default="2025-10-20")
+    ap.add_argument("--out", default=None, help="Default: outputs/synth/<layout>_<rows>.csv")
+    args = ap.parse_args()
+    out = args.out or f"outputs/synth/{args.layout.lower()}_{args.rows}.csv"
+    write_catalog(out, args.rows, args.layout, args.seed, args.messiness, args.start, args.end)
+    print(f"[synth] wrote {args.rows:,} {args.layout} events -> {out}")
+
+
+if __name__ == "__main__":
+    main()
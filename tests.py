@@ -1,12 +1,346 @@
+import json
+import os
+import sys
+import tempfile
+import threading
 import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
 from EMSC_webscraping import webscraping_selenium
+import EMSC_webscraping
 from GEOFON_webscraping import fetch_earthquake_data
+import GEOFON_webscraping
+from bs4 import BeautifulSoup
+import re
 from API_saving import api_saving
 import pandas as pd
 import numpy as np
 from utils import api_code, clean_data, compute_statistics, validate_data_integrity, calculate_distance_to_tokyo, compute_numpy_statistics
+from utils import haversine_km
+from geo_index import GridIndex
+from stream_stats import Moments, KLL, GroupedStats, stats_of_csvs
+import sites
+import matching
+import fdsn
+import http_cache
+from loader import BatchTuner
+from manifest import needs_load
+from main import build_df, normalize_frame, iter_build_df, iter_built, export_all, parse_named_queries, ensure_table, load_files, run_queries_and_export
+from engine import get_engine
+from exporter import PartitionedWriter
+import manifest
+import main
+from loader import upsert_df
+import rollups
+import table_versions
+from query_runner import run_named_queries
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from event_store import write_events, read_events, file_tag
+import event_store
+import cleaning
+import synth
+from instrument import Metrics
+from event_schema import concat_events, to_events, validate, widen, memory_report
+import event_schema
+import live
+import follow
+import tiles
+import figures
+from loadBroken import normalize_one_csv
+import bench
+import timeparse
 
 
+# Row-wise cleaners as written in Japan_data.ipynb / EMSC.ipynb, kept as the reference
+# the vectorized versions in cleaning.py must match.
+def _floater(value):
+    value = str(value).lower().strip().replace("point", ".").replace(" ", "")
+    words = {"zero": 0, "one": 1, "two": 2, "three": 3, "four": 4,
+             "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if "." in value:
+        left, right = value.split(".", 1)
+        if left in words and right in words:
+            return float(str(words[left]) + "." + str(words[right]))
+    if value in words:
+        return float(words[value])
+    return None
+
+
+def _clean_depth(val):
+    if pd.isna(val):
+        return np.nan
+    v = str(val).strip().lower()
+    num_str = "".join(ch for ch in v if ch.isdigit() or ch == ".")
+    if num_str == "":
+        return np.nan
+    num = float(num_str)
+    if num < 0 or num > 700:
+        return np.nan
+    if "km" in v or "kilometer" in v:
+        result = num
+    elif "meter" in v:
+        result = num / 1000
+    elif "mile" in v:
+        result = num * 1.60934
+    else:
+        result = num
+    return round(result, 2)
+
+
+def _invalid_count(row):
+    count = 0
+    for col in ["latitude", "longitude", "mag", "depth"]:
+        val = row[col]
+        if pd.isna(val):
+            count += 1
+            continue
+        v = str(val).strip().lower()
+        if v in ["nan", "unknown", "", "none"]:
+            count += 1
+            continue
+        try:
+            num = float(v)
+        except ValueError:
+            count += 1
+            continue
+        if num < 0:
+            count += 1
+    return count
+
+
+def _categorize_mag(mag):
+    if mag < 4:
+        return "Weak"
+    elif mag <= 6:
+        return "Moderate"
+    return "Strong"
+
+
+def _clean_region(area_name):
+    cleaned = area_name.replace("Prefecture", "").replace("region", "").replace("central", "")
+    if "," in cleaned:
+        parts = cleaned.split(",")
+        if "japan" in parts[-1].strip().lower():
+            cleaned = ",".join(parts[:-1])
+    return cleaned.strip().title()
+
+
+def _classify_mag(value):
+    if value < 4:
+        return "weak"
+    elif 4 <= value <= 6:
+        return "moderate"
+    return "strong"
+
+
+
+class _FakeFDSN(BaseHTTPRequestHandler):
+    """Local stand-in for the USGS event service: /count and /query (csv) with a result cap."""
+    catalog = None
+    cap = 100
+    fail_first = set()  # paths that answer 503 once, to exercise the retries
+    lock = threading.Lock()
+    hits = []           # routes requested, in order
+
+    def _window(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        t = self.catalog["_t"]
+        rows = self.catalog[(t >= pd.Timestamp(q["starttime"])) & (t <= pd.Timestamp(q["endtime"]))]
+        if "updatedafter" in q:
+            updated = pd.to_datetime(rows["updated"], utc=True).dt.tz_convert(None)
+            rows = rows[updated > pd.Timestamp(q["updatedafter"])]
+        return rows
+
+    def _send(self, code, body=b""):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        route = urlparse(self.path).path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.hits.append(route)
+            if route in self.fail_first:
+                self.fail_first.discard(route)
+                return self._send(503)
+        rows = self._window()
+        if route == "count":
+            return self._send(200, str(len(rows)).encode())
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        rows = rows.sort_values("_t", ascending=False)
+        if "limit" in q:
+            rows = rows.iloc[int(q.get("offset", 1)) - 1:][:int(q["limit"])]
+        if len(rows) > self.cap:
+            return self._send(400, b"Error 400: exceeds search limit")
+        if rows.empty:
+            return self._send(204)
+        body = rows.drop(columns="_t").to_csv(index=False)
+        self._send(200, body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class _ETagServer(BaseHTTPRequestHandler):
+    """Serves a body per path with an ETag and answers If-None-Match with 304."""
+    hits = []
+
+    def do_GET(self):
+        body = "&".join(sorted(urlparse(self.path).query.split("&"))).encode().ljust(800, b".")
+        etag = '"%s"' % abs(hash(body))
+        self.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _geofon_html(df, quirks=False):
+    """list.php-style page for the rows of a JAPAN_GEOFON.csv frame (newest first)."""
+    rows = []
+    for i, r in enumerate(df.itertuples(index=False)):
+        cls = ["flex-row row eqinfo-all evnrow", "flex-row row eqinfo-all oddrow"][i % 2]
+        depth = f'<span class="pull-right">{int(r.Depth_km)}*</span>'
+        when = f"{r.DateTime_UTC}.4 (\u2264{i} h ago)"
+        if quirks and i % 5 == 1:
+            cls = cls.replace(" row ", "  row\n")                   # odd whitespace in the class attribute
+            depth, when = "", f"{r.DateTime_UTC}.4 (3 d ago) {int(r.Depth_km)}*"  # no pull-right span
+        if quirks and i % 7 == 3:
+            when = f"<span>{r.DateTime_UTC}</span>.1 <!-- c --> (1 d ago)"
+        mag = f'<span class="magbox mag{int(r.Magnitude)}">{r.Magnitude}</span>'
+        if quirks and i % 11 == 4:
+            mag = '<span class="magbox">n/a</span>'
+        if quirks and i % 13 == 6:
+            mag = ""
+        rows.append(
+            f'<a href="event.php?id={r.Event_ID}"><div class="{cls}">'
+            f'<div class="col-xs-2">{mag}</div><div class="col-xs-10">'
+            f'<div class="row"><div class="col-xs-12" title="{r.Longitude}&deg;E, {r.Latitude}&deg;N">'
+            f'<strong> {r.Region} </strong></div></div>'
+            f'<div class="row"><div class="col-xs-12">{when} {depth}</div></div>'
+            f'</div></div></a>\n')
+    return '<html><body><div id="eqlist">' + "".join(rows) + "</div></body></html>"
+
+
+def _geofon_rows_bs4(html):
+    """The BeautifulSoup parsing loop fetch_earthquake_data used before the streaming parser."""
+    soup = BeautifulSoup(html, "html.parser")
+    total = len(soup.find_all("div", class_=["flex-row row eqinfo-all evnrow", "flex-row row eqinfo-all oddrow"]))
+    evn = soup.find_all("div", class_="flex-row row eqinfo-all evnrow")
+    odd = soup.find_all("div", class_="flex-row row eqinfo-all oddrow")
+    event_rows = []
+    for i in range(max(len(evn), len(odd))):
+        if i < len(evn):
+            event_rows.append(evn[i])
+        if i < len(odd):
+            event_rows.append(odd[i])
+    out = []
+    for row in event_rows:
+        try:
+            mag_span = row.find("span", class_="magbox")
+            if not mag_span:
+                continue
+            magnitude = float(mag_span.get_text(strip=True))
+            region_strong = row.find("strong")
+            if not region_strong:
+                continue
+            region = region_strong.get_text(strip=True)
+            region_div = row.find("div", title=True)
+            coordinates = region_div.get("title", "") if region_div else ""
+            latitude = longitude = None
+            if coordinates:
+                parts = coordinates.split(", ")
+                if len(parts) == 2:
+                    longitude = float(parts[0].replace("\u00b0E", "").replace("\u00b0W", ""))
+                    latitude = float(parts[1].replace("\u00b0N", "").replace("\u00b0S", ""))
+            time_depth_row = row.find_all("div", class_="row")[1]
+            time_depth_text = time_depth_row.get_text(strip=True)
+            depth_text = ""
+            time_span = time_depth_row.find("span", class_="pull-right")
+            if time_span:
+                time_span.extract()
+                time_text = str(time_depth_row.get_text(strip=True).split("(")[0].strip().split(".")[0].strip())
+                depth_text = str(time_span.get_text(strip=True).replace("*", "").strip())
+            else:
+                time_text = str(time_depth_text.split("(")[0].strip().split(".")[0].strip())
+                depth_match = re.search(r"(\d+)\*?$", time_depth_text)
+                if depth_match:
+                    depth_text = str(depth_match.group(1))
+            parent_link = row.find_parent("a")
+            event_id = ""
+            if parent_link and parent_link.get("href") and "id=" in parent_link.get("href"):
+                event_id = parent_link.get("href").split("id=")[1]
+            out.append({"Magnitude": magnitude, "Region": region, "DateTime_UTC": time_text,
+                        "Depth_km": depth_text if depth_text else None, "Latitude": latitude,
+                        "Longitude": longitude, "Event_ID": event_id})
+        except (ValueError, AttributeError, IndexError):
+            continue
+    return total, out
+
+
+class _FakeGeofon(BaseHTTPRequestHandler):
+    """Local stand-in for geofon list.php: inclusive datemin/datemax days, newest first, at most nmax rows."""
+    catalog = None
+
+    def do_GET(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        day = pd.to_datetime(self.catalog["DateTime_UTC"]).dt.normalize()
+        rows = self.catalog[(day >= pd.Timestamp(q["datemin"])) & (day <= pd.Timestamp(q["datemax"]))]
+        body = _geofon_html(rows.head(int(q["nmax"]))).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeEMSC(BaseHTTPRequestHandler):
+    """Local stand-in for the seismicportal FDSN event service: format=text with limit / offset paging."""
+    catalog = None
+    queries = []
+
+    def do_GET(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.queries.append(q)
+        t = self.catalog["_t"]
+        rows = self.catalog[(t >= pd.Timestamp(q["starttime"])) & (t <= pd.Timestamp(q["endtime"]))]
+        rows = rows.sort_values("_t", ascending=False, kind="stable")
+        start = int(q["offset"]) - 1
+        rows = rows.iloc[start:start + int(q["limit"])].drop(columns="_t")
+        if rows.empty:
+            self.send_response(204)
+            self.end_headers()
+            return
+        body = ("#" + rows.to_csv(sep="|", index=False)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
 
 class Test(unittest.TestCase):
     def test_selenium_results_count(self):
@@ -27,6 +361,27 @@ class Test(unittest.TestCase):
         self.assertEqual(saved_count, direct_count,
                          f"Our search included {direct_count} events but only {saved_count} have been extracted.")
 
+    def test_api_code_reuses_the_api_saving_response(self):
+        base = pd.read_csv("JAPAN_USGS.csv")
+        base["_t"] = pd.to_datetime(base["time"], utc=True).dt.tz_convert(None)
+        _FakeFDSN.catalog, _FakeFDSN.cap, _FakeFDSN.fail_first, _FakeFDSN.hits = base, 1000, set(), []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeFDSN)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/fdsnws/event/1/"
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                cache = http_cache.HTTPCache(Path(d) / "cache", session=fdsn.make_session(pool=2, backoff=0))
+                saved = api_saving(Path(d) / "JAPAN_USGS.csv", url, cache)
+                sent = list(_FakeFDSN.hits)
+                direct = api_code(url, cache)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(sent, ["count", "query"])
+        self.assertEqual(_FakeFDSN.hits, sent)  # the second call made no request
+        self.assertEqual(saved, direct)
+        self.assertEqual(direct, len(base))
+
     def test_clean_data(self):
         df = pd.DataFrame({
             "latitude": [35.0, np.nan, 37.2],
@@ -43,6 +398,11 @@ class Test(unittest.TestCase):
 
         self.assertEqual(stats["mean"], 5.625)
 
+        # no values (empty or all NaN): NaN, not 0.0 / inf / -inf
+        for empty in (pd.DataFrame({"magnitude": []}, dtype=float), pd.DataFrame({"magnitude": [np.nan, np.nan]})):
+            stats = compute_statistics(empty, "magnitude")
+            self.assertTrue(all(np.isnan(v) for v in stats.values()), stats)
+
     def test_validate_data_integrity(self):
         df = pd.DataFrame({
             "latitude": [35.0, 36.0],
@@ -75,6 +435,996 @@ class Test(unittest.TestCase):
         self.assertIn("mean_mag", stats)
         self.assertIn("mean_distance", stats)
 
+        stats = compute_numpy_statistics(df.iloc[:0])
+        self.assertTrue(all(np.isnan(v) for v in stats.values()), stats)
+
+    def test_batch_tuner(self):
+        tuner = BatchTuner(size=500, min_size=100, max_size=4000)
+        tuner.record(500, 1.0)     # 500 rows/s
+        self.assertEqual(tuner.size, 1000)
+        tuner.record(1000, 1.0)    # faster -> keep growing
+        self.assertEqual(tuner.size, 2000)
+        tuner.record(2000, 4.0)    # slower -> back off
+        self.assertEqual(tuner.size, 1000)
+        tuner.record(10, 1.0)      # short tail batch is ignored
+        self.assertEqual(tuner.size, 1000)
+
+    def test_manifest_needs_load(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "JAPAN_USGS.csv")
+            with open(path, "w") as fh:
+                fh.write("time,latitude,longitude\n2025-10-01T00:00:00Z,35.0,139.0\n")
+            changed, fp = needs_load(path, None)
+            self.assertTrue(changed)
+
+            self.assertFalse(needs_load(path, fp)[0])
+            os.utime(path, (fp["mtime"] + 10, fp["mtime"] + 10))  # touched, same content
+            self.assertFalse(needs_load(path, fp)[0])
+
+            with open(path, "a") as fh:
+                fh.write("2025-10-02T00:00:00Z,36.0,140.0\n")
+            self.assertTrue(needs_load(path, fp)[0])
+
+    def test_iter_build_df_matches_build_df(self):
+        src = pd.read_csv(os.path.join("src", "df", "JAPAN_EMSC_cleaned.csv"))
+        # repeat rows so duplicates straddle chunk boundaries
+        messy = pd.concat([src, src.sample(frac=1, random_state=0), src.iloc[::3]], ignore_index=True)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "JAPAN_EMSC_big.csv")
+            messy.to_csv(path, index=False)
+            whole = build_df(path)
+            streamed = concat_events(iter_build_df(path, chunksize=37))
+
+        self.assertEqual(len(whole), len(src))
+        pd.testing.assert_frame_equal(whole, streamed)
+
+    def test_parallel_load_matches_serial_load(self):
+        files = sorted(Path("src", "df").glob("*.csv"))
+        with tempfile.TemporaryDirectory() as d:
+            built, loaded = {}, {}
+            for workers in (1, 2):
+                got = {f: (df, err) for f, df, err in iter_built(files, workers=workers)}
+                self.assertEqual(sorted(got), files)
+                self.assertEqual([err for _, err in got.values()], [None] * len(files))
+                built[workers] = got
+                engine = get_engine(f"sqlite:///{d}/eq{workers}.db")
+                ensure_table(engine)
+                totals = load_files(engine, files, "earthquakes", workers=workers)
+                with engine.connect() as conn:
+                    rows = pd.read_sql("SELECT source, time, latitude, longitude, depth, magnitude, region "
+                                       "FROM earthquakes ORDER BY source, time, latitude, longitude", conn)
+                engine.dispose()
+                loaded[workers] = (totals, rows)
+        for f in files:
+            pd.testing.assert_frame_equal(built[2][f][0], built[1][f][0])
+        self.assertEqual(loaded[2][0], loaded[1][0])
+        self.assertEqual(loaded[2][0]["inserted"], sum(len(df) for df, _ in built[1].values()))
+        pd.testing.assert_frame_equal(loaded[2][1], loaded[1][1])
+
+    def test_export_all_streams_compressed_and_partitioned(self):
+        engine = create_engine("sqlite://")
+        df = widen(build_df(os.path.join("src", "df", "JAPAN_USGS_cleaned.csv")))
+        df.insert(0, "id", range(1, len(df) + 1))
+        df.to_sql("earthquakes", engine, index=False)
+        with tempfile.TemporaryDirectory() as d:
+            out = Path(d) / "earthquakes_export.csv"
+            export_all(engine, "earthquakes", out, "csv.gz", chunksize=10)
+            back = pd.read_csv(Path(d) / "earthquakes_export.csv.gz")
+            self.assertEqual(len(back), len(df))
+            self.assertEqual(list(back.columns), list(df.columns))
+
+            export_all(engine, "earthquakes", out, "csv", partition=True, chunksize=10)
+            parts = list((Path(d) / "earthquakes_export").glob("source=USGS/year_month=*/part-00000.csv"))
+            self.assertGreater(len(parts), 0)
+            self.assertEqual(sum(len(pd.read_csv(p)) for p in parts), len(df))
+
+            # more partitions than open files: closed ones are appended to, or continued in a new part
+            months = pd.Timestamp("2023-01-01") + pd.to_timedelta(np.arange(len(df)) % 6 * 31, unit="D")
+            many = df.assign(source=np.array(["USGS", "EMSC", "GEOFON"])[np.arange(len(df)) % 3], time=months)
+            want = many.groupby(["source", many["time"].dt.strftime("%Y-%m")]).size()
+            for fmt in ("csv", "csv.gz", "parquet"):
+                root = Path(d) / f"capped-{fmt}"
+                w = PartitionedWriter(root, fmt, max_open=2)
+                for start in range(0, len(many), 7):
+                    w.write(many.iloc[start:start + 7])
+                    self.assertLessEqual(len(w._writers), 2)
+                w.close()
+                read = pd.read_parquet if fmt == "parquet" else pd.read_csv
+                got = {}
+                for path in root.glob(f"source=*/year_month=*/part-*.{fmt}"):
+                    key = (path.parent.parent.name.split("=")[1], path.parent.name.split("=")[1])
+                    back = read(path)
+                    self.assertEqual(list(back.columns), list(many.columns))
+                    got[key] = got.get(key, 0) + len(back)
+                self.assertEqual((w.rows, w.partitions), (len(many), len(want)))
+                self.assertEqual(got, want.to_dict())
+                if fmt != "parquet":
+                    self.assertEqual({p.name for p in root.rglob("part-*")}, {f"part-00000.{fmt}"})
+
+    def test_rollup_queries_match_full_scans(self):
+        engine = create_engine("sqlite://")
+        df = pd.concat([build_df(os.path.join("src", "df", f)) for f in
+                        ["JAPAN_USGS_cleaned.csv", "JAPAN_EMSC_cleaned.csv"]], ignore_index=True)
+        df["time"] = df["time"].dt.round("s")
+        base, later = df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]
+        base.to_sql("earthquakes", engine, index=False)
+        with open(os.path.join("src", "queries.sql"), encoding="utf-8") as f:
+            fast = dict(parse_named_queries(f.read()))
+        with open(os.path.join("src", "queries_scan.sql"), encoding="utf-8") as f:
+            scans = parse_named_queries(f.read())
+
+        def check(conn):
+            for name, sql in scans:
+                want = pd.read_sql(sql, conn)
+                got = pd.read_sql(fast[name], conn)
+                self.assertEqual(list(got.columns), list(want.columns), name)
+                want, got = (x.sort_values(list(x.columns)).reset_index(drop=True) for x in (want, got))
+                pd.testing.assert_frame_equal(got, want, check_dtype=False, atol=0.011, obj=name)
+
+        with engine.begin() as conn:
+            rollups.ensure(conn)  # rollups added to a table that already has rows: backfilled
+            check(conn)
+            # the loader's deltas: new rows, plus updated rows whose old versions are subtracted
+            old = base.iloc[::7]
+            new = old.assign(magnitude=old["magnitude"] + 0.5, depth=old["depth"] * 2, region="Updated",
+                             dist_to_Tokyo=old["dist_to_Tokyo"] + 120)
+            rollups.apply_delta(conn, pd.concat([later, new]), old)
+            pd.concat([base.drop(old.index), new, later]).to_sql("earthquakes", conn, index=False,
+                                                                 if_exists="replace")
+            check(conn)
+
+    def test_query_runner_reports_and_caches_on_table_version(self):
+        with tempfile.TemporaryDirectory() as d:
+            engine = create_engine(f"sqlite:///{d}/eq.db")
+            df = widen(build_df(os.path.join("src", "df", "JAPAN_USGS_cleaned.csv")))
+            df.insert(0, "id", range(1, len(df) + 1))
+            df.to_sql("earthquakes", engine, index=False)
+            with engine.begin() as conn:
+                table_versions.ensure(conn)
+                table_versions.bump(conn, "earthquakes")
+            with open(os.path.join("src", "queries.sql"), encoding="utf-8") as f:
+                named = dict(parse_named_queries(f.read()))
+            queries = [(n, named[n]) for n in ["histogramS", "recent_top10_quakes", "region_depth_extremes"]]
+            queries += [("broken", "SELECT * FROM no_such_table"), ("cleanup", "DELETE FROM earthquakes")]
+            out = Path(d) / "queries"
+
+            def statuses():
+                report = run_named_queries(engine, queries, out, workers=3)
+                self.assertEqual(json.loads((out / "run_report.json").read_text(encoding="utf-8")), report)
+                return {q["name"]: q["status"] for q in report["queries"]}, report
+
+            got, report = statuses()
+            self.assertEqual(got, {"histogramS": "ran", "recent_top10_quakes": "ran", "region_depth_extremes": "ran",
+                                   "broken": "failed", "cleanup": "skipped"})
+            first = report["queries"][0]
+            self.assertEqual(first["rows"], int(df["magnitude"].notna().sum()))
+            self.assertEqual(first["bytes"], (out / "histogramS.csv").stat().st_size)
+            self.assertEqual(statuses()[0]["histogramS"], "cached")
+            self.assertEqual(statuses()[0]["broken"], "failed")  # failures are never cached
+
+            with engine.begin() as conn:
+                table_versions.bump(conn, "earthquakes")
+            self.assertEqual(statuses()[0]["recent_top10_quakes"], "ran")
+            pd.testing.assert_frame_equal(pd.read_csv(out / "histogramS.csv"),
+                                          df.loc[df["magnitude"].notna(), ["source", "magnitude"]].reset_index(drop=True))
+            engine.dispose()
+
+    def test_pipeline_runs_offline_on_sqlite(self):
+        with tempfile.TemporaryDirectory() as d:
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            csvs = Path(d) / "df"
+            csvs.mkdir()
+            for f in Path("src", "df").glob("*.csv"):
+                (csvs / f.name).write_bytes(f.read_bytes())
+            files = sorted(csvs.glob("*.csv"))
+            expected = sum(len(build_df(f)) for f in files)
+
+            def load():
+                todo, fingerprints = manifest.plan_loads(engine, files)
+                return load_files(engine, todo, "earthquakes", fingerprints=fingerprints)
+
+            self.assertEqual(load()["inserted"], expected)
+            self.assertEqual(load(), {"inserted": 0, "updated": 0, "skipped": 0})  # manifest: nothing changed
+            # entries are per target table: the same files are still new to another one
+            self.assertEqual(manifest.plan_loads(engine, files, "earthquakes_copy")[0], files)
+            with engine.begin() as conn:
+                self.assertEqual(set(manifest.load_manifest(conn)), {str(f.resolve()) for f in files})
+                self.assertEqual(manifest.load_manifest(conn, "earthquakes_copy"), {})
+
+            # edit one file: its rows are updated in place and the rollups follow
+            usgs = csvs / "JAPAN_USGS_cleaned.csv"
+            edited = pd.read_csv(usgs)
+            edited["mag"] = edited["mag"] + 0.3
+            edited.to_csv(usgs, index=False)
+            self.assertEqual(load()["updated"], len(edited))
+
+            # more rows than SQLite takes bound parameters for in one statement
+            many = build_df(usgs).iloc[np.arange(4000) % len(edited)].reset_index(drop=True)
+            many["latitude"] = many["latitude"] + (np.arange(4000) + 1) * 1e-4
+            with engine.begin() as conn:
+                self.assertEqual(upsert_df(conn, many, "earthquakes", BatchTuner(size=20000))["inserted"], 4000)
+
+            run_queries_and_export(engine, os.path.join("src", "queries.sql"), Path(d) / "q")
+            run_queries_and_export(engine, os.path.join("src", "queries_scan.sql"), Path(d) / "scan")
+            report = json.loads((Path(d) / "q" / "run_report.json").read_text(encoding="utf-8"))
+            self.assertEqual([q["name"] for q in report["queries"] if q["status"] != "ran"], [])
+            box = pd.read_csv(Path(d) / "q" / "boxPlot.csv")  # FIELD() ordering
+            zones = box["depth_zone"].drop_duplicates().tolist()
+            order = ["Shallow (0–70 km)", "Intermediate (70–300 km)", "Deep (300–700 km)", "Out of range"]
+            self.assertEqual(zones, [z for z in order if z in zones])
+            for f in (Path(d) / "scan").glob("*.csv"):
+                want = pd.read_csv(f)
+                got = pd.read_csv(Path(d) / "q" / f.name)
+                want, got = (x.sort_values(list(x.columns)).reset_index(drop=True) for x in (want, got))
+                pd.testing.assert_frame_equal(got, want, atol=0.011, obj=f.name)
+
+            export_all(engine, "earthquakes", Path(d) / "export.csv")
+            self.assertEqual(len(pd.read_csv(Path(d) / "export.csv")), expected + 4000)
+            engine.dispose()
+
+    def test_upsert_reload_counts(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "JAPAN_USGS_synth.csv"
+            synth.write_catalog(path, 10_000, "USGS", seed=11)
+            df = build_df(path)
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            with engine.begin() as conn:
+                counts = upsert_df(conn, df, "earthquakes")
+            with engine.begin() as conn:
+                again = upsert_df(conn, df, "earthquakes")
+            edited = df.iloc[:100].assign(magnitude=df["magnitude"].iloc[:100] + 0.5)
+            with engine.begin() as conn:
+                changed = upsert_df(conn, edited, "earthquakes")
+            engine.dispose()
+        # throughput against plain to_sql is tracked by bench.py (db_load vs db_load_to_sql)
+        self.assertEqual(counts, {"inserted": len(df), "updated": 0, "skipped": 0})
+        self.assertEqual(again, {"inserted": 0, "updated": 0, "skipped": len(df)})
+        self.assertEqual(changed, {"inserted": 0, "updated": 100, "skipped": 0})
+
+    def test_synthetic_catalogs_parse_in_every_layout(self):
+        with tempfile.TemporaryDirectory() as d:
+            for layout in synth.LAYOUTS:
+                path = Path(d) / f"{layout}.csv"
+                synth.write_catalog(path, 3000, layout, seed=7, chunk_rows=1000)
+                raw = pd.read_csv(path, dtype=str)
+                self.assertEqual(list(raw.columns), synth.LAYOUTS[layout])
+                pd.testing.assert_frame_equal(raw, synth.generate(3000, layout, seed=7, chunk_rows=1000).astype(str)
+                                              .replace({"nan": np.nan}), check_dtype=False)
+                df = build_df(path)
+                self.assertEqual(len(df), 3000)
+                self.assertTrue(df["time"].is_monotonic_decreasing)
+                self.assertTrue(df["latitude"].between(*synth.LAT_RANGE).all())
+                self.assertTrue(df["longitude"].between(*synth.LON_RANGE).all())
+                self.assertGreater(df["magnitude"].min(), 2.4)
+                tokyo = haversine_km(df["latitude"], df["longitude"], *synth.TOKYO)
+                np.testing.assert_allclose(df["dist_to_Tokyo"], tokyo, atol=1.0)  # from unrounded coordinates
+
+                messy = synth.generate(3000, layout, seed=7, messiness=0.3)
+                lat = messy[synth.FIELDS[layout][1]].astype(str)
+                missing = int(lat.isin(["N/A", "", "nan"]).sum())
+                messy.to_csv(path, index=False)
+                self.assertEqual(len(build_df(path)), 3000 - missing)
+                self.assertGreater(len(messy), 3000)  # duplicates were added
+
+    def test_bench_runs_every_benchmark_and_compares(self):
+        with tempfile.TemporaryDirectory() as d:
+            results = Path(d) / "results.jsonl"
+            first = bench.run(rows=400, messiness=0.05, isolate=False, results_path=results)
+            second = bench.run(rows=400, messiness=0.05, isolate=False, results_path=results)
+            self.assertEqual([r["name"] for r in first["results"]], list(bench.BENCHMARKS))
+            for r in first["results"]:
+                self.assertNotIn("error", r)
+                self.assertGreater(r["rows"], 0)
+            self.assertEqual(len(results.read_text(encoding="utf-8").splitlines()), 2)
+            self.assertEqual(bench.previous_run(second, results)["run_at"], first["run_at"])
+            self.assertIn("x", bench.format_report(second, first).splitlines()[1])
+            self.assertIn("the rows/s of plain to_sql", bench.format_report(second).splitlines()[-1])
+
+    def test_event_schema_is_compact_valid_and_widens_exactly(self):
+        path = os.path.join("src", "df", "JAPAN_EMSC_cleaned.csv")
+        raw = pd.read_csv(path)
+        df = build_df(path)
+        self.assertEqual(validate(df), [])
+        self.assertEqual(dict(df.dtypes), event_schema.DTYPES | {"region": df["region"].dtype})
+        self.assertEqual(set(df["category"].dropna()), {"Weak", "Moderate"})  # EMSC writes them lower case
+        self.assertEqual(validate(normalize_one_csv(Path(path))), [])
+
+        # float32 columns go back to the CSV's decimals, keys are untouched
+        wide = widen(df)
+        np.testing.assert_array_equal(wide["magnitude"].to_numpy(), raw["magnitude_value"].to_numpy())
+        np.testing.assert_array_equal(wide["dist_to_Tokyo"].to_numpy(), raw["dist_to_Tokyo_km"].to_numpy())
+        np.testing.assert_array_equal(wide["latitude"].to_numpy(), raw["latitude_deg"].to_numpy())
+        self.assertEqual(wide["source"].dtype, object)
+        self.assertEqual(to_events(wide)["region"].tolist(), df["region"].tolist())
+
+        self.assertGreater(memory_report(wide).loc["total", "ratio"], 3)
+        bad = wide.assign(latitude=wide["latitude"] + 100, extra=1)
+        self.assertEqual(len(validate(bad)), 9)  # extra column, 7 dtypes, latitude bounds
+
+        # labels outside the known lists are kept as extra categories (with a warning), not rejected or blanked
+        with self.assertWarnsRegex(UserWarning, r"source: unknown label\(s\) \['JMA'\]"):
+            other = to_events(wide.assign(source="JMA", category=np.where(wide.index % 2, "weak", "Severe")))
+        self.assertEqual(validate(other), [])
+        self.assertEqual(other["source"].cat.categories.tolist(), event_schema.SOURCES + ["JMA"])
+        self.assertEqual(set(other["category"]), {"Weak", "Severe"})
+        with tempfile.TemporaryDirectory() as d:
+            jma = Path(d) / "JAPAN_JMA_cleaned.csv"
+            raw.assign(data_source="JMA").to_csv(jma, index=False)
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            with self.assertWarnsRegex(UserWarning, "JMA"):
+                totals = load_files(engine, [jma], "earthquakes")
+            with engine.connect() as conn:
+                stored = conn.execute(text("SELECT DISTINCT source FROM earthquakes")).scalars().all()
+
+            # rows stored with the file's spelling (before the schema) are relabelled once, then re-loads skip them
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE earthquakes SET category = LOWER(category), month = UPPER(month)"))
+                migrated = event_schema.migrate_labels(conn)
+                labels = conn.execute(text("SELECT DISTINCT category FROM earthquakes ORDER BY 1")).scalars().all()
+                self.assertEqual(event_schema.migrate_labels(conn), 0)
+            with self.assertWarnsRegex(UserWarning, "JMA"):
+                again = load_files(engine, [jma], "earthquakes")
+            engine.dispose()
+        self.assertEqual((totals["inserted"], stored), (len(df), ["JMA"]))
+        self.assertEqual(migrated, 2 * len(df))
+        self.assertEqual(labels, ["Moderate", "Weak"])
+        self.assertEqual(again, {"inserted": 0, "updated": 0, "skipped": len(df)})
+
+    def test_tile_pyramid_matches_heatmap_and_is_served_from_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            load_files(engine, sorted(Path("src", "df").glob("*.csv")), "earthquakes")
+            with open(os.path.join("src", "queries_scan.sql"), encoding="utf-8") as f:
+                heatmap = dict(parse_named_queries(f.read()))["heatmap"]
+            with engine.connect() as conn:
+                want = pd.read_sql(heatmap, conn).sort_values(["lat", "lon"]).reset_index(drop=True)
+                events = pd.read_sql("SELECT source, latitude, longitude, magnitude, depth FROM earthquakes", conn)
+                tricky = [35.15, 35.25, -35.15, 139.45, 0.05, 2.675]
+                rounded = [conn.execute(text("SELECT ROUND(:v, 1)"), {"v": v}).scalar() for v in tricky]
+            np.testing.assert_array_equal(tiles.bin_index(tricky) / 10, rounded)
+            self.assertEqual(tiles.bin_index([35.25, 35.35], dialect="mysql").tolist(), [352, 354])  # rint ties to even
+
+            cache = Path(d) / "tiles"
+            pyr = tiles.build(engine, cache_dir=cache)
+            z0 = pyr.query(0)
+            pd.testing.assert_frame_equal(z0[["lat", "lon", "quake_count"]], want, check_dtype=False)
+
+            # zoom 2 = 4x4 blocks of zoom-0 cells, straight from the events
+            blocks = events.assign(lat_j=tiles.bin_index(events["latitude"]) // 4,
+                                   lon_j=tiles.bin_index(events["longitude"]) // 4)
+            agg = blocks.groupby(["lat_j", "lon_j"]).agg(quake_count=("depth", "size"), max_magnitude=("magnitude", "max"),
+                                                         mean_depth=("depth", "mean")).reset_index()
+            z2 = pyr.query(2)
+            pd.testing.assert_frame_equal(z2[["quake_count", "max_magnitude", "mean_depth"]],
+                                          agg[["quake_count", "max_magnitude", "mean_depth"]], check_dtype=False)
+            np.testing.assert_allclose(z2["lat"], (agg["lat_j"] * 4 + 1.5) / 10)
+            self.assertTrue(all(pyr.query(z)["quake_count"].sum() == len(events) for z in range(tiles.LEVELS)))
+
+            box = pyr.query(3, bbox=(30, 36, 135, 141))
+            self.assertTrue(((box["lat_max"] > 30) & (box["lat_min"] <= 36)).all())
+            self.assertEqual(len(box), len(pyr.query(3).merge(box)))
+            lats, lons, grid = pyr.grid(1, bbox=(30, 36, 135, 141))
+            self.assertEqual(grid.shape, (len(lats), len(lons)))
+            self.assertEqual(np.nansum(grid), pyr.query(1, bbox=(30, 36, 135, 141))["quake_count"].sum())
+
+            # cached in memory, then on disk; a load that changes the table builds a new pyramid
+            self.assertIs(tiles.build(engine, cache_dir=cache), pyr)
+            tiles._memory.clear()
+            self.assertEqual(len(list(cache.glob("*.npz"))), 1)
+            pd.testing.assert_frame_equal(tiles.build(engine, cache_dir=cache).query(2), z2)
+            usgs = tiles.build(engine, filters={"sources": ["USGS"]}, cache_dir=cache)
+            self.assertEqual(usgs.query(6)["quake_count"].sum(), (events["source"] == "USGS").sum())
+            extra = Path(d) / "JAPAN_EMSC_synth.csv"
+            synth.write_catalog(extra, 50, "EMSC", seed=1)
+            load_files(engine, [extra], "earthquakes")
+            self.assertEqual(tiles.build(engine, cache_dir=cache).query(0)["quake_count"].sum(), len(events) + 50)
+            engine.dispose()
+
+    def test_figures_render_headless_with_density_rasters(self):
+        with tempfile.TemporaryDirectory() as d:
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            load_files(engine, sorted(Path("src", "df").glob("*.csv")), "earthquakes")
+            queries = Path(d) / "queries"
+            run_queries_and_export(engine, os.path.join("src", "queries.sql"), queries)
+            export_all(engine, "earthquakes", Path(d) / "export.csv")
+            engine.dispose()
+
+            out = Path(d) / "figures"
+            report = figures.render_all(queries, Path(d) / "export.csv", out, ("png", "svg"), workers=1)
+            self.assertEqual([r["name"] for r in report["figures"]], list(figures.FIGURES))
+            self.assertEqual({r["status"] for r in report["figures"]}, {"rendered"})
+            self.assertEqual(json.loads((out / figures.REPORT_FILE).read_text(encoding="utf-8")), report)
+            for name in figures.FIGURES:
+                self.assertEqual((out / f"{name}.png").read_bytes()[:4], b"\x89PNG")
+                self.assertIn(b"<svg", (out / f"{name}.svg").read_bytes()[:500])
+            scatter = report["figures"][0]
+            self.assertEqual((scatter["mode"], scatter["points"]), ("markers", len(pd.read_csv(queries / "Scattering.csv"))))
+
+            # above the threshold the scatters become rasters; worker processes; missing inputs are skipped
+            report = figures.render_all(queries, Path(d) / "missing.csv", out, workers=2, threshold=10,
+                                        only=["magnitude_vs_depth", "magnitude_vs_time", "depth_hist"])
+            self.assertEqual([(r["status"], r.get("mode")) for r in report["figures"]],
+                             [("rendered", "density"), ("rendered", "density"), ("skipped", None)])
+            with self.assertRaisesRegex(ValueError, "unknown figures"):
+                figures.render_all(queries, only=["pie"])
+
+            # sparse cells keep their place on the 0.1 degree lattice (the gaps are drawn as 0)
+            sparse = Path(d) / "sparse"
+            sparse.mkdir()
+            pd.DataFrame({"lat": [35.0, 35.3], "lon": [139.0, 139.5], "quake_count": [2, 7]}).to_csv(
+                sparse / "heatmap.csv", index=False)
+            fig = figures.Figure()
+            figures.heatmap(fig, {"queries": sparse}, threshold=None)
+            im = fig.axes[0].images[0]
+            grid = im.get_array()
+            self.assertEqual(grid.shape, (4, 6))
+            self.assertEqual((grid[0, 0], grid[3, 5], grid.sum()), (2, 7, 9))
+            np.testing.assert_allclose(im.get_extent(), [138.95, 139.55, 34.95, 35.35])
+
+    def test_stream_stats_merge_to_numpy_parity_and_bounded_sketches(self):
+        events = widen(normalize_frame(synth.generate(20_000, "USGS", seed=5)))
+        df = events[["source", "month", "magnitude", "depth"]].assign(
+            source=np.where(np.arange(len(events)) % 3, "USGS", "EMSC"))
+        df.loc[::97, "depth"] = np.nan
+        qs = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+        # exact mode: chunked and merged partials give NumPy's answers
+        parts = [GroupedStats(["magnitude", "depth"], by=["source"], exact=True).update(c)
+                 for c in (df.iloc[i::7] for i in range(7))]
+        whole = parts[0]
+        for p in parts[1:]:
+            whole.merge(p)
+        for (src,), group in whole.groups.items():
+            for c in ["magnitude", "depth"]:
+                x = df.loc[df["source"] == src, c].dropna().to_numpy()
+                m, sk = group[c].moments, group[c].sketch
+                self.assertEqual((m.count, m.min, m.max), (len(x), x.min(), x.max()))
+                self.assertAlmostEqual(m.mean, np.mean(x), places=10)
+                self.assertAlmostEqual(m.std(ddof=0), np.std(x), places=10)
+                self.assertAlmostEqual(m.std(), np.std(x, ddof=1), places=10)
+                np.testing.assert_array_equal(sk.quantile(qs), np.percentile(x, np.multiply(qs, 100)))
+        frame = whole.to_frame()
+        self.assertEqual(list(frame.columns), ["source", "column", "count", "mean", "std", "min", "max",
+                                               "p25", "p50", "p75"])
+        self.assertEqual(list(frame["source"]), ["EMSC", "EMSC", "USGS", "USGS"])
+
+        # approximate mode: bounded size, rank error within the sketch's guarantee, merge of partials too
+        x = np.random.default_rng(1).gamma(2.0, 1.5, 200_000)
+        ranks = np.sort(x)
+        one = KLL(k=200, seed=0)
+        for c in np.array_split(x, 40):
+            one.update(c)
+        merged = KLL(k=200, seed=1)
+        for i, c in enumerate(np.array_split(x, 4)):
+            merged.merge(KLL(k=200, seed=i).update(c))
+        for sk in (one, merged):
+            self.assertEqual(sk.count, len(x))
+            self.assertLess(len(sk), 3 * 200)
+            err = np.abs(np.searchsorted(ranks, sk.quantile(qs)) / len(x) - qs).max()
+            self.assertLess(err, 0.02)
+        with self.assertRaisesRegex(ValueError, "exact"):
+            one.merge(KLL(exact=True))
+
+        # partials cross processes and files: per-file workers + JSON round trip == one pass
+        with tempfile.TemporaryDirectory() as d:
+            paths = []
+            for i, c in enumerate(df.iloc[j::3] for j in range(3)):
+                paths.append(Path(d) / f"part{i}.csv")
+                c.to_csv(paths[-1], index=False)
+            by_files = stats_of_csvs(paths[:2], ["magnitude", "depth"], ["source", "month"], exact=True,
+                                     chunksize=1000, workers=2)
+            by_files.save(Path(d) / "partial.json")
+            total = GroupedStats.load(Path(d) / "partial.json").merge(
+                stats_of_csvs(paths[2:], ["magnitude", "depth"], ["source", "month"], exact=True))
+        one_pass = GroupedStats(["magnitude", "depth"], by=["source", "month"], exact=True).update(df).to_frame()
+        pd.testing.assert_frame_equal(total.to_frame().sort_values(["source", "month", "column"]).reset_index(drop=True),
+                                      one_pass.sort_values(["source", "month", "column"]).reset_index(drop=True),
+                                      check_exact=False, rtol=1e-12)
+
+    def test_metrics_count_drops_per_rule_and_time_each_stage(self):
+        with tempfile.TemporaryDirectory() as d:
+            messy = synth.generate(2000, "EMSC", seed=3, messiness=0.3)
+            path = Path(d) / "JAPAN_EMSC_synth.csv"
+            messy.to_csv(path, index=False)
+            missing = int(messy["latitude_deg"].astype(str).isin(["N/A", "", "nan"]).sum())
+            dups = int(messy.duplicated().sum())
+
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            metrics = Metrics(Path(d) / "prof")
+            load_files(engine, [path], "earthquakes", metrics=metrics)
+            export_all(engine, "earthquakes", Path(d) / "export.csv", metrics=metrics)
+            report = metrics.write(Path(d) / "metrics.json")
+            engine.dispose()
+
+            build = report["stages"]["build_df"]
+            self.assertEqual(build["rows_in"], len(messy))
+            self.assertEqual(build["dropped"], {"missing_latitude": missing, "duplicate_key": dups})
+            self.assertEqual(build["rows_out"], len(messy) - missing - dups)
+            self.assertEqual(report["stages"]["load"]["rows_in"], build["rows_out"])
+            self.assertEqual(report["stages"]["export"]["rows_out"], build["rows_out"])
+            steps = report["records"][0]["steps"]
+            self.assertEqual(set(steps), {"read_csv", "rename", "parse_times", "to_numeric", "typed", "dropna_dedup"})
+            self.assertEqual(json.loads((Path(d) / "metrics.json").read_text(encoding="utf-8")), report)
+            self.assertEqual(sorted(p.name for p in (Path(d) / "prof").iterdir()),
+                             ["build_df.prof", "export.prof", "load.prof"])
+
+            # streamed: the same counts, duplicates split between the chunk and cross-chunk rules
+            streamed = Metrics()
+            for _, chunks, _ in iter_built([path], chunksize=300, metrics=streamed):
+                for _ in chunks:
+                    pass
+            rec = streamed.records[-1]
+            self.assertEqual(rec["rows_out"], build["rows_out"])
+            self.assertEqual(sum(rec["dropped"].values()), missing + dups)
+
+            # worker processes and streamed failures record build_df too
+            broken = Path(d) / "JAPAN_broken.csv"
+            broken.write_text("", encoding="utf-8")  # no columns: read_csv raises
+            pooled = Metrics()
+            engine = get_engine(f"sqlite:///{d}/pooled.db")
+            ensure_table(engine)
+            load_files(engine, [path, broken], "earthquakes", workers=2, metrics=pooled)
+            engine.dispose()
+            builds = {Path(r["file"]).name: r for r in pooled.records if r["stage"] == "build_df"}
+            self.assertEqual(builds[path.name]["rows_out"], build["rows_out"])
+            self.assertIn("error", builds[broken.name])
+            streamed = Metrics()
+            for _, chunks, _ in iter_built([broken], chunksize=300, metrics=streamed):
+                with self.assertRaises(Exception):
+                    list(chunks)
+            self.assertEqual([r["stage"] for r in streamed.records], ["build_df"])
+            self.assertIn("error", streamed.records[0])
+
+    def test_event_store_filters_match_pandas(self):
+        path = os.path.join("src", "df", "JAPAN_EMSC_cleaned.csv")
+        df = build_df(path)
+        with tempfile.TemporaryDirectory() as d:
+            write_events(d, df.iloc[:60], file_tag(path), 0)
+            write_events(d, df.iloc[60:], file_tag(path), 1)
+            got = read_events(d, columns=["time", "latitude", "magnitude"], start="2025-10-01",
+                              bbox=(30, 40, 135, 145), min_mag=4.0)
+        want = df[(df["time"] >= "2025-10-01") & df["latitude"].between(30, 40)
+                  & df["longitude"].between(135, 145) & (df["magnitude"] >= 4.0)]
+        self.assertEqual(list(got.columns), ["time", "latitude", "magnitude"])
+        self.assertEqual(sorted(got["time"]), sorted(want["time"]))
+
+        # two overlapping USGS windows: one row per key in the store, as in the database
+        raw = pd.read_csv(os.path.join("src", "df", "JAPAN_USGS_cleaned.csv"))
+        with tempfile.TemporaryDirectory() as d:
+            files = [Path(d) / "JAPAN_USGS_early.csv", Path(d) / "JAPAN_USGS_late.csv"]
+            raw.iloc[:30].to_csv(files[0], index=False)
+            raw.iloc[20:].to_csv(files[1], index=False)
+            engine = get_engine(f"sqlite:///{d}/eq.db")
+            ensure_table(engine)
+            load_files(engine, files, "earthquakes", store=Path(d) / "store")
+            with engine.connect() as conn:
+                stored = conn.execute(text("SELECT COUNT(*) FROM earthquakes")).scalar()
+            engine.dispose()
+            events = read_events(Path(d) / "store")
+            magnitudes = read_events(Path(d) / "store", columns=["magnitude"])
+        self.assertEqual(stored, len(raw))
+        self.assertEqual((len(events), len(magnitudes)), (stored, stored))
+        self.assertEqual(list(magnitudes.columns), ["magnitude"])
+
+    def test_store_gets_files_the_manifest_already_skips(self):
+        with tempfile.TemporaryDirectory() as d:
+            files = sorted(Path("src", "df").glob("*.csv"))
+            store = Path(d) / "store"
+
+            def run(*extra):
+                argv = ["main.py", *map(str, [*files, "--export-path", Path(d) / "export.csv", *extra])]
+                with mock.patch.dict(os.environ, {"EARTHQUAKE_DB_URL": f"sqlite:///{d}/eq.db"}), \
+                        mock.patch.object(sys, "argv", argv):
+                    main.main()
+
+            run()                       # the database has every file, the manifest records them
+            run("--store", store)       # nothing to load, but the store is still written
+            self.assertEqual(len(read_events(store)), sum(len(build_df(f)) for f in files))
+            kept = {p: p.stat().st_mtime_ns for p in store.rglob("*.parquet") if not p.name.startswith(file_tag(files[0]))}
+            event_store.remove_file(store, file_tag(files[0]))
+            run("--store", store)       # a file missing from the store is rewritten, the rest left alone
+            self.assertEqual(len(read_events(store)), sum(len(build_df(f)) for f in files))
+            self.assertEqual({p: p.stat().st_mtime_ns for p in kept}, kept)
+
+    def test_vectorized_cleaning_matches_notebook_japan(self):
+        df = pd.read_csv("japan_messy_earthquakes.csv")
+        pd.testing.assert_series_equal(cleaning.parse_magnitude(df["mag"]),
+                                       df["mag"].apply(_floater).astype(float))
+        pd.testing.assert_series_equal(cleaning.clean_depth(df["depth"]),
+                                       df["depth"].apply(_clean_depth).astype(float))
+
+        df["mag"] = cleaning.parse_magnitude(df["mag"])
+        df["depth"] = cleaning.clean_depth(df["depth"])
+        pd.testing.assert_series_equal(cleaning.count_invalid(df), df.apply(_invalid_count, axis=1))
+        pd.testing.assert_series_equal(cleaning.categorize_mag(df["mag"]), df["mag"].apply(_categorize_mag),
+                                       check_names=False)
+        pd.testing.assert_series_equal(cleaning.clean_region(df["place"]), df["place"].apply(_clean_region))
+
+    def test_vectorized_cleaning_matches_notebook_emsc(self):
+        df = pd.read_csv("JAPAN_EMSC.csv")
+        spotted = df["region"].apply(lambda v: v if "JAPAN" in v else "outside Japan")
+        pd.testing.assert_series_equal(cleaning.spot_location(df["region"]), spotted)
+        pd.testing.assert_series_equal(cleaning.classify_mag(df["magnitude_value"]),
+                                       df["magnitude_value"].apply(_classify_mag), check_names=False)
+        pd.testing.assert_series_equal(cleaning.region_from_place(df["region"]),
+                                       df["region"].apply(lambda x: x.split(",")[0]))
+
+    def test_timeparse_detects_and_caches_source_formats(self):
+        timeparse.clear_cache()
+        usgs = pd.read_csv("JAPAN_USGS.csv")["time"]
+        emsc = pd.read_csv("JAPAN_EMSC.csv")["date_time_UTC"]
+        self.assertEqual(timeparse.detect_format(usgs), "%Y-%m-%dT%H:%M:%S.%f%z")
+        self.assertEqual(timeparse.detect_format(emsc), "%Y-%m-%d %H:%M:%S")
+
+        parsed = timeparse.parse_times(usgs, key="USGS")
+        expected = pd.to_datetime(usgs, utc=True).dt.tz_convert(None)
+        pd.testing.assert_series_equal(parsed, expected)
+        self.assertEqual(timeparse._format_cache["USGS"], "%Y-%m-%dT%H:%M:%S.%f%z")
+
+        # rows that miss the detected format go through the fallback only
+        mixed = pd.Series(["2025-10-17 20:28:15"] * 20 + ["Sep 17, 2025, 14:10:05", None])
+        out = timeparse.parse_times(mixed, key="mixed")
+        self.assertEqual(out.iloc[20], pd.Timestamp("2025-09-17 14:10:05"))
+        self.assertTrue(pd.isna(out.iloc[21]))
+
+    def test_grid_index_matches_brute_force(self):
+        rng = np.random.default_rng(42)
+        lat = np.concatenate([rng.uniform(24, 46, 5000), rng.uniform(-89, 89, 200)])
+        lon = np.concatenate([rng.uniform(123, 146, 5000), rng.uniform(-180, 180, 200)])
+        idx = GridIndex(lat, lon, cell_deg=0.5)
+        for q_lat, q_lon, radius in [(35.6895, 139.6917, 150), (26.2, 127.7, 40), (0.0, 179.9, 900), (88.0, 10.0, 500)]:
+            brute = haversine_km(q_lat, q_lon, lat, lon)
+            rows, dist = idx.query_radius(q_lat, q_lon, radius)
+            self.assertEqual(set(rows), set(np.nonzero(brute <= radius)[0]))
+            np.testing.assert_allclose(dist, brute[rows])
+
+            rows, dist = idx.query_knn(q_lat, q_lon, k=8)
+            np.testing.assert_allclose(dist, np.sort(brute)[:8])
+
+    def test_sites_chunked_distances_match_dense(self):
+        rng = np.random.default_rng(7)
+        events = pd.DataFrame({"latitude": rng.uniform(24, 46, 3000), "longitude": rng.uniform(123, 146, 3000)})
+        site_df = pd.DataFrame({"name": [f"s{i}" for i in range(40)],
+                                "latitude": rng.uniform(24, 46, 40), "longitude": rng.uniform(123, 146, 40)})
+        dense = haversine_km(events["latitude"].to_numpy()[:, None], events["longitude"].to_numpy()[:, None],
+                             site_df["latitude"].to_numpy()[None, :], site_df["longitude"].to_numpy()[None, :])
+
+        # a tiny budget forces many chunks
+        near = sites.nearest_site(events, site_df, budget_mb=0.01)
+        self.assertEqual(list(near["nearest_site"]), list(site_df["name"].to_numpy()[dense.argmin(axis=1)]))
+        np.testing.assert_allclose(near["nearest_site_km"], np.round(dense.min(axis=1), 2))
+
+        pairs = sites.sites_within(events, site_df, max_km=100, budget_mb=0.01)
+        i, j = np.nonzero(dense <= 100)
+        self.assertEqual(set(zip(pairs["event"], pairs["site"])), set(zip(i, site_df["name"].to_numpy()[j])))
+
+        near32 = sites.nearest_site(events, site_df, dtype="float32")
+        np.testing.assert_allclose(near32["nearest_site_km"], near["nearest_site_km"], atol=0.5)
+
+        tokyo = pd.DataFrame({"name": ["Tokyo"], "latitude": [35.6895], "longitude": [139.6917]})
+        np.testing.assert_allclose(sites.distance_to_sites(events, tokyo)["Tokyo"],
+                                   calculate_distance_to_tokyo(events.copy())["dist_to_tokyo_km"])
+
+    def test_matching_links_sources_within_tolerances(self):
+        rng = np.random.default_rng(3)
+        n = 500
+        base = pd.DataFrame({"time": pd.Timestamp("2025-09-15") + pd.to_timedelta(np.sort(rng.uniform(0, 2.6e6, n)), unit="s"),
+                             "latitude": rng.uniform(24, 46, n), "longitude": rng.uniform(123, 146, n),
+                             "depth": rng.uniform(0, 600, n), "magnitude": rng.uniform(3, 7, n), "truth": np.arange(n)})
+        parts = []
+        for src, frac in [("USGS", 1.0), ("EMSC", 0.7), ("GEOFON", 0.4)]:
+            d = base.sample(frac=frac, random_state=len(src)).assign(source=src)
+            d["time"] += pd.to_timedelta(rng.uniform(-2, 2, len(d)), unit="s")
+            d["latitude"] += rng.uniform(-0.05, 0.05, len(d))
+            parts.append(d)
+        df = pd.concat(parts, ignore_index=True)
+
+        linked = matching.match_events(df, time_tol_s=10, dist_km=30)
+        self.assertEqual(linked["event_id"].nunique(), n)
+        self.assertTrue((linked.groupby("event_id")["truth"].nunique() == 1).all())
+        self.assertTrue((linked.groupby("event_id")["source"].agg(lambda s: s.is_unique)).all())
+        cov = matching.coverage(linked).set_index("source")
+        self.assertEqual(cov.loc["USGS", "coverage"], 1.0)
+        res = matching.residuals(linked)
+        self.assertEqual(len(res), int(cov.loc["EMSC", "events"] + cov.loc["GEOFON", "events"]))
+        self.assertTrue((res["dt_s"].abs() <= 4).all())
+
+        # a chain USGS t=0 ~ EMSC t=28 ~ GEOFON t=57 (limit 30 s): GEOFON may not join USGS through EMSC
+        t0 = pd.Timestamp("2025-10-01")
+        chain = pd.DataFrame({"source": ["USGS", "EMSC", "GEOFON"],
+                              "time": [t0, t0 + pd.Timedelta(seconds=28), t0 + pd.Timedelta(seconds=57)],
+                              "latitude": 35.0, "longitude": 140.0, "depth": 10.0, "magnitude": 5.0})
+        ids = matching.match_events(chain, time_tol_s=30, dist_km=100)["event_id"].tolist()
+        self.assertEqual(ids[0], ids[1])
+        self.assertNotEqual(ids[2], ids[0])
+        self.assertTrue((matching.residuals(matching.match_events(chain, 30, 100))["dt_s"].abs() <= 30).all())
+
+        # sweep candidates equal the brute-force pair set
+        d = df.sort_values("time", kind="stable").head(300)
+        t = d["time"].astype("int64").to_numpy() / 1e9
+        lat, lon = d["latitude"].to_numpy(), d["longitude"].to_numpy()
+        src = pd.factorize(d["source"])[0]
+        i, j, _, _ = matching.candidate_pairs(t, lat, lon, src, time_tol_s=3600, dist_km=500)
+        bi, bj = np.triu_indices(len(d), k=1)
+        ok = (np.abs(t[bj] - t[bi]) <= 3600) & (src[bi] != src[bj]) & (haversine_km(lat[bi], lon[bi], lat[bj], lon[bj]) <= 500)
+        self.assertEqual(set(zip(i, j)), set(zip(bi[ok], bj[ok])))
+
+    def test_fdsn_fetcher_tiles_windows_under_the_cap(self):
+        base = pd.read_csv("JAPAN_USGS.csv")
+        rng = np.random.default_rng(5)
+        cat = base.sample(900, replace=True, random_state=5).reset_index(drop=True)
+        t = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(np.sort(rng.uniform(0, 86400 * 90, len(cat))), unit="s")
+        cat["time"] = t.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+        cat["id"] = [f"us{i:06d}" for i in range(len(cat))]
+        cat["_t"] = t.tz_convert(None)
+        _FakeFDSN.catalog, _FakeFDSN.cap, _FakeFDSN.fail_first = cat, 100, {"count", "query"}
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeFDSN)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/fdsnws/event/1/"
+        try:
+            session = fdsn.make_session(pool=4, backoff=0)
+            windows = fdsn.plan_windows(session, url, "2025-01-01", "2025-04-01", {}, max_events=100)
+            self.assertGreater(len(windows), 1)
+            self.assertTrue(all(n <= 75 for _, _, n in windows))
+            with tempfile.TemporaryDirectory() as tmp:
+                out = os.path.join(tmp, "usgs.csv")
+                n = fdsn.fetch_catalog("2025-01-01", "2025-04-01", out, params={}, base_url=url,
+                                       workers=4, max_events=100, session=session)
+                got = pd.read_csv(out)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(n, len(cat))
+        self.assertTrue(got["id"].is_unique)
+        self.assertEqual(list(got.columns), list(base.columns))
+        expected = cat.sort_values("_t", ascending=False).drop(columns="_t").reset_index(drop=True)
+        self.assertEqual(list(got["id"]), list(expected["id"]))
+
+    def test_fdsn_fetcher_pages_a_swarm_denser_than_the_cap(self):
+        base = pd.read_csv("JAPAN_USGS.csv")
+        cat = base.sample(260, replace=True, random_state=2).reset_index(drop=True)
+        t = pd.Timestamp("2025-01-01 06:00", tz="UTC") + pd.to_timedelta(np.arange(len(cat)), unit="s")
+        cat["time"] = t.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+        cat["id"] = [f"us{i:06d}" for i in range(len(cat))]
+        cat["_t"] = t.tz_convert(None)
+        later = cat.iloc[:40].assign(_t=cat["_t"].iloc[:40] + pd.Timedelta(days=1),
+                                     id=[f"us9{i:05d}" for i in range(40)])  # a quiet window after the swarm
+        cat = pd.concat([cat, later], ignore_index=True)
+        _FakeFDSN.catalog, _FakeFDSN.cap, _FakeFDSN.fail_first = cat, 100, set()
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeFDSN)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/fdsnws/event/1/"
+        try:
+            session = fdsn.make_session(pool=4, backoff=0)
+            windows = fdsn.plan_windows(session, url, "2025-01-01", "2025-01-03", {}, max_events=100)
+            self.assertEqual(max(n for _, _, n in windows), 260)  # 260 events within 5 minutes: not splittable
+            with tempfile.TemporaryDirectory() as tmp:
+                out = os.path.join(tmp, "usgs.csv")
+                n = fdsn.fetch_catalog("2025-01-01", "2025-01-03", out, params={}, base_url=url,
+                                       workers=4, max_events=100, session=session)
+                got = pd.read_csv(out)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(n, len(cat))
+        expected = cat.sort_values("_t", ascending=False)["id"].tolist()
+        self.assertEqual(got["id"].tolist(), expected)
+        self.assertEqual(len(fdsn.page_params({}, 260, 75)), 4)
+        self.assertEqual(fdsn.page_params({"a": 1}, 75, 75), [{"a": 1}])
+
+    def test_live_follow_ingests_new_and_updated_events_past_the_watermark(self):
+        base = pd.read_csv("JAPAN_USGS.csv").head(30).reset_index(drop=True)
+        t = pd.Timestamp("2025-10-01") + pd.to_timedelta(np.arange(len(base)) * 3600, unit="s")
+        base["time"] = t.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        base["updated"] = (t + pd.Timedelta(minutes=20)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        base["_t"] = t
+        _FakeFDSN.catalog, _FakeFDSN.cap, _FakeFDSN.fail_first = base, 1000, set()
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeFDSN)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/fdsnws/event/1/"
+        session = fdsn.make_session(pool=2, backoff=0)
+        poll = dict(fetch=follow.usgs_fetcher(url, {}, session), since="2025-09-30", batch_rows=7)
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                engine = get_engine(f"sqlite:///{d}/eq.db")
+                ensure_table(engine)
+                sleeps = []
+                first = live.follow(engine, interval=5, max_polls=2, sleep=sleeps.append, **poll)
+                self.assertEqual(len(sleeps), 1)
+                with engine.connect() as conn:
+                    stored = pd.read_sql("SELECT * FROM earthquakes ORDER BY `time`", conn)
+                    watermark = live.load_watermark(conn)
+                self.assertEqual(len(stored), len(base))
+                self.assertEqual(watermark, pd.Timestamp(base["updated"].iloc[-1]).tz_convert(None))
+                self.assertEqual(first["inserted"], 0)  # second poll: only the overlap, unchanged
+                row = stored.iloc[0]
+                self.assertEqual((row["source"], row["region"], row["category"], row["month"]),
+                                 ("USGS", "Izu Islands", "Moderate", "October"))
+                self.assertAlmostEqual(row["dist_to_Tokyo"], 657.34, places=2)
+
+                # a revised magnitude and two new events, all published after the watermark
+                later = (watermark + pd.Timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                revised = base.iloc[[3]].assign(mag=7.1, updated=later)
+                new = base.iloc[[5, 6]].assign(_t=base["_t"].iloc[-1] + pd.Timedelta(hours=1), updated=later,
+                                               time=(base["_t"].iloc[-1] + pd.Timedelta(hours=1)).strftime(
+                                                   "%Y-%m-%dT%H:%M:%S.000Z"), latitude=[33.1, 33.2],
+                                               id=["us_new_1", "us_new_2"])
+                _FakeFDSN.catalog = pd.concat([base.drop(index=3), revised, new], ignore_index=True)
+                stats = live.poll_once(engine, **poll)
+                with engine.connect() as conn:
+                    self.assertEqual(conn.execute(text("SELECT COUNT(*) FROM earthquakes")).scalar(), len(base) + 2)
+                    strong = conn.execute(text("SELECT magnitude, category FROM earthquakes WHERE magnitude > 7")).all()
+
+                # a revision that moves the hypocentre and the origin time replaces the stored row
+                latest = (pd.Timestamp(later) + pd.Timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                moved_t = base["_t"].iloc[8] + pd.Timedelta(seconds=40)
+                moved = base.iloc[[8]].assign(latitude=base["latitude"].iloc[8] + 0.25, _t=moved_t, updated=latest,
+                                              time=moved_t.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+                _FakeFDSN.catalog = pd.concat([_FakeFDSN.catalog[_FakeFDSN.catalog["id"] != base["id"].iloc[8]], moved],
+                                              ignore_index=True)
+                relocated = live.poll_once(engine, **poll)
+                with engine.connect() as conn:
+                    count = conn.execute(text("SELECT COUNT(*) FROM earthquakes")).scalar()
+                    rolled = conn.execute(text("SELECT SUM(quakes) FROM rollup_daily_source")).scalar()
+                    at = conn.execute(text("SELECT `time`, latitude FROM earthquakes WHERE magnitude = :m "
+                                           "AND ABS(longitude - :lon) < 1e-9"),
+                                      {"m": float(base["mag"].iloc[8]), "lon": float(base["longitude"].iloc[8])}).all()
+                engine.dispose()
+        finally:
+            server.shutdown()
+            server.server_close()
+        # the last original event is within OVERLAP of the watermark, so it is re-read (and skipped)
+        self.assertEqual((stats["fetched"], stats["inserted"], stats["updated"], stats["skipped"]), (4, 2, 1, 1))
+        self.assertEqual(stats["watermark"], later.rstrip("Z"))
+        self.assertEqual(strong, [(7.1, "Strong")])
+        self.assertEqual((relocated["moved"], relocated["inserted"]), (1, 1))
+        self.assertEqual((count, rolled), (len(base) + 2, len(base) + 2))
+        self.assertEqual([(pd.Timestamp(t), lat) for t, lat in at],
+                         [(moved_t, base["latitude"].iloc[8] + 0.25)])
+
+    def test_http_cache_keys_revalidation_and_lru(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ETagServer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/list"
+        _ETagServer.hits = []
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                cache = http_cache.HTTPCache(tmp, max_bytes=2500, session=fdsn.make_session(backoff=0))
+                first = cache.get(url, params={"b": 1, "a": 2})
+                again = cache.get(url, params={"A": "2", "b": " 1"})  # same query, differently spelled
+                self.assertFalse(first.from_cache)
+                self.assertTrue(again.from_cache)
+                self.assertEqual(again.text, first.text)
+                self.assertEqual(len(_ETagServer.hits), 1)
+
+                stale = cache.get(url, params={"a": 2, "b": 1}, ttl=0)  # expired: conditional request -> 304
+                self.assertTrue(stale.from_cache)
+                self.assertEqual(stale.text, first.text)
+                self.assertIsNotNone(_ETagServer.hits[-1][1])
+
+                out = os.path.join(tmp, "body.txt")
+                cache.fetch_to_file(url, {"a": 2, "b": 1}, out)
+                self.assertEqual(Path(out).read_text(encoding="utf-8"), first.text)
+
+                # each body is 800 bytes: a fourth entry evicts the least recently used one
+                for q in ({"x": 1}, {"x": 2}):
+                    cache.get(url, params=q)
+                cache.get(url, params={"a": 2, "b": 1})
+                cache.get(url, params={"x": 3})
+                n_hits = len(_ETagServer.hits)
+                cache.get(url, params={"a": 2, "b": 1})
+                self.assertEqual(len(_ETagServer.hits), n_hits)      # recently used: kept
+                cache.get(url, params={"x": 1})
+                self.assertEqual(len(_ETagServer.hits), n_hits + 1)  # least recently used: evicted
+                cache._db.close()
+
+            # room for one body: storing it never evicts itself; bodies over max_bytes are served, not kept
+            for max_bytes, kept in ((1000, True), (500, False)):
+                with tempfile.TemporaryDirectory() as tmp:
+                    cache = http_cache.HTTPCache(tmp, max_bytes=max_bytes, session=fdsn.make_session(backoff=0))
+                    for q in ({"y": 1}, {"y": 2}):
+                        self.assertEqual(len(cache.get(url, params=q).content), 800)
+                        out = Path(tmp) / "out.txt"
+                        cache.fetch_to_file(url, q, out)
+                        self.assertEqual(out.stat().st_size, 800)
+                        self.assertEqual(cache.get(url, params=q).from_cache, kept)
+                    self.assertEqual(len(list(Path(tmp).glob("*.tmp"))), 0)
+
+                    # a body evicted by another thread between lookup and read: fall back to the network
+                    fetch = cache._fetch
+                    def evicting(*args):
+                        got = fetch(*args)
+                        cache.clear()
+                        return got
+                    cache._fetch = evicting
+                    self.assertEqual(len(cache.get(url, params={"y": 2}).content), 800)
+                    cache.fetch_to_file(url, {"y": 2}, out)
+                    self.assertEqual(out.stat().st_size, 800)
+                    cache._db.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(http_cache.ttl_for("https://earthquake.usgs.gov/fdsnws/event/1/query",
+                                            {"endtime": "2025-01-01"}), http_cache.CLOSED_TTL)
+        self.assertEqual(http_cache.ttl_for("https://geofon.gfz.de/eqinfo/list.php",
+                                            {"datemax": pd.Timestamp.now().strftime("%Y-%m-%d")}),
+                         http_cache.TTLS["geofon.gfz.de"])
+
+    def test_geofon_streaming_parser_matches_beautifulsoup(self):
+        df = pd.read_csv("JAPAN_GEOFON.csv")
+        for quirks in (False, True):
+            html = _geofon_html(df, quirks)
+            total, expected = _geofon_rows_bs4(html)
+            has_list, n_rows, records, _ = GEOFON_webscraping.parse_event_list(html)
+            self.assertTrue(has_list)
+            self.assertEqual(n_rows, total)
+            self.assertEqual(records, expected)
+        clean = pd.DataFrame(GEOFON_webscraping.parse_event_list(_geofon_html(df))[2])
+        pd.testing.assert_frame_equal(clean, df.astype({"Depth_km": str}))
+
+    def test_geofon_windows_stay_under_nmax(self):
+        base = pd.read_csv("JAPAN_GEOFON.csv")
+        rng = np.random.default_rng(11)
+        cat = base.sample(300, replace=True, random_state=11).reset_index(drop=True)
+        t = pd.Timestamp("2025-01-01") + pd.to_timedelta(np.sort(rng.uniform(0, 86400 * 80, len(cat)))[::-1], unit="s")
+        cat["DateTime_UTC"] = t.strftime("%Y-%m-%d %H:%M:%S")
+        cat["Event_ID"] = [f"gfz{i:05d}" for i in range(len(cat))]
+        _FakeGeofon.catalog = cat
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGeofon)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            has_list, total, got = GEOFON_webscraping.fetch_events(
+                "2025-01-01", "2025-03-31", nmax=20, workers=4,
+                base_url=f"http://127.0.0.1:{server.server_address[1]}/eqinfo/list.php",
+                cache=http_cache.NoCache(fdsn.make_session(backoff=0)))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertTrue(has_list)
+        self.assertEqual(total, len(cat))
+        self.assertEqual(list(got["Event_ID"]), list(cat["Event_ID"]))
+        self.assertEqual(list(got.columns), list(base.columns))
+
+    def test_emsc_http_client_matches_website_columns(self):
+        web = pd.read_csv("JAPAN_EMSC.csv", dtype=str)
+        t = pd.to_datetime(web["date_time_UTC"]) + pd.to_timedelta(np.arange(len(web)) % 10 / 10, unit="s")
+        _FakeEMSC.catalog = pd.DataFrame({
+            "EventID": [f"20250915_{i:07d}" for i in range(len(web))],
+            "Time": t.dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-5] + "Z",
+            "Latitude": web["latitude_deg"].astype(float), "Longitude": web["longitude_deg"].astype(float),
+            "Depth/km": web["depth_km"].astype(float), "Author": "EMSC", "Catalog": "EMSC-RTS",
+            "Contributor": "EMSC", "ContributorID": "1", "MagType": web["magnitude_type"].str.lower(),
+            "Magnitude": web["magnitude_value"].astype(float), "MagAuthor": "EMSC",
+            "EventLocationName": web["region"], "EventType": "ke", "_t": t})
+        _FakeEMSC.queries = []
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeEMSC)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            fetched, got = EMSC_webscraping.fetch_emsc_events(
+                "2025-09-15", "2025-10-19", workers=3, page_size=25,
+                url=f"http://127.0.0.1:{server.server_address[1]}/fdsnws/event/1/query",
+                cache=http_cache.NoCache(fdsn.make_session(backoff=0)))
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(fetched, len(web))
+        self.assertEqual(len(_FakeEMSC.queries), 6)  # 138 rows / 25 per page, three pages at a time
+        pd.testing.assert_frame_equal(got, web)
+
 
 if __name__ == '__main__':
     unittest.main()
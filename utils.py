@@ -1,24 +1,22 @@
+import tempfile
+from pathlib import Path
 import numpy as np
 import pandas as pd
-import requests
-from io import StringIO
-
-
-def api_code():
-    url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
-    params = {
-        "format": "csv",
-        "starttime": "2025-9-15",
-        "endtime": "2025-10-20",
-        "minlatitude": 24,
-        "maxlatitude": 46,
-        "minlongitude": 123,
-        "maxlongitude": 146,
-        "minmagnitude": 0
-    }
-    response = requests.get(url, params=params)
-    df_direct = pd.read_csv(StringIO(response.text))
-    direct_count = len(df_direct) - 1
+from API_saving import START, END, PARAMS
+from fdsn import USGS_URL, fetch_window, get_session
+from http_cache import default_cache
+from stream_stats import Moments
+
+
+def api_code(base_url=USGS_URL, cache=None):
+    # the same search as API_saving.api_saving in one untiled query: a catalog that fits one
+    # window is the very request api_saving sent, so the HTTP cache answers it
+    cache = cache or default_cache()
+    with tempfile.TemporaryDirectory() as d:
+        path = fetch_window(get_session(), base_url, pd.Timestamp(START), pd.Timestamp(END), PARAMS,
+                            Path(d) / "direct.csv", cache)
+        df_direct = pd.read_csv(path) if path.stat().st_size else pd.DataFrame()
+    direct_count = len(df_direct)
     return direct_count
 
 
@@ -27,11 +25,12 @@ def clean_data(df):
 
 
 def compute_statistics(df, column):
+    m = Moments().update(df[column])
     return {
-        "mean": df[column].mean(),
-        "std": df[column].std(),
-        "min": df[column].min(),
-        "max": df[column].max()
+        "mean": m.mean if m.count else np.nan,
+        "std": m.std(),
+        "min": m.min if m.count else np.nan,
+        "max": m.max if m.count else np.nan
     }
 
 
@@ -42,29 +41,36 @@ def validate_data_integrity(df):
     return True
 
 
-def calculate_distance_to_tokyo(df):
-    tokyo_lat, tokyo_lon = 35.6895, 139.6917
-    lat1 = np.radians(df["latitude"])
-    lon1 = np.radians(df["longitude"])
-    lat2 = np.radians(tokyo_lat)
-    lon2 = np.radians(tokyo_lon)
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments in degrees, any broadcastable shapes."""
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
 
     dlat = lat2 - lat1
     dlon = lon2 - lon1
 
     a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
     c = 2 * np.arcsin(np.sqrt(a))
+    return EARTH_RADIUS_KM * c
+
 
-    df["dist_to_tokyo_km"] = round(6371 * c, 2)
+def calculate_distance_to_tokyo(df):
+    tokyo_lat, tokyo_lon = 35.6895, 139.6917
+    df["dist_to_tokyo_km"] = round(haversine_km(df["latitude"], df["longitude"], tokyo_lat, tokyo_lon), 2)
     return df
 
 
 def compute_numpy_statistics(df):
-    magnitudes = df["mag"].to_numpy()
-    distances = df["dist_to_tokyo_km"].to_numpy()
+    magnitudes = Moments().update(df["mag"].to_numpy())
+    distances = Moments().update(df["dist_to_tokyo_km"].to_numpy())
 
     return {
-        "mean_mag": np.mean(magnitudes),
-        "std_mag": np.std(magnitudes),
-        "mean_distance": np.mean(distances)
+        "mean_mag": magnitudes.mean if magnitudes.count else np.nan,
+        "std_mag": magnitudes.std(ddof=0),
+        "mean_distance": distances.mean if distances.count else np.nan
     }